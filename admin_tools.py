@@ -1,11 +1,17 @@
 import requests
 import os
+import time
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 load_dotenv()
 
 API_URL = os.getenv('FAST_API_URL', 'http://localhost:8000')
 ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+UPLOAD_EXTENSIONS = ('.pdf', '.docx', '.html')
+MANIFEST_NAME = '.upload_manifest.json'
 
 def list_documents():
     response = requests.get(f"{API_URL}/list-docs")
@@ -41,6 +47,55 @@ def delete_document(file_id: int):
         print(f"Error: {str(e)}")
         return None
 
+def delete_documents(file_ids):
+    """Delete several documents through the bulk admin endpoint."""
+    try:
+        response = requests.post(
+            f"{API_URL}/admin/delete-docs",
+            headers={'admin-token': ADMIN_TOKEN},
+            json={"file_ids": list(file_ids)},
+            timeout=120
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {str(e)}")
+        return None
+    if response.status_code == 200:
+        return response.json()
+    print(f"Error: Status code {response.status_code}")
+    print(f"Response: {response.text}")
+    return None
+
+def wait_for_job(job_id, poll_interval=2, timeout=3600, verbose=True):
+    """Poll an ingestion job until it completes or fails, printing progress."""
+    deadline = time.time() + timeout
+    last_progress = None
+    while time.time() < deadline:
+        try:
+            response = requests.get(f"{API_URL}/jobs/{job_id}", timeout=30)
+        except requests.exceptions.RequestException as e:
+            print(f"Error polling job {job_id}: {str(e)}")
+            time.sleep(poll_interval)
+            continue
+        if response.status_code != 200:
+            print(f"Error polling job {job_id}: {response.status_code} - {response.text}")
+            return None
+        job = response.json()
+        current = (job['state'], job['chunks_processed'], job['chunks_total'])
+        if verbose and current != last_progress:
+            print(f"Job {job_id}: {job['state']}, {job['chunks_processed']}/{job['chunks_total'] or '?'} chunks")
+            last_progress = current
+        if job['state'] == 'completed':
+            if verbose:
+                print(f"Indexing finished: {job['result']}")
+            return job
+        if job['state'] == 'failed':
+            if verbose:
+                print(f"Indexing failed: {job['error']}")
+            return job
+        time.sleep(poll_interval)
+    print(f"Gave up waiting for job {job_id}; check GET /jobs/{job_id} later.")
+    return None
+
 def upload_default_document():
     default_doc_path = 'default_docs/OpenStaxHSPhysics.pdf'
     
@@ -64,16 +119,21 @@ def upload_default_document():
                 )
             }
             
+            # The API only stores the file and queues indexing, so this covers the transfer alone
             response = session.post(
                 f"{API_URL}/upload-doc",
                 files=files,
-                timeout=300,  # 5 minutes
+                timeout=120,
                 stream=True
             )
             
             if response.status_code == 200:
                 print("Default document uploaded successfully!")
-                print(response.json())
+                result = response.json()
+                print(result)
+                if result.get('job_id'):
+                    job = wait_for_job(result['job_id'])
+                    return bool(job and job['state'] == 'completed')
                 return True
             else:
                 print(f"Error uploading document: {response.status_code}")
@@ -107,13 +167,216 @@ def upload_custom_document(file_path: str):
             
         if response.status_code == 200:
             print("Document uploaded successfully!")
-            print(response.json())
+            result = response.json()
+            print(result)
+            if result.get('job_id'):
+                wait_for_job(result['job_id'])
         else:
             print(f"Error uploading document: {response.status_code}")
             print(response.text)
     except Exception as e:
         print(f"Error: {str(e)}")
 
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_manifest(manifest_path, manifest):
+    # Write then rename so an interrupted run never leaves a truncated manifest
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def upload_and_wait(path, entry):
+    """Upload one file (or re-attach to its queued job) and wait for indexing.
+    Returns the updated manifest entry."""
+    if entry.get('state') in ('queued', 'running') and entry.get('job_id'):
+        # Interrupted while the API was indexing: the job survives restarts, so just wait for it
+        job = wait_for_job(entry['job_id'], verbose=False)
+        if job:
+            return dict(entry, state=job['state'], error=job['error'])
+
+    # A file that changed since it was indexed replaces its old version in place
+    url = f"{API_URL}/upload-doc"
+    if entry.get('state') == 'changed' and entry.get('file_id'):
+        url = f"{API_URL}/replace-doc?file_id={entry['file_id']}"
+    try:
+        with open(path, 'rb') as f:
+            response = requests.post(url, files={"file": (os.path.basename(path), f)}, timeout=300)
+        if response.status_code == 404 and url != f"{API_URL}/upload-doc":
+            # The old version was deleted from the API in the meantime
+            with open(path, 'rb') as f:
+                response = requests.post(f"{API_URL}/upload-doc",
+                                         files={"file": (os.path.basename(path), f)}, timeout=300)
+    except requests.exceptions.RequestException as e:
+        return dict(entry, state='failed', error=str(e))
+    if response.status_code != 200:
+        return dict(entry, state='failed', error=f"{response.status_code} - {response.text}")
+
+    result = response.json()
+    entry = dict(entry, file_id=result['file_id'], job_id=result.get('job_id'), error=None)
+    if result.get('status') == 'unchanged':
+        # A replace that matched the indexed version: the file_id is still this file's own
+        return dict(entry, state='completed')
+    if result.get('duplicate'):
+        return dict(entry, state='duplicate')
+    job = wait_for_job(result['job_id'], verbose=False)
+    if job is None:
+        return dict(entry, state='queued')
+    return dict(entry, state=job['state'], error=job['error'])
+
+def upload_directory(directory: str, workers: int = 4, manifest_path: str = None):
+    """Upload every supported document under ``directory`` with ``workers`` uploads
+    in flight. Progress is kept in a JSON manifest (by default inside the directory)
+    keyed by relative path, so re-running after a partial failure only uploads files
+    that are new, changed or not yet indexed. Changed files that were indexed
+    by their own upload go through /replace-doc, which keeps their file_id and
+    only re-embeds the chunks that differ; a file that was a duplicate of
+    another document is uploaded anew once it changes."""
+    if not os.path.isdir(directory):
+        print(f"Error: Directory not found at {directory}")
+        return None
+    manifest_path = manifest_path or os.path.join(directory, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    pending = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(UPLOAD_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            rel_path = os.path.relpath(path, directory)
+            sha256 = file_sha256(path)
+            entry = manifest.get(rel_path, {})
+            if entry.get('sha256') == sha256 and entry.get('state') in ('completed', 'duplicate'):
+                continue
+            if entry.get('sha256') != sha256:
+                # Only a file indexed by its own upload owns its file_id; a 'duplicate' entry points
+                # at another document, so a new version of it is uploaded as a document of its own
+                changed = entry.get('state') in ('completed', 'changed') and entry.get('file_id')
+                entry = {'sha256': sha256, 'file_id': entry.get('file_id'), 'state': 'changed'} if changed \
+                    else {'sha256': sha256}
+            pending[rel_path] = entry
+
+    done = len([p for p in manifest if p not in pending])
+    print(f"{len(pending)} files to upload, {done} already indexed (manifest: {manifest_path})")
+    if not pending:
+        return manifest
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(upload_and_wait, os.path.join(directory, rel_path), entry): rel_path
+            for rel_path, entry in pending.items()
+        }
+        for count, future in enumerate(as_completed(futures), 1):
+            rel_path = futures[future]
+            entry = future.result()
+            print(f"[{count}/{len(futures)}] {rel_path}: {entry['state']}"
+                  + (f" ({entry['error']})" if entry.get('error') else ""))
+            # Results arrive on this thread only, so the manifest needs no lock
+            manifest[rel_path] = entry
+            save_manifest(manifest_path, manifest)
+
+    states = {}
+    for rel_path in pending:
+        states[manifest[rel_path]['state']] = states.get(manifest[rel_path]['state'], 0) + 1
+    print(f"Finished in {time.time() - start:.1f}s: "
+          + ", ".join(f"{n} {state}" for state, n in sorted(states.items())))
+    if states.get('failed') or states.get('queued'):
+        print("Run the upload again to retry the remaining files.")
+    return manifest
+
+def list_ingestion_profiles(order='recent', limit=20):
+    """Print per-document ingestion profiles; order is recent, slowest, lowest_throughput or largest."""
+    try:
+        response = requests.get(f"{API_URL}/ingestion-profiles",
+                                params={"order": order, "limit": limit}, timeout=30)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching ingestion profiles: {str(e)}")
+        return []
+    if response.status_code != 200:
+        print(f"Error fetching ingestion profiles: {response.status_code} - {response.text}")
+        return []
+    profiles = response.json()
+    if not profiles:
+        print("No ingestion profiles recorded yet.")
+        return []
+    print(f"{'ID':>5} {'File':<32} {'MB':>7} {'Pages':>6} {'Chunks':>7} {'Total s':>8} "
+          f"{'Chunks/s':>9} {'Parse s':>8} {'Split s':>8} {'Embed s':>8} {'Persist s':>9} "
+          f"{'Retries':>7} {'RSS MB':>7}")
+    for p in profiles:
+        stages = p['stage_seconds']
+        workers = p['worker_seconds']
+        print(f"{p['file_id']:>5} {p['filename'][:32]:<32} {p['bytes'] / (1024 * 1024):7.2f} "
+              f"{p['pages'] if p['pages'] is not None else '-':>6} {p['chunks']:>7} {p['total_seconds']:8.1f} "
+              f"{p['chunks_per_second'] or 0:9.1f} {workers.get('parse', 0):8.1f} {workers.get('split', 0):8.1f} "
+              f"{stages.get('embed', 0):8.1f} {stages.get('persist', 0):9.1f} {p['embed_retries']:>7} "
+              f"{max(p['peak_rss_mb'], p['peak_worker_rss_mb']):7.0f}")
+    return profiles
+
+def admin_request(method, path, **kwargs):
+    try:
+        response = requests.request(method, f"{API_URL}{path}", headers={'admin-token': ADMIN_TOKEN},
+                                    timeout=300, **kwargs)
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {str(e)}")
+        return None
+    if response.status_code != 200:
+        print(f"Error: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+def list_log_archives():
+    """Print the archived days of chat logs and the state of the log writer."""
+    result = admin_request("GET", "/admin/log-archives")
+    if result is None:
+        return None
+    writer = result['writer']
+    print(f"Log writer: {writer['written']} rows in {writer['batches']} batches "
+          f"({writer['avg_batch_rows']} per batch), {writer['queued']} queued, {writer['failed']} failed")
+    if not result['archives']:
+        print("No archived chat logs yet.")
+    for archive in result['archives']:
+        print(f"{archive['day']}  {archive['bytes'] / 1024:8.1f} KB")
+    return result['archives']
+
+def archive_logs(older_than_days):
+    result = admin_request("POST", "/admin/archive-logs", params={"older_than_days": older_than_days})
+    if result is not None:
+        print(f"Archived {result['archived']} rows older than {result['cutoff']} UTC "
+              f"into {len(result['days'])} daily files")
+    return result
+
+def query_archived_logs(start, end, session_id=None, limit=100):
+    params = {"start": start, "end": end, "limit": limit}
+    if session_id:
+        params["session_id"] = session_id
+    rows = admin_request("GET", "/admin/archived-logs", params=params)
+    for row in rows or []:
+        print(f"[{row['created_at']}] {row['session_id']} ({row['model']})")
+        print(f"  Q: {row['user_query']}")
+        print(f"  A: {row['gpt_response'][:200]}")
+    if rows == []:
+        print("No archived chat logs match.")
+    return rows
+
+def restore_logs(start, end):
+    result = admin_request("POST", "/admin/restore-logs", params={"start": start, "end": end})
+    if result is not None:
+        print(f"Restored {result['restored']} rows from {len(result['days'])} archived days")
+    return result
+
 if __name__ == "__main__":
     while True:
         print("\nAdmin Tools Menu:")
@@ -121,9 +384,12 @@ if __name__ == "__main__":
         print("2. Delete a document")
         print("3. Upload default document")
         print("4. Upload custom document")
-        print("5. Exit")
+        print("5. Show ingestion profiles")
+        print("6. Upload a directory")
+        print("7. Chat log archive")
+        print("8. Exit")
         
-        choice = input("\nEnter your choice (1-5): ")
+        choice = input("\nEnter your choice (1-8): ")
         
         if choice == "1":
             docs = list_documents()
@@ -133,18 +399,18 @@ if __name__ == "__main__":
         
         elif choice == "2":
             try:
-                file_id = int(input("Enter the document ID to delete: "))
-                confirm = input(f"Are you sure you want to delete document {file_id}? (y/n): ")
+                file_ids = [int(part) for part in input("Enter the document ID(s) to delete (comma separated): ").split(',')]
+                confirm = input(f"Are you sure you want to delete document(s) {', '.join(map(str, file_ids))}? (y/n): ")
                 if confirm.lower() == 'y':
-                    result = delete_document(file_id)
+                    result = delete_document(file_ids[0]) if len(file_ids) == 1 else delete_documents(file_ids)
                     if result:
                         print(result)
                     else:
-                        print("Failed to delete the document.")
+                        print("Failed to delete the document(s).")
                 else:
                     print("Deletion cancelled.")
             except ValueError:
-                print("Invalid document ID. Please enter a valid integer.")
+                print("Invalid document ID. Please enter valid integers.")
 
         elif choice == "3":
             confirm = input("Are you sure you want to upload the default document? (y/n): ")
@@ -162,6 +428,39 @@ if __name__ == "__main__":
                 print("Upload cancelled.")
         
         elif choice == "5":
+            order = input("Order by (recent/slowest/lowest_throughput/largest) [recent]: ").strip() or 'recent'
+            list_ingestion_profiles(order)
+
+        elif choice == "6":
+            directory = input("Enter the directory to upload: ").strip()
+            workers = input("Parallel uploads [4]: ").strip()
+            try:
+                workers = int(workers) if workers else 4
+            except ValueError:
+                print("Invalid number of parallel uploads.")
+                continue
+            upload_directory(directory, workers)
+
+        elif choice == "7":
+            list_log_archives()
+            action = input("Archive now, query, restore or back (a/q/r/b) [b]: ").strip().lower()
+            if action == "a":
+                days = input("Archive chat logs older than how many days? ").strip()
+                try:
+                    archive_logs(float(days))
+                except ValueError:
+                    print("Invalid number of days.")
+            elif action in ("q", "r"):
+                start = input("First day (YYYY-MM-DD): ").strip()
+                end = input(f"Last day (YYYY-MM-DD) [{start}]: ").strip() or start
+                if action == "q":
+                    query_archived_logs(start, end, input("Session ID (optional): ").strip() or None)
+                elif input(f"Move the chat logs of {start} to {end} back into the database? (y/n): ").lower() == 'y':
+                    restore_logs(start, end)
+                else:
+                    print("Restore cancelled.")
+
+        elif choice == "8":
             break
         
         else:
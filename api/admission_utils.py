@@ -0,0 +1,224 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from .pydantic_models import ModelName
+from .metrics_utils import (
+    ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTED, INGESTION_PAUSE_SECONDS
+)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Concurrent chain runs per model, with per-model overrides such as "gpt-4o=4,gpt-4o-mini=16"
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "16"))
+CHAT_MODEL_LIMITS = os.getenv("CHAT_MODEL_LIMITS", "")
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "32"))
+CHAT_MAX_WAIT_SECONDS = float(os.getenv("CHAT_MAX_WAIT_SECONDS", "10"))
+# Uploads being received and queued at once; indexing itself is capped by INDEX_WORKERS
+UPLOAD_MAX_CONCURRENT = int(os.getenv("UPLOAD_MAX_CONCURRENT", "4"))
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "8"))
+UPLOAD_MAX_WAIT_SECONDS = float(os.getenv("UPLOAD_MAX_WAIT_SECONDS", "30"))
+# Ingestion jobs queued or running before new uploads are turned away
+INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", "20"))
+# Longest a running ingestion job pauses between batches while chats are waiting
+INGESTION_MAX_PAUSE_SECONDS = float(os.getenv("INGESTION_MAX_PAUSE_SECONDS", "30"))
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing work the server cannot take on; main.py turns it
+    into a 429 (queue full) or 503 (waited too long, or yielding to chat) with Retry-After."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+class AdmissionGate:
+    """At most ``limit`` holders at once, up to ``max_queue`` more waiting in FIFO
+    order for at most ``max_wait`` seconds each.
+
+    Used from the event loop only. A released slot goes straight to the oldest
+    waiter. Retry-After is estimated from the average time a slot is held.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._hold_seconds = 1.0  # moving average, seeded with a guess
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self.wait_seconds = 0.0
+        ADMISSION_ACTIVE.labels(name).set(0)
+        ADMISSION_QUEUE_DEPTH.labels(name).set(0)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a request arriving now."""
+        return max(1, math.ceil(self._hold_seconds * (self.queued + 1) / self.limit))
+
+    def _reject(self, status_code, reason, detail):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise AdmissionRejected(status_code, self.retry_after(), detail)
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(self.queued)
+
+    async def acquire(self):
+        start = time.perf_counter()
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            if self.queued >= self.max_queue:
+                self._reject(429, "queue_full", f"{self.name} is at capacity and its queue is full")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(waiter, self.max_wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we gave up; pass it on when cancelled
+                    if isinstance(e, asyncio.CancelledError):
+                        self.release()
+                        raise
+                else:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    self._update_gauges()
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    self._reject(503, "timeout", f"{self.name} queue wait exceeded {self.max_wait:g}s")
+        waited = time.perf_counter() - start
+        self.admitted += 1
+        self.wait_seconds += waited
+        ADMISSION_WAIT_SECONDS.labels(self.name).observe(waited)
+        self._update_gauges()
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def releaser(self):
+        """Idempotent callable that gives back a slot taken with acquire() and records
+        how long it was held. Call it on the event loop."""
+        start = time.perf_counter()
+        released = False
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.perf_counter() - start)
+                self.release()
+        return release
+
+    @asynccontextmanager
+    async def admit(self):
+        await self.acquire()
+        release = self.releaser()
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'avg_wait_ms': round(self.wait_seconds * 1000 / self.admitted, 1) if self.admitted else 0.0,
+            'avg_hold_ms': round(self._hold_seconds * 1000, 1),
+            'retry_after_seconds': self.retry_after(),
+        }
+
+def parse_model_limits(spec: str):
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, limit = item.partition("=")
+        limits[ModelName(model.strip())] = int(limit)
+    return limits
+
+_model_limits = parse_model_limits(CHAT_MODEL_LIMITS)
+chat_gates = {
+    model: AdmissionGate(f"chat:{model.value}", _model_limits.get(model, CHAT_MAX_CONCURRENT),
+                         CHAT_MAX_QUEUE, CHAT_MAX_WAIT_SECONDS)
+    for model in ModelName
+}
+upload_gate = AdmissionGate("upload", UPLOAD_MAX_CONCURRENT, UPLOAD_MAX_QUEUE, UPLOAD_MAX_WAIT_SECONDS)
+
+def chats_waiting() -> int:
+    """Chat requests queued for a slot. Read from ingestion threads too; a stale
+    count only makes a pause start or end one batch late."""
+    return sum(gate.queued for gate in chat_gates.values())
+
+@asynccontextmanager
+async def admit_chat(model: ModelName):
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    async with chat_gates[ModelName(model)].admit():
+        yield
+
+async def acquire_chat_slot(model: ModelName):
+    """Take a chat slot for work that outlives the handler, such as a streamed
+    answer. Returns the callable that gives it back."""
+    if not ADMISSION_ENABLED:
+        return lambda: None
+    gate = chat_gates[ModelName(model)]
+    await gate.acquire()
+    return gate.releaser()
+
+@asynccontextmanager
+async def admit_upload(pending_jobs: int, new_jobs: int = 1):
+    """Admit an upload of ``new_jobs`` documents unless chats are waiting (chat goes
+    first) or they would push the ``pending_jobs`` ingestion backlog past its limit."""
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    if chats_waiting():
+        ADMISSION_REJECTED.labels(upload_gate.name, "chat_priority").inc()
+        retry_after = max(gate.retry_after() for gate in chat_gates.values() if gate.queued)
+        raise AdmissionRejected(503, retry_after, "Chat requests are waiting; uploads are paused until they are served")
+    if pending_jobs + new_jobs > INGESTION_MAX_PENDING:
+        ADMISSION_REJECTED.labels(upload_gate.name, "backlog").inc()
+        raise AdmissionRejected(429, 30, f"{pending_jobs} documents are already waiting to be indexed "
+                                         f"(limit {INGESTION_MAX_PENDING})")
+    async with upload_gate.admit():
+        yield
+
+def yield_to_chat(max_pause: float = INGESTION_MAX_PAUSE_SECONDS):
+    """Called by ingestion threads between batches: pause while chats are queued,
+    for at most ``max_pause`` seconds so indexing never stalls for good."""
+    if not ADMISSION_ENABLED or not chats_waiting():
+        return 0.0
+    start = time.perf_counter()
+    while chats_waiting() and time.perf_counter() - start < max_pause:
+        time.sleep(0.1)
+    paused = time.perf_counter() - start
+    INGESTION_PAUSE_SECONDS.inc(paused)
+    return paused
+
+def admission_stats():
+    return {
+        'enabled': ADMISSION_ENABLED,
+        'chats_waiting': chats_waiting(),
+        'gates': {gate.name: gate.stats() for gate in [*chat_gates.values(), upload_gate]},
+    }
@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from .chroma_utils import EMBEDDING_BACKEND, add_delete_listener
+from .db_utils import get_document_hashes
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a new question needs to reuse a cached answer, per EMBEDDING_BACKEND since each
+# model has its own scale. text-embedding-ada-002 puts most questions on one topic between 0.7 and
+# 1.0, and "What is Newton's first law?" vs "...second law?" already clears 0.95, so only near
+# rewordings may match. all-MiniLM-L6-v2 (local) spreads scores wider and paraphrases land lower.
+# Check a new model or threshold with tests/check_cache_threshold.py before relying on it.
+SEMANTIC_CACHE_THRESHOLDS = {"openai": 0.98, "local": 0.96}
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD")
+                                 or SEMANTIC_CACHE_THRESHOLDS.get(EMBEDDING_BACKEND, 0.98))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+
+class SemanticAnswerCache:
+    """In-memory cache of answers to standalone questions, matched by embedding similarity.
+
+    Each entry keeps the normalized question embedding, the model, the file_ids of
+    the chunks the answer was built from, and the answer with its sources. Entries
+    expire after ``ttl_seconds``; past ``max_entries`` the least recently used
+    entry is evicted. Entries are dropped as soon as one of their file_ids is
+    deleted or replaced.
+
+    The cache is per worker process. Deletes and replaces are broadcast only to
+    listeners in the process that ran them, so other workers notice on lookup:
+    each entry records the content_hash of its documents when stored, and
+    lookup_answer discards it once a document is gone or has a new hash.
+    """
+
+    def __init__(self, threshold, ttl_seconds, max_entries):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None  # (ids, stacked embeddings), rebuilt after changes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id):
+        del self._entries[entry_id]
+        self._matrix = None
+
+    def _purge_expired(self, now):
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry['created_at'] > self.ttl_seconds]
+        for entry_id in expired:
+            self._remove(entry_id)
+        self.expirations += len(expired)
+
+    def lookup(self, embedding, model):
+        """Return the closest live entry for this model above the threshold, or None."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._purge_expired(time.time())
+            if self._entries:
+                if self._matrix is None:
+                    ids = list(self._entries)
+                    self._matrix = (ids, np.stack([self._entries[i]['embedding'] for i in ids]))
+                ids, matrix = self._matrix
+                scores = matrix @ query
+                for index in np.argsort(scores)[::-1]:
+                    if scores[index] < self.threshold:
+                        break
+                    entry = self._entries[ids[index]]
+                    if entry['model'] == model:
+                        self._entries.move_to_end(ids[index])
+                        return dict(entry, id=ids[index], similarity=float(scores[index]))
+            return None
+
+    def record_lookup(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def store(self, embedding, model, file_ids, answer, sources, file_hashes=None):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'embedding': self._normalize(embedding),
+                'model': model,
+                'file_ids': frozenset(file_ids),
+                'file_hashes': file_hashes,
+                'answer': answer,
+                'sources': sources,
+                'created_at': time.time(),
+            }
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, entry_id):
+        with self._lock:
+            if entry_id in self._entries:
+                self._remove(entry_id)
+                self.invalidations += 1
+
+    def invalidate_file_id(self, file_id):
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if file_id in entry['file_ids']]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+        if stale:
+            print(f"Invalidated {len(stale)} cached answers for file_id {file_id}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': SEMANTIC_CACHE_ENABLED,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+answer_cache = SemanticAnswerCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES)
+add_delete_listener(answer_cache.invalidate_file_id)
+
+def source_file_ids(context_docs):
+    return {doc.metadata['file_id'] for doc in context_docs if 'file_id' in doc.metadata}
+
+def store_answer(embedding, model, context_docs, answer):
+    """Cache an answer with the content_hash of each document it was built from.
+    Reads SQLite, so async callers run it in the threadpool."""
+    file_ids = source_file_ids(context_docs)
+    answer_cache.store(embedding, model, file_ids, answer, [doc.metadata for doc in context_docs],
+                       get_document_hashes(file_ids))
+
+def lookup_answer(embedding, model):
+    """Cache lookup that also checks the entry's documents are unchanged.
+
+    With several workers a document may have been deleted or replaced in
+    another process; entries whose documents are gone or have a different
+    content_hash than when they were stored are discarded here.
+    """
+    entry = answer_cache.lookup(embedding, model)
+    if entry is not None and get_document_hashes(entry['file_ids']) != entry['file_hashes']:
+        answer_cache.discard(entry['id'])
+        entry = None
+    answer_cache.record_lookup(entry is not None)
+    return entry
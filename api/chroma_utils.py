@@ -1,99 +1,441 @@
-from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain.vectorstores import Chroma  # <-- Important: Use this import
 from typing import List
 from langchain_core.documents import Document
-from chromadb.config import Settings
 import os
 import gc
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .openai_utils import get_sync_client, get_async_client
+from .embedding_utils import CachedEmbeddings, text_hash
+from .parse_utils import iter_document_batches, current_rss_mb
+from .metrics_utils import timed, CHROMA_SECONDS
 
 # Determine the base directory for Chroma
-CHROMA_BASE_DIR = "/data/chroma_db" if os.access("/data", os.W_OK) else "./chroma_db"
+CHROMA_BASE_DIR = os.getenv("CHROMA_DIR") or ("/data/chroma_db" if os.access("/data", os.W_OK) else "./chroma_db")
 print(f"Using Chroma directory: {CHROMA_BASE_DIR}")
 
-CHROMA_SETTINGS = Settings(
-    anonymized_telemetry=False,
-    allow_reset=True,
-    is_persistent=True,
-    persist_directory=CHROMA_BASE_DIR,
-)
+# "openai" calls the embeddings API; "local" runs a sentence-transformers model on CPU
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+# "chroma" keeps an HNSW index per process; "memmap" shares one quantized matrix on disk
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
 
-# Revert to original chunk sizes
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len
-)
+# Known output sizes, used to tag the collection without an embedding call at startup
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
 
-embedding_function = OpenAIEmbeddings()
+def create_base_embeddings():
+    """Return (embeddings, model name, dimension or None) for EMBEDDING_BACKEND."""
+    if EMBEDDING_BACKEND == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(client=get_sync_client().embeddings, async_client=get_async_client().embeddings)
+        return embeddings, embeddings.model, OPENAI_EMBEDDING_DIMENSIONS.get(embeddings.model)
+    if EMBEDDING_BACKEND == "local":
+        from .local_embedding_utils import LocalEmbeddings
+        embeddings = LocalEmbeddings()
+        return embeddings, embeddings.model_name, embeddings.dimension
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; expected 'openai' or 'local'")
 
-vectorstore = Chroma(
-    persist_directory=CHROMA_BASE_DIR,
-    embedding_function=embedding_function,
-    client_settings=CHROMA_SETTINGS
-)
+def tag_collection_embedding(collection, model_name, dimension):
+    """Record the embedding model on the collection and refuse to mix models in it.
+
+    Untagged collections (created before tagging existed) are tagged on first
+    use, after checking that any stored vectors have the expected dimension.
+    """
+    metadata = dict(collection.metadata or {})
+    tagged_model = metadata.get("embedding_model")
+    if tagged_model is None:
+        if collection.count():
+            stored = collection.peek(1)["embeddings"][0]
+            if dimension is not None and len(stored) != dimension:
+                raise RuntimeError(
+                    f"Chroma collection in {CHROMA_BASE_DIR} holds {len(stored)}-dimensional vectors, "
+                    f"but {model_name} produces {dimension}. Use a separate CHROMA_DIR or re-index."
+                )
+            dimension = len(stored)
+        metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+        metadata["embedding_model"] = model_name
+        if dimension is not None:
+            metadata["embedding_dimension"] = dimension
+        collection.modify(metadata=metadata)
+        print(f"Tagged Chroma collection with embedding model {model_name}")
+        return
+    tagged_dimension = metadata.get("embedding_dimension")
+    if tagged_model != model_name or (None not in (tagged_dimension, dimension) and tagged_dimension != dimension):
+        raise RuntimeError(
+            f"Chroma collection in {CHROMA_BASE_DIR} was built with {tagged_model} "
+            f"({tagged_dimension} dimensions) but EMBEDDING_BACKEND={EMBEDDING_BACKEND} uses {model_name} "
+            f"({dimension} dimensions). Use a separate CHROMA_DIR or re-index the documents."
+        )
+
+class ChromaChunks:
+    """Chunk-level operations on the Chroma collection, with the same methods as
+    MemmapVectorStore so indexing and deletion work against either backend."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def get_file_chunks(self, file_id: int):
+        stored = self.collection.get(where={"file_id": file_id}, include=["metadatas", "documents"])
+        return stored["ids"], stored["metadatas"], stored["documents"]
+
+    def update_metadatas(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def delete_file_ids(self, file_ids: List[int]) -> int:
+        where = {"file_id": {"$in": file_ids}}
+        # Only the ids are needed for the count; documents and metadata stay on disk
+        chunk_count = len(self.collection.get(where=where, include=[])["ids"])
+        self.collection.delete(where=where)
+        return chunk_count
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def load(self) -> int:
+        """Make Chroma load the collection's vector index, which it otherwise does
+        on the first query. Uses a stored vector, so no embedding call."""
+        count = self.collection.count()
+        if count:
+            stored = self.collection.peek(1)["embeddings"][0]
+            self.collection.query(query_embeddings=[stored], n_results=1, include=[])
+        return count
+
+# The embeddings and the vector store are created on first use (or by the startup
+# warm-up) rather than at import, so importing the API stays fast and cheap to fail
+_embedding_function = None
+_embedding_dimension = None
+_vectorstore = None
+_chunk_store = None
+_init_lock = threading.RLock()
+
+def get_embedding_function() -> CachedEmbeddings:
+    """The cached embeddings wrapper around EMBEDDING_BACKEND, created once."""
+    global _embedding_function, _embedding_dimension
+    if _embedding_function is None:
+        with _init_lock:
+            if _embedding_function is None:
+                base_embeddings, model_name, _embedding_dimension = create_base_embeddings()
+                _embedding_function = CachedEmbeddings(base_embeddings, model_name=model_name)
+    return _embedding_function
+
+def open_vector_store(embedding_function, dimension):
+    """Return (LangChain vector store, chunk store) for VECTOR_STORE_BACKEND."""
+    if VECTOR_STORE_BACKEND == "chroma":
+        from chromadb.config import Settings
+        from langchain.vectorstores import Chroma  # <-- Important: Use this import
+        vectorstore = Chroma(
+            persist_directory=CHROMA_BASE_DIR,
+            embedding_function=embedding_function,
+            client_settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True,
+                is_persistent=True,
+                persist_directory=CHROMA_BASE_DIR,
+            )
+        )
+        tag_collection_embedding(vectorstore._collection, embedding_function.model_name, dimension)
+        return vectorstore, ChromaChunks(vectorstore._collection)
+    if VECTOR_STORE_BACKEND == "memmap":
+        from .memmap_store_utils import MemmapVectorStore
+        vectorstore = MemmapVectorStore(embedding_function=embedding_function)
+        vectorstore.tag_embedding(embedding_function.model_name, dimension)
+        print(f"Using memory-mapped {vectorstore.dtype} vector store in {vectorstore.directory}")
+        return vectorstore, vectorstore
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND {VECTOR_STORE_BACKEND!r}; expected 'chroma' or 'memmap'")
+
+def get_vectorstore():
+    """The persistent vector store, opened and checked against the embedding model once."""
+    global _vectorstore, _chunk_store
+    if _vectorstore is None:
+        with _init_lock:
+            if _vectorstore is None:
+                vectorstore, _chunk_store = open_vector_store(get_embedding_function(), _embedding_dimension)
+                _vectorstore = vectorstore
+    return _vectorstore
+
+def get_chunk_store():
+    """Chunk-level writes, reads and deletes on the open vector store."""
+    get_vectorstore()
+    return _chunk_store
+
+def vectorstore_ready() -> bool:
+    return _vectorstore is not None
+
+# Embedding batches run concurrently while finished batches are written to Chroma
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "1"))
+EMBED_BACKOFF_MAX_SECONDS = float(os.getenv("EMBED_BACKOFF_MAX_SECONDS", "30"))
+
+def retryable_embedding_errors():
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
 
 def load_and_split_document(file_path: str) -> List[Document]:
-    if file_path.endswith('.pdf'):
-        loader = PyMuPDFLoader(file_path)
-    elif file_path.endswith('.docx'):
-        loader = Docx2txtLoader(file_path)
-    elif file_path.endswith('.html'):
-        loader = UnstructuredHTMLLoader(file_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_path}")
-
-    documents = loader.load()
-    if not documents:
-        print(f"No documents loaded from {file_path}.")
-    else:
-        print(f"Loaded {len(documents)} documents from {file_path}.")
-
-    splits = text_splitter.split_documents(documents)
+    """Return every chunk of a document at once; indexing streams through iter_document_batches."""
+    splits = [doc for batch in iter_document_batches(file_path) for doc in batch]
     print(f"Created {len(splits)} text chunks from {file_path}.")
+    return splits
 
-    # Debug: Print first few chunks
-    for i, s in enumerate(splits[:3]):
-        print(f"Chunk {i+1}: {s.page_content[:200]}...")
+def add_embedded_documents(docs: List[Document], embeddings: List[List[float]]) -> List[str]:
+    """Write chunks whose vectors were already computed through the embedding cache."""
+    ids = [str(uuid.uuid4()) for _ in docs]
+    get_chunk_store().upsert(
+        ids=ids,
+        embeddings=embeddings,
+        metadatas=[doc.metadata for doc in docs],
+        documents=[doc.page_content for doc in docs]
+    )
+    return ids
 
-    return splits
+def embed_with_retry(texts: List[str]):
+    """Embed a batch, backing off exponentially (with jitter) on rate limits and transient errors.
 
-def index_document_to_chroma(file_path: str, file_id: int) -> bool:
+    Returns (vectors, cache hits, cache misses, retries).
+    """
+    retries = 0
+    retryable = retryable_embedding_errors()
+    while True:
+        try:
+            vectors, hits, misses = get_embedding_function().embed_documents_with_stats(texts)
+            return vectors, hits, misses, retries
+        except retryable as e:
+            if retries >= EMBED_MAX_RETRIES:
+                raise
+            delay = min(EMBED_BACKOFF_MAX_SECONDS, EMBED_BACKOFF_SECONDS * 2 ** retries)
+            delay *= random.uniform(0.5, 1.0)
+            retries += 1
+            print(f"Embedding batch failed ({type(e).__name__}), retry {retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+def existing_chunk_ids(file_id: int):
+    """Map chunk hash -> (id, metadata) of the chunks currently stored for file_id."""
+    by_hash = {}
+    for chunk_id, metadata, text in zip(*get_chunk_store().get_file_chunks(file_id)):
+        # Chunks indexed before chunk_hash was recorded are hashed from their text
+        chunk_hash = (metadata or {}).get("chunk_hash") or text_hash(text)
+        by_hash.setdefault(chunk_hash, []).append((chunk_id, metadata))
+    return by_hash
+
+def reuse_stored_chunks(batch: List[Document], stored, reused, stats) -> List[Document]:
+    """Match a batch against the stored chunks of the previous version.
+
+    Matched chunks keep their id and vector and only need the new metadata,
+    which is appended to ``reused`` as (id, old metadata, new metadata) and
+    written once the whole new version is in. Each stored id is used once, so
+    repeated chunks are matched one for one. Returns the chunks that still
+    need embedding.
+    """
+    new_docs = []
+    for doc in batch:
+        matches = stored.get(doc.metadata['chunk_hash'])
+        if matches:
+            chunk_id, old_metadata = matches.pop()
+            reused.append((chunk_id, old_metadata, doc.metadata))
+            stats["chunks_reused"] += 1
+            stats["chunks"] += 1
+        else:
+            new_docs.append(doc)
+    return new_docs
+
+@timed(CHROMA_SECONDS, "index")
+def index_document_to_chroma(file_path: str, file_id: int, progress=None, replace=False):
+    """Index a document and return its stats, or None if indexing failed.
+
+    Chunks stream from the parser in batches. Up to EMBED_CONCURRENCY batches are
+    embedded at once while earlier batches are written to Chroma, and the store is
+    persisted once at the end. If any batch fails, every chunk already written for
+    this call is removed again. ``stage_seconds["embed"]`` is the time spent
+    waiting on embeddings, not their summed duration.
+
+    ``progress`` is called as ``progress(chunks_processed, chunks_total, stage_seconds)``
+    after every batch; ``chunks_total`` is None until the whole document has been split.
+
+    The stats also carry the page count, the parse and split time summed over
+    the parser workers (``worker_seconds``), and peak RSS of this process and
+    of the workers.
+
+    With ``replace`` the document is a new version of what is stored under
+    ``file_id``. Every chunk is hashed; chunks already stored keep their vectors
+    (their metadata is refreshed once every new chunk is written), new chunks
+    are embedded and written, and stored chunks missing from the new version
+    are deleted last. A replace that fails leaves the previous version as it was. The stats then also report ``chunks_reused``, ``chunks_added``
+    and ``chunks_removed``.
+    """
+    vectorstore = get_vectorstore()
+    stage_seconds = {"load_split": 0.0, "embed": 0.0, "write": 0.0, "persist": 0.0}
+    parse_profile = {}
+    stats = {"chunks": 0, "pages": None, "cache_hits": 0, "cache_misses": 0, "embed_batches": 0,
+             "embed_retries": 0, "stage_seconds": stage_seconds,
+             "worker_seconds": {"parse": 0.0, "split": 0.0},
+             "peak_rss_mb": current_rss_mb(), "peak_worker_rss_mb": 0.0}
+    written_ids = []
+    in_flight = deque()
+    stored = existing_chunk_ids(file_id) if replace else {}
+    reused = []
+    relabelled = False
+    if replace:
+        stats.update(chunks_reused=0, chunks_added=0, chunks_removed=0)
+
+    def write_oldest_batch():
+        batch, future = in_flight.popleft()
+        start = time.perf_counter()
+        embeddings, hits, misses, retries = future.result()
+        stage_seconds["embed"] += time.perf_counter() - start
+        stats["cache_hits"] += hits
+        stats["cache_misses"] += misses
+        stats["embed_retries"] += retries
+        stats["embed_batches"] += 1
+        start = time.perf_counter()
+        written_ids.extend(add_embedded_documents(batch, embeddings))
+        stage_seconds["write"] += time.perf_counter() - start
+        stats["chunks"] += len(batch)
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], current_rss_mb())
+        if progress:
+            progress(stats["chunks"], None, stage_seconds)
+
+    batches = None
     try:
-        splits = load_and_split_document(file_path)
+        if progress:
+            progress(0, None, stage_seconds)
 
-        # Add metadata and index in batches
         BATCH_SIZE = 100
-        for i in range(0, len(splits), BATCH_SIZE):
-            batch = splits[i:i + BATCH_SIZE]
+        batches = iter_document_batches(file_path, batch_size=BATCH_SIZE, profile=parse_profile)
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            stage_seconds["load_split"] += time.perf_counter() - start
+            if batch is None:
+                break
             for doc in batch:
                 doc.metadata['file_id'] = file_id
-            vectorstore.add_documents(batch)
-            gc.collect()
+                doc.metadata['chunk_hash'] = text_hash(doc.page_content)
+            if replace:
+                batch = reuse_stored_chunks(batch, stored, reused, stats)
+                if progress:
+                    progress(stats["chunks"], None, stage_seconds)
+                if not batch:
+                    continue
+            future = _embed_executor.submit(embed_with_retry, [doc.page_content for doc in batch])
+            in_flight.append((batch, future))
+            # Write the oldest batch while the newer ones are still embedding
+            while len(in_flight) >= EMBED_CONCURRENCY:
+                write_oldest_batch()
+        while in_flight:
+            write_oldest_batch()
+
+        if replace:
+            start = time.perf_counter()
+            if reused:
+                # Page numbers and the source path change between versions, the text does not.
+                # Only now that every new chunk is in, so a failed replace leaves the old labels.
+                relabelled = True
+                get_chunk_store().update_metadatas([chunk_id for chunk_id, _, _ in reused],
+                                                   [metadata for _, _, metadata in reused])
+            # Whatever was not matched by the new version has vanished from the document
+            vanished = [chunk_id for matches in stored.values() for chunk_id, _ in matches]
+            if vanished:
+                get_chunk_store().delete(vanished)
+            stage_seconds["write"] += time.perf_counter() - start
+            stats["chunks_added"] = len(written_ids)
+            stats["chunks_removed"] = len(vanished)
 
-        # Persist the vector store after adding documents
+        # Persist the vector store once, after every batch is in
+        start = time.perf_counter()
         vectorstore.persist()
-        print(f"Successfully indexed {len(splits)} chunks for file_id {file_id}")
-        return True
+        stage_seconds["persist"] = time.perf_counter() - start
+        stats["pages"] = parse_profile["pages"]
+        stats["worker_seconds"] = {"parse": parse_profile["parse_seconds"], "split": parse_profile["split_seconds"]}
+        stats["peak_worker_rss_mb"] = parse_profile["peak_worker_rss_mb"]
+        if progress:
+            progress(stats["chunks"], stats["chunks"], stage_seconds)
+        print(f"Successfully indexed {stats['chunks']} chunks for file_id {file_id} "
+              f"(embedding cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses, "
+              f"{stats['embed_retries']} retries)")
+        if replace:
+            print(f"Replaced file_id {file_id}: {stats['chunks_reused']} chunks reused, "
+                  f"{stats['chunks_added']} added, {stats['chunks_removed']} removed")
+            if stats['chunks_added'] or stats['chunks_removed']:
+                # Answers cached from the old version may quote text that is gone
+                _notify_deleted(file_id)
+        return stats
     except Exception as e:
         print(f"Error indexing document: {e}")
-        return False
+        if batches is not None:
+            # Cancels the parse windows still queued in the process pool
+            batches.close()
+        for _, future in in_flight:
+            future.cancel()
+        if written_ids or relabelled:
+            try:
+                if relabelled:
+                    get_chunk_store().update_metadatas([chunk_id for chunk_id, _, _ in reused],
+                                                       [metadata for _, metadata, _ in reused])
+                if written_ids:
+                    get_chunk_store().delete(written_ids)
+                vectorstore.persist()
+                print(f"Rolled back {len(written_ids)} chunks for file_id {file_id}")
+            except Exception as rollback_error:
+                print(f"Error rolling back chunks for file_id {file_id}: {rollback_error}")
+        return None
 
-def delete_doc_from_chroma(file_id: int):
+# Called with the file_id once its chunks are gone, e.g. to drop cached answers built on them
+_delete_listeners = []
+
+def add_delete_listener(listener):
+    _delete_listeners.append(listener)
+
+def _notify_deleted(file_id: int):
+    for listener in _delete_listeners:
+        try:
+            listener(file_id)
+        except Exception as e:
+            print(f"Error in delete listener for file_id {file_id}: {e}")
+
+@timed(CHROMA_SECONDS, "delete")
+def delete_docs_from_chroma(file_ids: List[int]):
+    """Delete the chunks of several documents in one pass and persist once.
+
+    Returns the number of chunks deleted, or None if the deletion failed.
+    """
+    file_ids = list(file_ids)
+    if not file_ids:
+        return 0
+    label = f"file_id {file_ids[0]}" if len(file_ids) == 1 else f"{len(file_ids)} file_ids"
     try:
-        docs = vectorstore.get(where={"file_id": file_id})
-        if 'ids' in docs:
-            print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
-        else:
-            print(f"No document chunks found for file_id {file_id}")
+        vectorstore = get_vectorstore()
+        chunk_count = get_chunk_store().delete_file_ids(file_ids)
+        print(f"Found {chunk_count} document chunks for {label}")
 
-        vectorstore._collection.delete(where={"file_id": file_id})
         # Persist after deletion
         vectorstore.persist()
-        print(f"Deleted all documents with file_id {file_id}")
+        print(f"Deleted all documents with {label}")
+        for file_id in file_ids:
+            _notify_deleted(file_id)
         gc.collect()
-        return True
+        return chunk_count
     except Exception as e:
-        print(f"Error deleting document with file_id {file_id} from Chroma: {str(e)}")
-        return False
+        print(f"Error deleting documents with file_ids {file_ids} from Chroma: {str(e)}")
+        return None
+
+def delete_doc_from_chroma(file_id: int):
+    return delete_docs_from_chroma([file_id]) is not None
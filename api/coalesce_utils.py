@@ -0,0 +1,56 @@
+import os
+import asyncio
+import threading
+from .metrics_utils import COALESCED_REQUESTS
+
+# Identical concurrent questions without chat history share one chain run
+CHAT_COALESCING_ENABLED = os.getenv("CHAT_COALESCING_ENABLED", "true").lower() == "true"
+
+class SingleFlight:
+    """Run one coroutine per key at a time and hand its result to every caller
+    that asks for the same key while it is in flight.
+
+    The shared work runs as its own task, so a leader whose client disconnects
+    does not cancel it for the followers. An exception reaches every caller.
+    Coalescing is per event loop, i.e. per worker process.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key, make_coroutine):
+        """Return (result, coalesced); ``make_coroutine`` is only called by the leader."""
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            with self._lock:
+                self.followers += 1
+            COALESCED_REQUESTS.labels(self.operation, "follower").inc()
+        else:
+            task = asyncio.ensure_future(make_coroutine())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            with self._lock:
+                self.leaders += 1
+            COALESCED_REQUESTS.labels(self.operation, "leader").inc()
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                'in_flight': len(self._in_flight),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'coalesced_rate': round(self.followers / total, 4) if total else 0.0,
+            }
+
+chat_flights = SingleFlight("chat")
@@ -0,0 +1,115 @@
+import os
+from typing import List
+from langchain_core.documents import Document
+from .history_utils import count_tokens
+
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+# Tokens of retrieved text sent to the answer model; 0 disables the budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+# Shorter suffix/prefix matches between two chunks are treated as coincidence
+CONTEXT_MIN_OVERLAP_CHARS = int(os.getenv("CONTEXT_MIN_OVERLAP_CHARS", "20"))
+# Word-shingle Jaccard similarity above which the lower-ranked chunk is dropped
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.85"))
+
+def overlap_length(first: str, second: str, min_overlap: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of ``first`` that is also a prefix of ``second``,
+    or 0 if it is shorter than ``min_overlap``. Chunks cut by text_splitter with
+    chunk_overlap share such a run with the chunk that follows them."""
+    if min(len(first), len(second)) < min_overlap:
+        return 0
+    probe = second[:min_overlap]
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+def shingles(text: str, size: int = 3):
+    words = text.lower().split()
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+def is_near_duplicate(a: set, b: set, threshold: float = CONTEXT_DUPLICATE_THRESHOLD) -> bool:
+    return bool(a and b) and len(a & b) / len(a | b) >= threshold
+
+def _merge_overlapping(group):
+    """Merge (rank, text, metadata) entries of one page whose texts overlap or
+    contain each other, until no pair is left to merge. Returns (entries, merges)."""
+    merges = 0
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(group)):
+            for j in range(i + 1, len(group)):
+                (rank_a, a, meta_a), (rank_b, b, meta_b) = group[i], group[j]
+                if b in a or a in b:
+                    text = a if len(a) >= len(b) else b
+                elif overlap_length(a, b):
+                    text = a + b[overlap_length(a, b):]
+                elif overlap_length(b, a):
+                    text = b + a[overlap_length(b, a):]
+                else:
+                    continue
+                # The merged chunk keeps the better rank and that chunk's metadata
+                meta = meta_a if rank_a <= rank_b else meta_b
+                group[i] = (min(rank_a, rank_b), text, dict(meta, merged_chunks=meta_a.get("merged_chunks", 1)
+                                                            + meta_b.get("merged_chunks", 1)))
+                del group[j]
+                merges += 1
+                merged = True
+                break
+            if merged:
+                break
+    return group, merges
+
+def pack_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET, enabled: bool = CONTEXT_PACKING_ENABLED):
+    """Assemble retrieved chunks into the context sent to the answer model.
+
+    Chunks of the same file_id and page that overlap (as consecutive chunks
+    do, by up to chunk_overlap characters) are merged into one, near-duplicate
+    chunks are dropped, and the rest are kept in retrieval order until
+    ``budget`` tokens are used. Returns ``{"documents": [...], "stats": {...}}``,
+    where the stats compare the tokens of the retrieved chunks with what is sent.
+    """
+    retrieved_tokens = sum(count_tokens(doc.page_content) for doc in docs)
+    stats = {"retrieved_chunks": len(docs), "merged": 0, "duplicates": 0, "over_budget": 0,
+             "retrieved_tokens": retrieved_tokens}
+    if not enabled or not docs:
+        return {"documents": list(docs),
+                "stats": dict(stats, packed_chunks=len(docs), context_tokens=retrieved_tokens, tokens_saved=0)}
+
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get("file_id"), doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append((rank, doc.page_content, dict(doc.metadata)))
+    entries = []
+    for group in groups.values():
+        group, merges = _merge_overlapping(group)
+        stats["merged"] += merges
+        entries.extend(group)
+    entries.sort(key=lambda entry: entry[0])
+
+    kept, kept_shingles = [], []
+    for rank, text, metadata in entries:
+        text_shingles = shingles(text)
+        if any(is_near_duplicate(text_shingles, other) for other in kept_shingles):
+            stats["duplicates"] += 1
+            continue
+        kept.append((text, metadata))
+        kept_shingles.append(text_shingles)
+
+    packed, used = [], 0
+    for text, metadata in kept:
+        tokens = count_tokens(text)
+        if budget and used + tokens > budget:
+            if packed:
+                # A later, shorter chunk may still fit
+                stats["over_budget"] += 1
+                continue
+            # Never send an empty context: cut the best chunk down to the budget
+            text = text[:len(text) * budget // tokens]
+            tokens = count_tokens(text)
+        packed.append(Document(page_content=text, metadata=metadata))
+        used += tokens
+    stats.update(packed_chunks=len(packed), context_tokens=used, tokens_saved=max(0, retrieved_tokens - used))
+    return {"documents": packed, "stats": stats}
@@ -1,15 +1,116 @@
+import os
+import queue
 import sqlite3
+import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from .metrics_utils import db_timed
 
 DB_NAME = "rag_app.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Longest a thread waits for a pooled connection before giving up
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Applied to every pooled connection. WAL lets readers run alongside the single
+# writer, and busy_timeout makes writers wait for the lock instead of failing
+# with "database is locked".
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=134217728',
+)
 
-def create_application_logs():
-    conn = get_db_connection()
+class PoolExhausted(sqlite3.OperationalError):
+    """Raised when no pooled connection frees up in time."""
+
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections shared by all threads.
+
+    Connections are created lazily up to ``size``; callers beyond that wait up to
+    ``timeout`` seconds for one to be returned, then get PoolExhausted. Async code
+    reaches the pool through run_in_threadpool.
+    """
+
+    def __init__(self, database, size, timeout=DB_POOL_TIMEOUT_SECONDS):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=5, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            # Every connection stayed checked out: overload, or a thread that holds one while
+            # waiting for another (which would otherwise block forever once the pool is drained)
+            raise PoolExhausted(f"No connection to {self.database} was returned within {self.timeout:g}s; "
+                                f"all {self.size} are in use") from None
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+_pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; commits on success and rolls back on error."""
+    conn = _pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _pool.release(conn)
+
+def close_db_pool():
+    _pool.close_all()
+
+def _add_column_if_missing(conn, table, column, definition):
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def migrate_initial_schema(conn):
+    # The tables that used to be created at import time; IF NOT EXISTS keeps
+    # this safe on databases created by those older versions.
     conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
                      session_id TEXT,
@@ -17,94 +118,426 @@ def create_application_logs():
                      gpt_response TEXT,
                      model TEXT,
                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+    conn.execute('''CREATE TABLE IF NOT EXISTS document_store
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     filename TEXT,
+                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     content_hash TEXT)''')
+    _add_column_if_missing(conn, 'document_store', 'content_hash', 'TEXT')
+    conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache
+                    (model TEXT,
+                     text_hash TEXT,
+                     embedding BLOB,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     PRIMARY KEY (model, text_hash))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_jobs
+                    (id TEXT PRIMARY KEY,
+                     file_id INTEGER,
+                     filename TEXT,
+                     file_path TEXT,
+                     state TEXT,
+                     chunks_processed INTEGER DEFAULT 0,
+                     chunks_total INTEGER,
+                     stage_seconds TEXT,
+                     result TEXT,
+                     error TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def migrate_lookup_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_session ON application_logs (session_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_filename ON document_store (filename)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_document_store_content_hash ON document_store (content_hash)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_state ON ingestion_jobs (state)')
+
+def migrate_session_summaries(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_summaries
+                    (session_id TEXT PRIMARY KEY,
+                     summary TEXT,
+                     summarized_until INTEGER,
+                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+def migrate_ingestion_profiles(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_profiles
+                    (file_id INTEGER PRIMARY KEY,
+                     job_id TEXT,
+                     filename TEXT,
+                     file_type TEXT,
+                     bytes INTEGER,
+                     pages INTEGER,
+                     chunks INTEGER,
+                     embed_batches INTEGER,
+                     embed_retries INTEGER,
+                     cache_hits INTEGER,
+                     cache_misses INTEGER,
+                     stage_seconds TEXT,
+                     worker_seconds TEXT,
+                     total_seconds REAL,
+                     chunks_per_second REAL,
+                     peak_rss_mb REAL,
+                     peak_worker_rss_mb REAL,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_profiles_created ON ingestion_profiles (created_at)')
+
+def migrate_replace_jobs(conn):
+    # "index" builds a new document; "replace" re-indexes an existing file_id in place
+    _add_column_if_missing(conn, 'ingestion_jobs', 'kind', "TEXT DEFAULT 'index'")
+    # Hash of the new version, written to document_store once a replace job completes
+    _add_column_if_missing(conn, 'ingestion_jobs', 'content_hash', 'TEXT')
+
+def migrate_documents_version(conn):
+    # Bumped by triggers on every change to document_store; /list-docs derives its ETag from it
+    conn.execute('''CREATE TABLE IF NOT EXISTS store_versions
+                    (name TEXT PRIMARY KEY,
+                     version INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("INSERT OR IGNORE INTO store_versions (name, version) VALUES ('documents', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS document_store_version_{event.lower()}
+                         AFTER {event} ON document_store
+                         BEGIN
+                             UPDATE store_versions SET version = version + 1 WHERE name = 'documents';
+                         END''')
+
+def migrate_application_logs_retention(conn):
+    # Retention moves rows out of application_logs by age
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_created ON application_logs (created_at)')
+
+def migrate_application_logs_complete(conn):
+    # 0 marks a streamed answer that was cut short; it is kept for the record but not sent back as history
+    _add_column_if_missing(conn, 'application_logs', 'complete', 'INTEGER NOT NULL DEFAULT 1')
+
+def migrate_application_logs_restored(conn):
+    # Set when a row comes back from the archive, so retention leaves it alone for a while
+    _add_column_if_missing(conn, 'application_logs', 'restored_at', 'TIMESTAMP')
+
+# Append new migrations to the end; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    migrate_initial_schema,
+    migrate_lookup_indexes,
+    migrate_session_summaries,
+    migrate_ingestion_profiles,
+    migrate_replace_jobs,
+    migrate_documents_version,
+    migrate_application_logs_retention,
+    migrate_application_logs_complete,
+    migrate_application_logs_restored,
+]
+
+def init_db():
+    """Bring the database schema up to date. Safe to run from several workers at once."""
+    with db_connection() as conn:
+        # BEGIN IMMEDIATE takes the write lock, so only one process migrates at a time
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            print(f"Applying database migration {number}: {migration.__name__}")
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+
+@db_timed
+def insert_application_logs(session_id, user_query, gpt_response, model, complete=True):
+    with db_connection() as conn:
+        conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model, complete) '
+                     'VALUES (?, ?, ?, ?, ?)', (session_id, user_query, gpt_response, model, int(complete)))
+
+@db_timed
+def insert_application_logs_batch(rows):
+    """Insert (session_id, user_query, gpt_response, model, created_at, complete) rows in one transaction."""
+    with db_connection() as conn:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at, '
+                         'complete) VALUES (?, ?, ?, ?, ?, ?)', rows)
 
-def insert_application_logs(session_id, user_query, gpt_response, model):
-    conn = get_db_connection()
-    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
-                 (session_id, user_query, gpt_response, model))
-    conn.commit()
-    conn.close()
+@db_timed
+def move_application_logs_before(cutoff, limit, sink, restored_before):
+    """Pass up to ``limit`` of the oldest rows created before ``cutoff`` to ``sink``
+    and delete them once it returns. Rows restored from the archive are only
+    moved again once they were restored before ``restored_before``. Returns the
+    number of rows moved.
 
+    ``sink`` runs outside any transaction so chat logs and job updates are not
+    held up while it writes; two workers may then both pass the same rows to
+    it, so it must tolerate duplicates by id."""
+    with db_connection() as conn:
+        rows = [dict(row) for row in conn.execute(
+            'SELECT id, session_id, user_query, gpt_response, model, created_at, complete FROM application_logs '
+            'WHERE created_at < ? AND (restored_at IS NULL OR restored_at < ?) ORDER BY id LIMIT ?',
+            (cutoff, restored_before, limit))]
+    if rows:
+        sink(rows)
+        with db_connection() as conn:
+            conn.executemany('DELETE FROM application_logs WHERE id = ?', [(row['id'],) for row in rows])
+    return len(rows)
+
+@db_timed
+def restore_application_logs(rows):
+    """Re-insert archived rows with their original ids, stamped with restored_at;
+    rows already present are skipped."""
+    # Archives written before the complete column existed only hold complete turns
+    rows = [dict({'complete': 1}, **row) for row in rows]
+    with db_connection() as conn:
+        before = conn.total_changes
+        conn.executemany('INSERT OR IGNORE INTO application_logs '
+                         '(id, session_id, user_query, gpt_response, model, created_at, complete, restored_at) '
+                         'VALUES (:id, :session_id, :user_query, :gpt_response, :model, :created_at, :complete, '
+                         'CURRENT_TIMESTAMP)', rows)
+        return conn.total_changes - before
+
+@db_timed
 def get_chat_history(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at', (session_id,))
+    with db_connection() as conn:
+        cursor = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? AND complete = 1 ORDER BY created_at, id', (session_id,))
+        rows = cursor.fetchall()
     messages = []
-    for row in cursor.fetchall():
+    for row in rows:
         messages.extend([
             {"role": "human", "content": row['user_query']},
             {"role": "ai", "content": row['gpt_response']}
         ])
-    conn.close()
     return messages
 
-def create_document_store():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS document_store
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     filename TEXT,
-                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
-
-def insert_document_record(filename):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO document_store (filename) VALUES (?)', (filename,))
-    file_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return file_id
+@db_timed
+def get_chat_turns(session_id, after_id=0):
+    """Return the session's complete turns with a log id above ``after_id``, oldest first."""
+    with db_connection() as conn:
+        rows = conn.execute('SELECT id, user_query, gpt_response, created_at FROM application_logs '
+                            'WHERE session_id = ? AND id > ? AND complete = 1 ORDER BY created_at, id',
+                            (session_id, after_id)).fetchall()
+    return [dict(row) for row in rows]
+
+@db_timed
+def get_session_summary(session_id):
+    with db_connection() as conn:
+        row = conn.execute('SELECT summary, summarized_until FROM session_summaries WHERE session_id = ?',
+                           (session_id,)).fetchone()
+    return dict(row) if row else None
+
+@db_timed
+def upsert_session_summary(session_id, summary, summarized_until):
+    with db_connection() as conn:
+        conn.execute('''INSERT INTO session_summaries (session_id, summary, summarized_until)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT(session_id) DO UPDATE SET
+                            summary = excluded.summary,
+                            summarized_until = excluded.summarized_until,
+                            updated_at = CURRENT_TIMESTAMP''',
+                     (session_id, summary, summarized_until))
+
+@db_timed
+def get_cached_embeddings(model, text_hashes):
+    """Return {text_hash: embedding blob} for the hashes already cached for this model."""
+    cached = {}
+    text_hashes = list(text_hashes)
+    with db_connection() as conn:
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(text_hashes), 500):
+            chunk = text_hashes[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = conn.execute(
+                f'SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})',
+                (model, *chunk)
+            )
+            for row in cursor.fetchall():
+                cached[row['text_hash']] = row['embedding']
+    return cached
 
+@db_timed
+def insert_cached_embeddings(model, rows):
+    """Store (text_hash, embedding blob) pairs for this model."""
+    with db_connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO embedding_cache (model, text_hash, embedding) VALUES (?, ?, ?)',
+                         [(model, text_hash, embedding) for text_hash, embedding in rows])
+
+@db_timed
+def insert_document_record(filename, content_hash=None):
+    with db_connection() as conn:
+        cursor = conn.execute('INSERT INTO document_store (filename, content_hash) VALUES (?, ?)', (filename, content_hash))
+        return cursor.lastrowid
+
+@db_timed
+def update_document_record(file_id, filename, content_hash):
+    with db_connection() as conn:
+        conn.execute('UPDATE document_store SET filename = ?, content_hash = ?, upload_timestamp = CURRENT_TIMESTAMP WHERE id = ?',
+                     (filename, content_hash, file_id))
+
+@db_timed
 def delete_document_record(file_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
     return True
 
-def get_all_documents():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC')
-    documents = cursor.fetchall()
-    conn.close()
+@db_timed
+def delete_document_records(file_ids):
+    """Delete several document_store rows in one transaction; returns how many existed."""
+    file_ids = list(file_ids)
+    if not file_ids:
+        return 0
+    placeholders = ','.join('?' * len(file_ids))
+    with db_connection() as conn:
+        cursor = conn.execute(f'DELETE FROM document_store WHERE id IN ({placeholders})', file_ids)
+        return cursor.rowcount
+
+@db_timed
+def get_all_documents(limit=None, offset=0):
+    with db_connection() as conn:
+        # LIMIT -1 means no limit in SQLite
+        cursor = conn.execute('SELECT id, filename, upload_timestamp FROM document_store '
+                              'ORDER BY upload_timestamp DESC, id DESC LIMIT ? OFFSET ?',
+                              (-1 if limit is None else limit, offset))
+        documents = cursor.fetchall()
     return [dict(doc) for doc in documents]
 
+@db_timed
+def count_documents():
+    with db_connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM document_store').fetchone()[0]
+
+@db_timed
+def get_documents_version():
+    with db_connection() as conn:
+        row = conn.execute("SELECT version FROM store_versions WHERE name = 'documents'").fetchone()
+    return row['version'] if row else 0
+
 #added as failsafe for default document deletion
+@db_timed
 def get_document_by_id(file_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM document_store WHERE id = ?', (file_id,))
-    document = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        document = conn.execute('SELECT * FROM document_store WHERE id = ?', (file_id,)).fetchone()
     return dict(document) if document else None
 
+@db_timed
+def get_existing_document_ids(file_ids):
+    """Return the subset of file_ids that still have a document_store row."""
+    file_ids = list(file_ids)
+    if not file_ids:
+        return set()
+    placeholders = ','.join('?' * len(file_ids))
+    with db_connection() as conn:
+        rows = conn.execute(f'SELECT id FROM document_store WHERE id IN ({placeholders})', file_ids).fetchall()
+    return {row['id'] for row in rows}
+
+@db_timed
+def get_document_hashes(file_ids):
+    """Return {file_id: content_hash} for the file_ids that still have a document_store row."""
+    file_ids = list(file_ids)
+    if not file_ids:
+        return {}
+    placeholders = ','.join('?' * len(file_ids))
+    with db_connection() as conn:
+        rows = conn.execute(f'SELECT id, content_hash FROM document_store WHERE id IN ({placeholders})',
+                            file_ids).fetchall()
+    return {row['id']: row['content_hash'] for row in rows}
+
+@db_timed
+def get_document_by_hash(content_hash):
+    with db_connection() as conn:
+        document = conn.execute('SELECT * FROM document_store WHERE content_hash = ? ORDER BY id LIMIT 1',
+                                (content_hash,)).fetchone()
+    return dict(document) if document else None
+
+@db_timed
+def insert_ingestion_job(job_id, file_id, filename, file_path, kind='index', content_hash=None):
+    """Insert a queued job and return True. A replace job is only inserted while no
+    other job for its file_id is queued or running (checked in the same statement,
+    so two workers cannot both get one in); otherwise nothing is written and False is returned."""
+    with db_connection() as conn:
+        cursor = conn.execute(
+            'INSERT INTO ingestion_jobs (id, file_id, filename, file_path, state, kind, content_hash) '
+            'SELECT ?, ?, ?, ?, ?, ?, ? WHERE ? != \'replace\' OR NOT EXISTS '
+            '(SELECT 1 FROM ingestion_jobs WHERE file_id = ? AND state IN (\'queued\', \'running\'))',
+            (job_id, file_id, filename, file_path, 'queued', kind, content_hash, kind, file_id))
+        return cursor.rowcount == 1
+
+@db_timed
+def update_ingestion_job(job_id, **fields):
+    # stage_seconds and result are stored as JSON text
+    for key in ('stage_seconds', 'result'):
+        if key in fields and fields[key] is not None:
+            fields[key] = json.dumps(fields[key])
+    assignments = ', '.join(f'{key} = ?' for key in fields)
+    with db_connection() as conn:
+        conn.execute(f'UPDATE ingestion_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (*fields.values(), job_id))
+
+def _job_from_row(row):
+    job = dict(row)
+    for key in ('stage_seconds', 'result'):
+        job[key] = json.loads(job[key]) if job[key] else None
+    return job
+
+@db_timed
+def get_ingestion_job(job_id):
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM ingestion_jobs WHERE id = ?', (job_id,)).fetchone()
+    return _job_from_row(row) if row else None
+
+@db_timed
+def get_unfinished_ingestion_jobs(file_id=None):
+    query = "SELECT * FROM ingestion_jobs WHERE state IN ('queued', 'running')"
+    params = ()
+    if file_id is not None:
+        query += " AND file_id = ?"
+        params = (file_id,)
+    with db_connection() as conn:
+        rows = conn.execute(query + " ORDER BY created_at", params).fetchall()
+    return [_job_from_row(row) for row in rows]
+
+PROFILE_JSON_FIELDS = ('stage_seconds', 'worker_seconds')
+# Orderings offered by /ingestion-profiles
+PROFILE_ORDERS = {
+    'recent': 'created_at DESC',
+    'slowest': 'total_seconds DESC',
+    'lowest_throughput': 'chunks_per_second ASC',
+    'largest': 'bytes DESC',
+}
+
+@db_timed
+def upsert_ingestion_profile(profile):
+    """Store the profile of a finished ingestion; re-indexing a file_id replaces it."""
+    row = dict(profile)
+    for key in PROFILE_JSON_FIELDS:
+        row[key] = json.dumps(row.get(key) or {})
+    columns = ', '.join(row)
+    placeholders = ', '.join('?' * len(row))
+    with db_connection() as conn:
+        conn.execute(f'INSERT OR REPLACE INTO ingestion_profiles ({columns}) VALUES ({placeholders})',
+                     tuple(row.values()))
+
+def _profile_from_row(row):
+    profile = dict(row)
+    for key in PROFILE_JSON_FIELDS:
+        profile[key] = json.loads(profile[key]) if profile[key] else None
+    return profile
+
+@db_timed
+def get_ingestion_profile(file_id):
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM ingestion_profiles WHERE file_id = ?', (file_id,)).fetchone()
+    return _profile_from_row(row) if row else None
+
+@db_timed
+def list_ingestion_profiles(limit=50, order='recent'):
+    order_by = PROFILE_ORDERS[order]
+    with db_connection() as conn:
+        rows = conn.execute(f'SELECT * FROM ingestion_profiles ORDER BY {order_by} LIMIT ?', (limit,)).fetchall()
+    return [_profile_from_row(row) for row in rows]
+
 def cleanup_old_documents():
     """Periodically clean up old documents"""
+    # chroma_utils imports this module (via the embedding cache), so import it here
+    from .chroma_utils import delete_docs_from_chroma
     try:
         MAX_DOCS = 5  # Keep only last 5 documents
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+
         # Get all documents except the default one
-        cursor.execute('''
-            SELECT id FROM document_store 
-            WHERE filename != 'OpenStaxHSPhysics.pdf'
-            ORDER BY upload_timestamp DESC
-        ''')
-        
-        all_docs = cursor.fetchall()
-        docs_to_delete = all_docs[MAX_DOCS:]
-        
-        for doc in docs_to_delete:
-            delete_document_record(doc['id'])
-            delete_doc_from_chroma(doc['id'])
-            
-        conn.close()
+        with db_connection() as conn:
+            all_docs = conn.execute('''
+                SELECT id FROM document_store
+                WHERE filename != 'OpenStaxHSPhysics.pdf'
+                ORDER BY upload_timestamp DESC
+            ''').fetchall()
+
+        file_ids = [doc['id'] for doc in all_docs[MAX_DOCS:]]
+        if file_ids and delete_docs_from_chroma(file_ids) is not None:
+            delete_document_records(file_ids)
     except Exception as e:
         print(f"Error during cleanup: {e}")
-
-# Initialize the database tables
-create_application_logs()
-create_document_store()
@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Tuple
+from langchain_core.embeddings import Embeddings
+from .db_utils import get_cached_embeddings, insert_cached_embeddings
+
+# Query embeddings are kept in an in-process LRU; with the shared store enabled
+# they are also written to the embedding_cache table so other workers reuse them
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_SHARED = os.getenv("QUERY_EMBEDDING_CACHE_SHARED", "true").lower() == "true"
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def to_blob(vector: List[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+def from_blob(blob: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+class QueryEmbeddingLRU:
+    """Bounded LRU of query vectors keyed by normalized query text, with hit/miss
+    counters and an estimate of the embedding latency the hits saved."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    def get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+    def record(self, outcome: str, seconds: float):
+        with self._lock:
+            if outcome == "miss":
+                self.misses += 1
+                self.miss_seconds += seconds
+            else:
+                if outcome == "memory":
+                    self.memory_hits += 1
+                else:
+                    self.shared_hits += 1
+                self.hit_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            avg_miss_ms = self.miss_seconds * 1000 / self.misses if self.misses else 0.0
+            return {
+                'entries': len(self._vectors),
+                'max_entries': self.max_size,
+                'memory_hits': self.memory_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'avg_embed_ms': round(avg_miss_ms, 2),
+                # Each hit would otherwise have cost an average embedding call
+                'latency_saved_ms': round(max(0.0, hits * avg_miss_ms - self.hit_seconds * 1000), 1),
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper backed by the SQLite embedding_cache table.
+
+    Chunk vectors are keyed by (embedding model, chunk text hash), so a chunk
+    that was embedded once is never sent to the embedding API again, whichever
+    document it comes from.
+
+    Query embeddings go through a QueryEmbeddingLRU first, then (if shared) the
+    same table under a separate ``<model>:query`` key, and only then the API.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str,
+                 query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 shared_query_cache: bool = QUERY_EMBEDDING_CACHE_SHARED):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.query_cache = QueryEmbeddingLRU(query_cache_size)
+        self.shared_query_cache = shared_query_cache
+        self.query_model_key = f"{model_name}:query"
+        # Stores started by aembed_query, kept until they finish so none is lost or fails unseen
+        self._store_futures = set()
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], int, int]:
+        """Embed texts through the cache and return (vectors, cache hits, cache misses)."""
+        hashes = [text_hash(text) for text in texts]
+        cached = get_cached_embeddings(self.model_name, set(hashes))
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+            new_blobs = [to_blob(vector) for vector in new_vectors]
+            insert_cached_embeddings(self.model_name, zip(missing.keys(), new_blobs))
+            cached.update(zip(missing.keys(), new_blobs))
+
+        vectors = [from_blob(cached[h]) for h in hashes]
+        misses = len(missing)
+        return vectors, len(texts) - misses, misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with_stats(texts)[0]
+
+    def _memory_query(self, key: str, start: float):
+        vector = self.query_cache.get(key)
+        if vector is not None:
+            self.query_cache.record("memory", time.perf_counter() - start)
+        return vector
+
+    def _shared_query(self, key: str, start: float):
+        # Primary-key read; WAL readers never wait on writers, but the pool can make us wait
+        blob = get_cached_embeddings(self.query_model_key, [key]).get(key)
+        if blob is None:
+            return None
+        vector = from_blob(blob)
+        self.query_cache.put(key, vector)
+        self.query_cache.record("shared", time.perf_counter() - start)
+        return vector
+
+    def _cached_query(self, key: str):
+        start = time.perf_counter()
+        vector = self._memory_query(key, start)
+        if vector is None and self.shared_query_cache:
+            vector = self._shared_query(key, start)
+        return vector
+
+    def _store_shared(self, key: str, vector: List[float]):
+        try:
+            insert_cached_embeddings(self.query_model_key, [(key, to_blob(vector))])
+        except Exception as e:
+            print(f"Error storing query embedding in the shared cache: {e}")
+
+    def _store_query(self, key: str, vector: List[float], seconds: float):
+        self.query_cache.put(key, vector)
+        self.query_cache.record("miss", seconds)
+        if self.shared_query_cache:
+            self._store_shared(key, vector)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_hash(normalize_query(text))
+        vector = self._cached_query(key)
+        if vector is None:
+            start = time.perf_counter()
+            vector = self.underlying.embed_query(text)
+            self._store_query(key, vector, time.perf_counter() - start)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Like embed_query, but the SQLite tier runs off the event loop: a pool wait
+        or a busy writer must not stall every request in the worker."""
+        key = text_hash(normalize_query(text))
+        start = time.perf_counter()
+        vector = self._memory_query(key, start)
+        if vector is None and self.shared_query_cache:
+            vector = await asyncio.to_thread(self._shared_query, key, start)
+        if vector is None:
+            start = time.perf_counter()
+            vector = await self.underlying.aembed_query(text)
+            # The answer does not wait for the store, which includes the shared-cache write
+            future = asyncio.get_running_loop().run_in_executor(
+                None, self._store_query, key, vector, time.perf_counter() - start)
+            self._store_futures.add(future)
+            future.add_done_callback(self._store_done)
+        return vector
+
+    def _store_done(self, future):
+        self._store_futures.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error storing query embedding: {future.exception()}")
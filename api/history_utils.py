@@ -0,0 +1,138 @@
+import os
+import threading
+from functools import partial
+import tiktoken
+from .db_utils import get_chat_turns, get_session_summary, upsert_session_summary
+from .log_utils import application_log_writer, with_pending_turns
+from .openai_utils import get_sync_client, get_async_client
+from .metrics_utils import STAGE_SECONDS
+
+# Tokens of verbatim recent turns sent with each question
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# The rolling summary of older turns is capped separately
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+# Per-message overhead of the chat format, on top of the content tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+summary_prompt = (
+    "You maintain a running summary of a tutoring conversation between a student "
+    "and an AI assistant about physics course material. Update the summary with the "
+    "new turns below. Keep names, definitions, formulas and open questions the "
+    "student may refer back to. Reply with the updated summary only, in at most "
+    "{max_words} words.\n\nCurrent summary:\n{summary}\n\nNew turns:\n{turns}"
+)
+
+_encoding = None
+_summary_llm = None
+# Sessions whose summary is being updated; one update per session at a time
+_summarizing = set()
+_summarizing_guard = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+def turn_tokens(turn) -> int:
+    return (count_tokens(turn['user_query']) + count_tokens(turn['gpt_response'])
+            + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+def split_history_window(turns, budget=HISTORY_TOKEN_BUDGET):
+    """Split turns (oldest first) into (older, recent), where recent is the longest
+    run of newest turns that fits ``budget`` tokens."""
+    used = 0
+    start = len(turns)
+    while start > 0:
+        tokens = turn_tokens(turns[start - 1])
+        if used + tokens > budget:
+            break
+        used += tokens
+        start -= 1
+    return turns[:start], turns[start:]
+
+def build_chat_history(session_id):
+    """Return (messages, history_tokens) for the prompt: the rolling summary of
+    older turns, if any, followed by the recent turns that fit the budget."""
+    summary = get_session_summary(session_id)
+    summarized_until = summary['summarized_until'] if summary else 0
+    # Turns already folded into the summary are never loaded again; queued ones are not written yet
+    turns = with_pending_turns(session_id, partial(get_chat_turns, session_id, after_id=summarized_until))
+    _, recent = split_history_window(turns)
+
+    messages = []
+    history_tokens = 0
+    if summary and summary['summary']:
+        content = f"Summary of the earlier conversation: {summary['summary']}"
+        messages.append({"role": "system", "content": content})
+        history_tokens += count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for turn in recent:
+        messages.extend([
+            {"role": "human", "content": turn['user_query']},
+            {"role": "ai", "content": turn['gpt_response']}
+        ])
+        history_tokens += turn_tokens(turn)
+    return messages, history_tokens
+
+def get_summary_llm():
+    global _summary_llm
+    if _summary_llm is None:
+        from langchain_openai import ChatOpenAI
+        _summary_llm = ChatOpenAI(
+            model=HISTORY_SUMMARY_MODEL,
+            max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+            client=get_sync_client().chat.completions,
+            async_client=get_async_client().chat.completions
+        )
+    return _summary_llm
+
+def _claim_session(session_id):
+    with _summarizing_guard:
+        if session_id in _summarizing:
+            return False
+        _summarizing.add(session_id)
+        return True
+
+def update_session_summary(session_id):
+    """Fold turns that have dropped out of the history window into the stored summary.
+
+    Runs after the response has been sent. Only the newly dropped turns are sent
+    to the model together with the previous summary, so the cost does not grow
+    with the length of the session.
+    """
+    if not _claim_session(session_id):
+        return  # another request is already updating this session
+    try:
+        summary = get_session_summary(session_id)
+        summarized_until = summary['summarized_until'] if summary else 0
+        read_turns = partial(get_chat_turns, session_id, after_id=summarized_until)
+        turns = with_pending_turns(session_id, read_turns)
+        older, _ = split_history_window(turns)
+        if not older:
+            return
+        if any(turn['id'] is None for turn in older):
+            # The summary records the id of the last folded turn, so queued ones must be written first
+            application_log_writer.flush()
+            older, _ = split_history_window(read_turns())
+            if not older:
+                return
+
+        transcript = "\n".join(
+            f"Student: {turn['user_query']}\nAssistant: {turn['gpt_response']}" for turn in older
+        )
+        prompt = summary_prompt.format(
+            max_words=int(HISTORY_SUMMARY_MAX_TOKENS * 0.75),
+            summary=summary['summary'] if summary else "(none yet)",
+            turns=transcript
+        )
+        with STAGE_SECONDS.labels("summarize", HISTORY_SUMMARY_MODEL).time():
+            new_summary = get_summary_llm().invoke(prompt).content
+        upsert_session_summary(session_id, new_summary, older[-1]['id'])
+        print(f"Summarized {len(older)} turns for session {session_id}")
+    except Exception as e:
+        print(f"Error updating summary for session {session_id}: {e}")
+    finally:
+        with _summarizing_guard:
+            _summarizing.discard(session_id)
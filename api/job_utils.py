@@ -0,0 +1,153 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .db_utils import (
+    insert_ingestion_job, update_ingestion_job, get_ingestion_job,
+    get_unfinished_ingestion_jobs, delete_document_record, update_document_record,
+    upsert_ingestion_profile
+)
+from .chroma_utils import index_document_to_chroma, delete_doc_from_chroma
+from .admission_utils import yield_to_chat
+
+# Indexing is CPU and upstream heavy, so only a few documents are processed at once
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "2"))
+
+# Uploads wait here until their job finishes; /data survives restarts on Render
+UPLOAD_DIR = "/data/uploads" if os.access("/data", os.W_OK) else "./uploads"
+
+_executor = ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix="ingest")
+# Futures of jobs queued or running in this process, for upload admission
+_pending = set()
+_pending_lock = threading.Lock()
+# file_ids whose replace upload is being received by this process
+_replacing = set()
+
+def new_job_id():
+    return str(uuid.uuid4())
+
+def upload_path(job_id, filename):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_DIR, f"temp_{job_id}_{os.path.basename(filename)}")
+
+def submit_ingestion_job(job_id, file_id, filename, file_path, kind='index', content_hash=None):
+    """Persist a queued job and hand it to the worker pool; returns the pool future.
+
+    ``kind='replace'`` re-indexes an existing file_id from a new version of the
+    document, and records ``content_hash`` for it once that succeeds. Returns None
+    instead when another job for that file_id is already queued or running."""
+    if not insert_ingestion_job(job_id, file_id, filename, file_path, kind, content_hash):
+        return None
+    return _submit(job_id)
+
+def claim_replace(file_id):
+    """Reserve ``file_id`` for a replace upload in this process, before its body is
+    read. Returns False when another replace of it is already being received."""
+    with _pending_lock:
+        if file_id in _replacing:
+            return False
+        _replacing.add(file_id)
+        return True
+
+def release_replace(file_id):
+    with _pending_lock:
+        _replacing.discard(file_id)
+
+def _submit(job_id):
+    future = _executor.submit(run_ingestion_job, job_id)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_job_done)
+    return future
+
+def _job_done(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+def pending_ingestion_jobs():
+    with _pending_lock:
+        return len(_pending)
+
+def build_ingestion_profile(job, stats, file_bytes, total_seconds):
+    return {
+        'file_id': job['file_id'],
+        'job_id': job['id'],
+        'filename': job['filename'],
+        'file_type': os.path.splitext(job['filename'])[1].lower().lstrip('.'),
+        'bytes': file_bytes,
+        'pages': stats['pages'],
+        'chunks': stats['chunks'],
+        'embed_batches': stats['embed_batches'],
+        'embed_retries': stats['embed_retries'],
+        'cache_hits': stats['cache_hits'],
+        'cache_misses': stats['cache_misses'],
+        'stage_seconds': stats['stage_seconds'],
+        'worker_seconds': stats['worker_seconds'],
+        'total_seconds': round(total_seconds, 3),
+        'chunks_per_second': round(stats['chunks'] / total_seconds, 1) if total_seconds else None,
+        'peak_rss_mb': round(stats['peak_rss_mb'], 1),
+        'peak_worker_rss_mb': round(stats['peak_worker_rss_mb'], 1),
+    }
+
+def run_ingestion_job(job_id):
+    job = get_ingestion_job(job_id)
+    if not job or job['state'] not in ('queued', 'running'):
+        return
+    print(f"Starting ingestion job {job_id} for file_id {job['file_id']}")
+    update_ingestion_job(job_id, state='running', chunks_processed=0)
+
+    def progress(chunks_processed, chunks_total, stage_seconds):
+        update_ingestion_job(job_id, chunks_processed=chunks_processed, chunks_total=chunks_total,
+                             stage_seconds=stage_seconds)
+        # Chat requests go first: hold the next batch while any are queued for a slot
+        if chunks_total is None:
+            yield_to_chat()
+
+    # A failed replace leaves the previous version indexed, so its record must stay
+    replace = job['kind'] == 'replace'
+    try:
+        started = time.perf_counter()
+        file_bytes = os.path.getsize(job['file_path'])
+        stats = index_document_to_chroma(job['file_path'], job['file_id'], progress=progress, replace=replace)
+        if stats:
+            profile = build_ingestion_profile(job, stats, file_bytes, time.perf_counter() - started)
+            upsert_ingestion_profile(profile)
+            if replace:
+                update_document_record(job['file_id'], job['filename'], job['content_hash'])
+            update_ingestion_job(job_id, state='completed', result=stats)
+            print(f"Ingestion job {job_id} completed: {profile['pages']} pages, {profile['chunks']} chunks "
+                  f"in {profile['total_seconds']}s ({profile['chunks_per_second']} chunks/s)")
+        else:
+            if not replace:
+                delete_document_record(job['file_id'])
+            update_ingestion_job(job_id, state='failed', error="Failed to index document in Chroma")
+    except Exception as e:
+        print(f"Error in ingestion job {job_id}: {e}")
+        if not replace:
+            delete_document_record(job['file_id'])
+        update_ingestion_job(job_id, state='failed', error=str(e))
+    finally:
+        if os.path.exists(job['file_path']):
+            os.remove(job['file_path'])
+
+def resume_ingestion_jobs():
+    """Re-queue jobs that were queued or running when the process stopped."""
+    for job in get_unfinished_ingestion_jobs():
+        if os.path.exists(job['file_path']):
+            print(f"Resuming ingestion job {job['id']} for file_id {job['file_id']}")
+            # Drop chunks written by the interrupted run before indexing again. A replace
+            # needs no cleanup: chunks it already wrote simply match on the next diff.
+            if job['kind'] != 'replace':
+                delete_doc_from_chroma(job['file_id'])
+            update_ingestion_job(job['id'], state='queued', chunks_processed=0)
+            _submit(job['id'])
+        else:
+            print(f"Upload for ingestion job {job['id']} is gone, marking it failed")
+            if job['kind'] != 'replace':
+                delete_document_record(job['file_id'])
+            update_ingestion_job(job['id'], state='failed', error="Uploaded file was lost before indexing finished")
+
+def shutdown_ingestion_jobs():
+    # Unfinished jobs stay queued/running in SQLite and are resumed on the next start
+    _executor.shutdown(wait=False, cancel_futures=True)
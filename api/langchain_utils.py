@@ -1,13 +1,54 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun, BaseCallbackHandler
+)
+from langchain_core.outputs import LLMResult
 from typing import List
 from langchain_core.documents import Document
 import os
-from .chroma_utils import vectorstore
-retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
+import time
+import threading
+from .chroma_utils import get_vectorstore
+from .context_utils import pack_context
+from .metrics_utils import STAGE_SECONDS, LLM_TOKENS, RETRIEVAL_SECONDS
+from .openai_utils import get_sync_client, get_async_client
+from .pydantic_models import ModelName
+
+class AsyncEmbeddingRetriever(VectorStoreRetriever):
+    """Retriever whose async path awaits the query embedding instead of
+    running the whole similarity search in an executor thread. Both paths time
+    the query embedding and the vector search separately."""
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start = time.perf_counter()
+        embedding = await self.vectorstore.embeddings.aembed_query(query)
+        embedded = time.perf_counter()
+        docs = await self.vectorstore.asimilarity_search_by_vector(embedding, **self.search_kwargs)
+        RETRIEVAL_SECONDS.labels("query_embed").observe(embedded - start)
+        RETRIEVAL_SECONDS.labels("vector_search").observe(time.perf_counter() - embedded)
+        return docs
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        start = time.perf_counter()
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+        docs = self.vectorstore.similarity_search_by_vector(embedding, **self.search_kwargs)
+        RETRIEVAL_SECONDS.labels("query_embed").observe(embedded - start)
+        RETRIEVAL_SECONDS.labels("vector_search").observe(time.perf_counter() - embedded)
+        return docs
+
+# Chunks retrieved per question; pack_context merges, dedupes and trims them to the token budget
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
+
+def get_retriever(k=RETRIEVER_K):
+    return AsyncEmbeddingRetriever(vectorstore=get_vectorstore(), search_kwargs={"k": k})
 
 output_parser = StrOutputParser()
 
@@ -40,9 +81,113 @@ qa_prompt = ChatPromptTemplate.from_messages([
 
 
 
-def get_rag_chain(model="gpt-4o-mini"):
-    llm = ChatOpenAI(model=model)
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)    
+class TokenUsageHandler(BaseCallbackHandler):
+    """Adds up the token usage reported by every LLM call in one chain run."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        with self._lock:
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+
+
+
+class ChainMetricsHandler(TokenUsageHandler):
+    """Token usage plus per-stage timings for one chain run, exported to Prometheus.
+
+    LLM stages are told apart by the run names set in build_rag_chain.
+    """
+
+    LLM_STAGES = {"contextualize_llm": "contextualize", "answer_llm": "generate"}
+
+    def __init__(self, model: str):
+        super().__init__()
+        self.model = model
+        self.stage_seconds = {}
+        self._started = {}
+
+    def _start(self, run_id, stage):
+        if stage:
+            self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id):
+        started = self._started.pop(run_id, None)
+        if started:
+            stage, start = started
+            seconds = time.perf_counter() - start
+            STAGE_SECONDS.labels(stage, self.model).observe(seconds)
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def stage_summary(self):
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_seconds.items()}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id, self.LLM_STAGES.get(kwargs.get("name")))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id, self.LLM_STAGES.get(kwargs.get("name")))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        super().on_llm_end(response, run_id=run_id, **kwargs)
+        LLM_TOKENS.labels(self.model, "in").inc(usage.get("prompt_tokens", 0))
+        LLM_TOKENS.labels(self.model, "out").inc(usage.get("completion_tokens", 0))
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs) -> None:
+        self._start(run_id, "retrieve")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+
+
+# One chain per model, built on first use and shared by every request
+_rag_chains = {}
+_rag_chains_lock = threading.Lock()
+
+def build_rag_chain(model: ModelName, llm=None):
+    # langchain.chains and langchain_openai are slow to import; only chain building needs them
+    from langchain.chains import create_history_aware_retriever
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    if llm is None:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(
+            model=model.value,
+            client=get_sync_client().chat.completions,
+            async_client=get_async_client().chat.completions
+        )
+    # Run names let ChainMetricsHandler tell the two LLM calls apart
+    history_aware_retriever = create_history_aware_retriever(
+        llm.with_config(run_name="contextualize_llm"), get_retriever(), contextualize_q_prompt)
+    question_answer_chain = create_stuff_documents_chain(llm.with_config(run_name="answer_llm"), qa_prompt)
+    # create_retrieval_chain with a packing step between retrieval and the answer:
+    # "retrieved" holds what the retriever returned, "context" what the model is sent
+    return (
+        RunnablePassthrough.assign(retrieved=history_aware_retriever.with_config(run_name="retrieve_documents"))
+        .assign(packing=RunnableLambda(lambda x: pack_context(x["retrieved"])).with_config(run_name="pack_context"))
+        .assign(context=lambda x: x["packing"]["documents"])
+        .assign(answer=question_answer_chain)
+    ).with_config(run_name="retrieval_chain")
+
+def get_rag_chain(model=ModelName.GPT4_O_MINI):
+    model = ModelName(model)
+    rag_chain = _rag_chains.get(model)
+    if rag_chain is None:
+        with _rag_chains_lock:
+            rag_chain = _rag_chains.get(model)
+            if rag_chain is None:
+                rag_chain = build_rag_chain(model)
+                _rag_chains[model] = rag_chain
     return rag_chain
@@ -0,0 +1,108 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# 0 keeps torch's default (one thread per core)
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))
+LOCAL_EMBEDDING_QUANTIZE = os.getenv("LOCAL_EMBEDDING_QUANTIZE", "false").lower() == "true"
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+# How long the batcher waits for more requests before running a partial batch
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers model running on CPU in this process.
+
+    All calls go through one batching thread: requests that arrive within
+    ``max_wait_ms`` of each other are encoded together (up to ``batch_size``
+    texts), so concurrent single-query calls share one forward pass. With
+    ``quantize`` the model's Linear layers are converted to dynamic int8.
+    """
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, threads: int = LOCAL_EMBEDDING_THREADS,
+                 quantize: bool = LOCAL_EMBEDDING_QUANTIZE, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+                 max_wait_ms: float = LOCAL_EMBEDDING_MAX_WAIT_MS):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local needs sentence-transformers and torch "
+                "(pip install sentence-transformers)"
+            ) from e
+
+        if threads:
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        # Quantized vectors differ slightly, so they get their own cache key and collection tag
+        self.model_name = f"{model_name}-int8" if quantize else model_name
+        self.dimension = model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="local-embeddings", daemon=True)
+        self._worker.start()
+        print(f"Loaded local embedding model {self.model_name} ({self.dimension} dimensions, "
+              f"{torch.get_num_threads()} threads)")
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        count = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                vectors = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                            normalize_embeddings=True, show_progress_bar=False).tolist()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def _submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self._requests.put((list(texts), future))
+        return future
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
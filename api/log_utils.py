@@ -0,0 +1,291 @@
+import os
+import gzip
+import json
+import glob
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from .db_utils import (
+    insert_application_logs, insert_application_logs_batch, move_application_logs_before,
+    restore_application_logs
+)
+from .metrics_utils import APPLICATION_LOG_WRITES, APPLICATION_LOGS_ARCHIVED
+
+# Chat turns are written by a background thread in batched transactions instead of on the request path
+LOG_WRITE_BEHIND_ENABLED = os.getenv("LOG_WRITE_BEHIND_ENABLED", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+# Rows older than this move from application_logs to the archive; 0 keeps everything in SQLite
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "90"))
+LOG_ARCHIVE_INTERVAL_HOURS = float(os.getenv("LOG_ARCHIVE_INTERVAL_HOURS", "24"))
+# Restored rows stay in SQLite this long after the restore before retention archives them again
+LOG_RESTORE_HOLD_DAYS = float(os.getenv("LOG_RESTORE_HOLD_DAYS", "7"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR") or (
+    "/data/log_archive" if os.access("/data", os.W_OK) else "./log_archive")
+ARCHIVE_BATCH_ROWS = 5000
+
+_STOP = object()
+
+def log_timestamp():
+    # Same layout as SQLite's CURRENT_TIMESTAMP (UTC), with microseconds so turns keep their order
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+class ApplicationLogWriter:
+    """Write-behind queue for application_logs.
+
+    submit() only appends to a bounded queue; one thread drains whatever has
+    accumulated (up to LOG_BATCH_SIZE rows) and writes it in one transaction,
+    so concurrent chats share a commit. Until a turn is written it is kept in
+    ``_pending`` so history reads in this process still see it. A full queue
+    or a stopped writer makes submit() return False, and the caller writes
+    synchronously instead; turns are never dropped to keep the queue short.
+    """
+
+    def __init__(self, max_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def start(self):
+        if LOG_WRITE_BEHIND_ENABLED and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, session_id, user_query, gpt_response, model, complete=True):
+        if self._thread is None:
+            return False
+        entry = {'session_id': session_id, 'user_query': user_query, 'gpt_response': gpt_response,
+                 'model': model, 'created_at': log_timestamp(), 'complete': complete}
+        with self._lock:
+            # Checked again under the lock: nothing may be queued behind stop()'s _STOP
+            if self._thread is None:
+                return False
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                APPLICATION_LOG_WRITES.labels("sync").inc()
+                return False
+            self._pending.setdefault(session_id, []).append(entry)
+        APPLICATION_LOG_WRITES.labels("queued").inc()
+        return True
+
+    def pending(self, session_id):
+        """Turns of ``session_id`` submitted here but not yet committed, oldest first."""
+        with self._lock:
+            return list(self._pending.get(session_id, ()))
+
+    def flush(self, timeout=10):
+        """Block until everything submitted before the call is committed."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout=10):
+        """Write what is still queued and stop the thread; later turns are written synchronously."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        # submit() queues under the lock only while _thread is set, so _STOP is last;
+        # it is put outside the lock because the writer needs the lock to drain a full queue
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Whatever queued up during the previous commit goes into this one
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [item for item in batch if isinstance(item, dict)]
+            if entries:
+                self._write(entries)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is _STOP for item in batch):
+                return
+
+    def _write(self, entries):
+        rows = [(e['session_id'], e['user_query'], e['gpt_response'], e['model'], e['created_at'], int(e['complete']))
+                for e in entries]
+        for attempt in range(3):
+            try:
+                insert_application_logs_batch(rows)
+                self.written += len(rows)
+                self.batches += 1
+                break
+            except Exception as e:
+                print(f"Error writing {len(rows)} application logs (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * 2 ** attempt)
+        else:
+            # One bad row must not take the rest of the batch with it
+            for row in rows:
+                try:
+                    insert_application_logs_batch([row])
+                    self.written += 1
+                except Exception as e:
+                    self.failed += 1
+                    APPLICATION_LOG_WRITES.labels("failed").inc()
+                    print(f"Error writing application log for session {row[0]} at {row[4]}: {e}; "
+                          f"user_query={row[1]!r} model={row[3]}")
+        written = {id(entry) for entry in entries}
+        with self._lock:
+            for session_id in {entry['session_id'] for entry in entries}:
+                remaining = [e for e in self._pending.get(session_id, ()) if id(e) not in written]
+                if remaining:
+                    self._pending[session_id] = remaining
+                else:
+                    self._pending.pop(session_id, None)
+
+    def stats(self):
+        return {
+            'enabled': self._thread is not None,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'avg_batch_rows': round(self.written / self.batches, 1) if self.batches else 0.0,
+            'failed': self.failed,
+        }
+
+application_log_writer = ApplicationLogWriter()
+
+def write_application_log(session_id, user_query, gpt_response, model, complete=True):
+    """Queue a chat turn for the writer, or insert it now when the queue cannot take it.
+    ``complete=False`` records an answer that was cut short; history reads skip it."""
+    if not application_log_writer.submit(session_id, user_query, gpt_response, model, complete):
+        insert_application_logs(session_id, user_query, gpt_response, model, complete)
+
+def with_pending_turns(session_id, read_turns):
+    """Return ``read_turns()`` followed by this process's turns that are still queued.
+
+    The queue is read first: a turn committed between the two reads then shows
+    up in the database rows and is dropped from the queued ones by its timestamp.
+    Another worker's queued turns are not visible; the writer commits within
+    milliseconds, so only a follow-up sent in that window misses its last turn.
+    """
+    pending = application_log_writer.pending(session_id)
+    turns = read_turns()
+    if pending:
+        written = {(turn['created_at'], turn['user_query']) for turn in turns}
+        turns += [{'id': None, 'user_query': e['user_query'], 'gpt_response': e['gpt_response'],
+                   'created_at': e['created_at']}
+                  for e in pending if e['complete'] and (e['created_at'], e['user_query']) not in written]
+    return turns
+
+def archive_path(day):
+    return os.path.join(LOG_ARCHIVE_DIR, f"application_logs-{day}.jsonl.gz")
+
+def _append_to_archive(rows):
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(str(row['created_at'])[:10], []).append(row)
+    for day, day_rows in by_day.items():
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in day_rows).encode("utf-8")
+        # Each call appends a gzip member; readers see the concatenation as one stream
+        with open(archive_path(day), "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+                archive.write(payload)
+            raw.flush()
+            os.fsync(raw.fileno())
+    return sorted(by_day)
+
+def archive_application_logs(retention_days=LOG_RETENTION_DAYS, restore_hold_days=LOG_RESTORE_HOLD_DAYS):
+    """Move application_logs rows older than ``retention_days`` into one gzip JSONL
+    file per day of created_at, in batches that are written and fsynced before
+    they are deleted. Rows restored less than ``restore_hold_days`` ago stay.
+    Returns the number of rows moved and the days touched."""
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    restored_before = (now - timedelta(days=restore_hold_days)).strftime('%Y-%m-%d %H:%M:%S')
+    os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+    archived, days = 0, set()
+    while True:
+        moved = move_application_logs_before(cutoff, ARCHIVE_BATCH_ROWS, lambda rows: days.update(_append_to_archive(rows)),
+                                             restored_before)
+        archived += moved
+        if moved < ARCHIVE_BATCH_ROWS:
+            break
+    if archived:
+        APPLICATION_LOGS_ARCHIVED.inc(archived)
+        print(f"Archived {archived} application logs older than {cutoff} into {len(days)} daily files")
+    return {'archived': archived, 'cutoff': cutoff, 'days': sorted(days)}
+
+def _archived_days(start=None, end=None):
+    days = []
+    for path in glob.glob(archive_path("*")):
+        day = os.path.basename(path)[len("application_logs-"):-len(".jsonl.gz")]
+        if (start is None or day >= start) and (end is None or day <= end):
+            days.append(day)
+    return sorted(days)
+
+def list_log_archives():
+    return [{'day': day, 'bytes': os.path.getsize(archive_path(day))} for day in _archived_days()]
+
+def _read_archive(day):
+    # A crash between writing a batch and deleting its rows, or two workers archiving the same
+    # batch, leaves copies of a row; ids tell them apart
+    seen = set()
+    with gzip.open(archive_path(day), "rt", encoding="utf-8") as archive:
+        for line in archive:
+            row = json.loads(line)
+            if row['id'] not in seen:
+                seen.add(row['id'])
+                yield row
+
+def query_archived_logs(start=None, end=None, session_id=None, limit=100):
+    """Archived rows from the days ``start`` to ``end`` (YYYY-MM-DD, inclusive), oldest first."""
+    rows = []
+    for day in _archived_days(start, end):
+        for row in _read_archive(day):
+            if session_id is None or row['session_id'] == session_id:
+                rows.append(row)
+                if len(rows) >= limit:
+                    return rows
+    return rows
+
+def restore_archived_logs(start, end):
+    """Move the archived days ``start`` to ``end`` back into application_logs with
+    their original ids. Retention leaves them there for LOG_RESTORE_HOLD_DAYS,
+    then archives them again if they are still past retention."""
+    restored, days = 0, _archived_days(start, end)
+    for day in days:
+        restored += restore_application_logs(list(_read_archive(day)))
+        os.remove(archive_path(day))
+    print(f"Restored {restored} application logs from {len(days)} archived days")
+    return {'restored': restored, 'days': days}
+
+_retention_stop = threading.Event()
+
+def _retention_loop():
+    # The first run waits a minute so it does not compete with start-up
+    delay = 60
+    while not _retention_stop.wait(delay):
+        try:
+            archive_application_logs()
+        except Exception as e:
+            print(f"Error archiving application logs: {e}")
+        delay = LOG_ARCHIVE_INTERVAL_HOURS * 3600
+
+def start_application_logs():
+    application_log_writer.start()
+    if LOG_RETENTION_DAYS > 0:
+        _retention_stop.clear()
+        threading.Thread(target=_retention_loop, name="log-retention", daemon=True).start()
+
+def stop_application_logs():
+    _retention_stop.set()
+    application_log_writer.stop()
@@ -1,110 +1,488 @@
 import os
+import json
+import asyncio
+import time
+import hashlib
 import uuid
 import logging
 import shutil
+import threading
+from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query, BackgroundTasks
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from .db_utils import (
-    insert_application_logs, get_chat_history, get_all_documents, 
-    insert_document_record, delete_document_record, cleanup_old_documents, get_document_by_id
+    insert_application_logs, get_all_documents, 
+    insert_document_record, delete_document_record, delete_document_records, cleanup_old_documents,
+    get_document_by_id, get_existing_document_ids, count_documents, get_documents_version,
+    get_document_by_hash, get_ingestion_job, get_unfinished_ingestion_jobs, init_db, close_db_pool,
+    get_ingestion_profile, list_ingestion_profiles, PROFILE_ORDERS
+)
+from .pydantic_models import (
+    QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest, DeleteFilesRequest, JobStatus, IngestionProfile
+)
+from .langchain_utils import get_rag_chain, ChainMetricsHandler
+from .history_utils import build_chat_history, update_session_summary
+from .chroma_utils import delete_doc_from_chroma, delete_docs_from_chroma, get_embedding_function
+from .cache_utils import SEMANTIC_CACHE_ENABLED, answer_cache, lookup_answer, store_answer
+from .coalesce_utils import CHAT_COALESCING_ENABLED, chat_flights
+from .embedding_utils import normalize_query
+from .job_utils import (
+    new_job_id, upload_path, submit_ingestion_job, shutdown_ingestion_jobs, pending_ingestion_jobs,
+    claim_replace, release_replace
+)
+from .log_utils import (
+    application_log_writer, write_application_log, start_application_logs, stop_application_logs,
+    archive_application_logs, list_log_archives, query_archived_logs, restore_archived_logs, LOG_RETENTION_DAYS
+)
+from .admission_utils import AdmissionRejected, admit_chat, acquire_chat_slot, admit_upload, admission_stats
+from .startup_utils import start_warm_up, readiness
+from .openai_utils import close_clients
+from .parse_utils import shutdown_parse_pool
+from .metrics_utils import (
+    request_id_var, new_request_id, RequestIdFilter, REQUEST_ID_HEADER, REQUEST_SECONDS, CHAT_SECONDS,
+    CONTEXT_TOKENS, UPLOAD_BYTES, UPLOAD_SIZE, metrics_payload
 )
-from .pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest
-from .langchain_utils import get_rag_chain
-from .chroma_utils import index_document_to_chroma, delete_doc_from_chroma
 
 # Load environment variables from .env file
 load_dotenv()
 
-logging.basicConfig(filename='app.log', level=logging.INFO)
+logging.basicConfig(filename='app.log', level=logging.INFO,
+                    format='%(asctime)s %(levelname)s [%(request_id)s] %(message)s')
+for handler in logging.getLogger().handlers:
+    handler.addFilter(RequestIdFilter())
 
 app = FastAPI()
 
+@app.on_event("startup")
+def startup():
+    init_db()
+    start_application_logs()
+    # Embeddings, Chroma and the chains load in the background; /readyz reports when they are in
+    start_warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_ingestion_jobs()
+    shutdown_parse_pool()
+    # Chat turns still queued for the log writer are written before the pool closes
+    await run_in_threadpool(stop_application_logs)
+    await close_clients()
+    close_db_pool()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Tag the request with an id (echoed in X-Request-ID and every log line) and time it."""
+    request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", str(status)).observe(
+            time.perf_counter() - start)
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Turn work away before starting it; clients retry after Retry-After seconds."""
+    logging.info(f"Rejected {request.url.path} with {exc.status_code}: {exc.detail}")
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """Readiness: 200 once Chroma is open, the collection loaded and the chains built."""
+    state = readiness()
+    if not state["ready"]:
+        response.status_code = 503
+    return dict(state, status="ready" if state["ready"] else ("failed" if state["error"] else "starting"))
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/chat", response_model=QueryResponse)
-def chat(query_input: QueryInput):
+async def chat(query_input: QueryInput, background_tasks: BackgroundTasks):
+    start = time.perf_counter()
     session_id = query_input.session_id
     logging.info(f"Session ID: {session_id}, User Query: {query_input.question}, Model: {query_input.model.value}")
     if not session_id:
         session_id = str(uuid.uuid4())
 
-    chat_history = get_chat_history(session_id)
-    rag_chain = get_rag_chain(query_input.model.value)
-    answer = rag_chain.invoke({
-        "input": query_input.question,
-        "chat_history": chat_history
-    })['answer']
-    
-    insert_application_logs(session_id, query_input.question, answer, query_input.model.value)
-    logging.info(f"Session ID: {session_id}, AI Response: {answer}")
-    return QueryResponse(answer=answer, session_id=session_id, model=query_input.model)
+    # SQLite calls are blocking, so keep them off the event loop
+    chat_history, history_tokens = await run_in_threadpool(build_chat_history, session_id)
 
-@app.post("/upload-doc")
-async def upload_and_index_document(file: UploadFile = File(...)):
+    # Only standalone questions (no history to reformulate against) go through the answer cache
+    use_cache = SEMANTIC_CACHE_ENABLED and query_input.use_cache and not chat_history
+    if use_cache:
+        question_embedding = await get_embedding_function().aembed_query(query_input.question)
+        cached = await run_in_threadpool(lookup_answer, question_embedding, query_input.model.value)
+        if cached:
+            answer = cached['answer']
+            await log_chat_turn(session_id, query_input.question, answer, query_input.model.value)
+            logging.info(f"Session ID: {session_id}, Answer chars: {len(answer)}, Cached: True, Similarity: {cached['similarity']:.3f}")
+            CHAT_SECONDS.labels("chat", query_input.model.value, "true").observe(time.perf_counter() - start)
+            return QueryResponse(answer=answer, session_id=session_id, model=query_input.model,
+                                 prompt_tokens=0, history_tokens=0, cached=True)
+
+    rag_chain = get_rag_chain(query_input.model)
+
+    async def run_chain():
+        usage = ChainMetricsHandler(query_input.model.value)
+        # Only the chain run takes a slot, so coalesced followers and cache hits never queue
+        async with admit_chat(query_input.model):
+            result = await rag_chain.ainvoke({
+                "input": query_input.question,
+                "chat_history": chat_history
+            }, config={"callbacks": [usage]})
+        packing = record_context_packing(query_input.model.value, result['packing']['stats'])
+        if use_cache and result['context']:
+            await run_in_threadpool(store_answer, question_embedding, query_input.model.value,
+                                    result['context'], result['answer'])
+        return result, usage, packing
+
+    if CHAT_COALESCING_ENABLED and not chat_history:
+        # Identical questions arriving together (e.g. a whole class) share one chain run
+        key = (normalize_query(query_input.question), query_input.model.value)
+        (result, usage, packing), coalesced = await chat_flights.run(key, run_chain)
+    else:
+        (result, usage, packing), coalesced = await run_chain(), False
+    answer = result['answer']
+
+    # Every session still gets its own log entry
+    await log_chat_turn(session_id, query_input.question, answer, query_input.model.value)
+    # Fold turns that no longer fit the history budget into the summary after responding
+    background_tasks.add_task(update_session_summary, session_id)
+    logging.info(f"Session ID: {session_id}, Answer chars: {len(answer)}, Prompt tokens: {usage.prompt_tokens}, "
+                 f"History tokens: {history_tokens}, Context tokens: {packing['context_tokens']} "
+                 f"(saved {packing['tokens_saved']}), Coalesced: {coalesced}, Stages: {usage.stage_summary()}")
+    CHAT_SECONDS.labels("chat", query_input.model.value, "false").observe(time.perf_counter() - start)
+    return QueryResponse(
+        answer=answer,
+        session_id=session_id,
+        model=query_input.model,
+        # A coalesced request sent nothing upstream itself
+        prompt_tokens=0 if coalesced else usage.prompt_tokens,
+        history_tokens=history_tokens,
+        context_tokens=packing['context_tokens'],
+        context_tokens_saved=packing['tokens_saved'],
+        coalesced=coalesced
+    )
+
+async def log_chat_turn(session_id, question, answer, model):
+    # Queued for the background writer; only a full queue costs an insert, kept off the event loop
+    if not application_log_writer.submit(session_id, question, answer, model):
+        await run_in_threadpool(insert_application_logs, session_id, question, answer, model)
+
+def record_context_packing(model, stats):
+    CONTEXT_TOKENS.labels(model, "sent").inc(stats['context_tokens'])
+    CONTEXT_TOKENS.labels(model, "saved").inc(stats['tokens_saved'])
+    return stats
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(query_input: QueryInput):
+    """Stream the answer as Server-Sent Events.
+
+    Emits one ``sources`` event with the metadata of the chunks sent as context,
+    a ``token`` event per answer token, and a final ``done`` event carrying the
+    time-to-first-token, the number of chat history and context tokens sent,
+    and the context tokens saved by packing. A cached answer is sent as a single
+    ``token`` event. The full answer is logged once the stream finishes. A stream
+    cut short by an error or a disconnect logs what was sent, marked [aborted] and
+    kept out of later chat history; one that sent nothing is not logged. A
+    generated answer holds a chat admission slot until the stream ends; when none
+    frees up in time the request fails with 429/503 before any event is sent.
+    """
+    session_id = query_input.session_id
+    logging.info(f"Session ID: {session_id}, User Query: {query_input.question}, Model: {query_input.model.value}, Streaming: True")
+    if not session_id:
+        session_id = str(uuid.uuid4())
+
+    chat_history, history_tokens = await run_in_threadpool(build_chat_history, session_id)
+    rag_chain = get_rag_chain(query_input.model)
+    use_cache = SEMANTIC_CACHE_ENABLED and query_input.use_cache and not chat_history
+
+    cached = None
+    if use_cache:
+        question_embedding = await get_embedding_function().aembed_query(query_input.question)
+        cached = await run_in_threadpool(lookup_answer, question_embedding, query_input.model.value)
+    release_slot = None if cached else await acquire_chat_slot(query_input.model)
+
+    usage = ChainMetricsHandler(query_input.model.value)
+    answer_parts = []
+    logged = threading.Event()
+    log_lock = threading.Lock()
+
+    def log_turn_once(answer, complete=True):
+        # The finished stream and the after-response task race only when the client leaves at the very end
+        with log_lock:
+            if logged.is_set():
+                return
+            logged.set()
+        write_application_log(session_id, query_input.question, answer, query_input.model.value, complete)
+
+    def event_stream():
+        start = time.perf_counter()
+        first_token_at = None
+        context_docs = []
+        packing = None
+        try:
+            if cached:
+                first_token_at = time.perf_counter()
+                answer_parts.append(cached['answer'])
+                yield format_sse("sources", {"session_id": session_id, "sources": cached['sources']})
+                yield format_sse("token", {"token": cached['answer']})
+            else:
+                for chunk in rag_chain.stream({
+                    "input": query_input.question,
+                    "chat_history": chat_history
+                }, config={"callbacks": [usage]}):
+                    if "packing" in chunk:
+                        packing = record_context_packing(query_input.model.value, chunk["packing"]["stats"])
+                    if "context" in chunk:
+                        context_docs = chunk["context"]
+                        sources = [doc.metadata for doc in context_docs]
+                        yield format_sse("sources", {"session_id": session_id, "sources": sources})
+                    if "answer" in chunk and chunk["answer"]:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        answer_parts.append(chunk["answer"])
+                        yield format_sse("token", {"token": chunk["answer"]})
+        except Exception as e:
+            print(f"Error while streaming answer: {e}")
+            log_aborted()
+            yield format_sse("error", {"detail": str(e)})
+            return
+
+        answer = "".join(answer_parts)
+        if use_cache and not cached and context_docs:
+            store_answer(question_embedding, query_input.model.value, context_docs, answer)
+        log_turn_once(answer)
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        ttft_ms = round((first_token_at - start) * 1000, 1) if first_token_at else None
+        logging.info(f"Session ID: {session_id}, Answer chars: {len(answer)}, Time to first token: {ttft_ms} ms, "
+                     f"Total: {total_ms} ms, Stages: {usage.stage_summary()}")
+        CHAT_SECONDS.labels("chat_stream", query_input.model.value, str(cached is not None).lower()).observe(
+            total_ms / 1000)
+        yield format_sse("done", {
+            "session_id": session_id,
+            "model": query_input.model.value,
+            "time_to_first_token_ms": ttft_ms,
+            "total_ms": total_ms,
+            "history_tokens": history_tokens,
+            "context_tokens": packing['context_tokens'] if packing else None,
+            "context_tokens_saved": packing['tokens_saved'] if packing else None,
+            "cached": cached is not None
+        })
+
+    async def release():
+        # Runs on the event loop after the stream ends, also when the client went away
+        if release_slot:
+            release_slot()
+
+    def log_aborted():
+        # Also runs after the response when the client disconnected mid-stream, which leaves the
+        # generator suspended for good. The turn keeps what was sent so far, flagged incomplete so
+        # it is never fed back to the model; a stream that sent nothing leaves no turn at all.
+        if answer_parts:
+            log_turn_once("".join(answer_parts) + " [aborted]", complete=False)
+
+    background = BackgroundTasks()
+    background.add_task(release)
+    background.add_task(log_aborted)
+    background.add_task(update_session_summary, session_id)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background
+    )
+
+@app.get("/cache-stats")
+def cache_stats():
+    return {
+        "answer_cache": answer_cache.stats(),
+        "chat_coalescing": chat_flights.stats(),
+        "query_embeddings": get_embedding_function().query_cache.stats()
+    }
+
+@app.get("/admission-stats")
+def get_admission_stats():
+    """Slots in use, queue depth, average wait and rejections per admission gate."""
+    return dict(admission_stats(), ingestion_jobs_pending=pending_ingestion_jobs())
+
+ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.html']
+# Increase size limit to 25MB
+MAX_FILE_SIZE = 25 * 1024 * 1024
+MAX_BULK_FILES = int(os.getenv("MAX_BULK_FILES", "100"))
+
+async def store_upload(file: UploadFile, replace_file_id: int = None):
+    """Validate and write one upload to disk, then queue it for indexing.
+
+    With ``replace_file_id`` the upload is a new version of that document and is
+    queued as a replace job instead. Returns ``(result, future)``; ``future`` is
+    None when nothing needs indexing. Raises HTTPException for a file that cannot
+    be accepted."""
+    print(f"Upload request received for file: {file.filename}")
+    print(f"Content type: {file.content_type}")
+
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    print(f"File extension: {file_extension}")
+
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unsupported file type. Allowed types are: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+
+    job_id = new_job_id()
+    temp_file_path = upload_path(job_id, file.filename)
+    
+    file_size = 0
+    chunk_size = 1024 * 1024  # 1MB chunks
+    content_hash = hashlib.sha256()
+    queued = False
+    claimed = False
+    
     try:
-        print(f"Upload request received for file: {file.filename}")
-        print(f"Content type: {file.content_type}")
-        
-        allowed_extensions = ['.pdf', '.docx', '.html']
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        # Increase size limit to 25MB
-        MAX_FILE_SIZE = 25 * 1024 * 1024  
-        
-        print(f"File extension: {file_extension}")
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Unsupported file type. Allowed types are: {', '.join(allowed_extensions)}"
-            )
-        
-        base_temp_dir = "/data/temp" if os.access("/data", os.W_OK) else "/tmp"
-        os.makedirs(base_temp_dir, exist_ok=True)
-        temp_file_path = os.path.join(base_temp_dir, f"temp_{file.filename}")
-        
+        if replace_file_id is not None:
+            document = await run_in_threadpool(get_document_by_id, replace_file_id)
+            if not document:
+                raise HTTPException(status_code=404, detail=f"No document with file_id {replace_file_id}")
+            # Claimed before the body is read, so a second replace of the same document is turned away now
+            claimed = claim_replace(replace_file_id)
+            if not claimed or await run_in_threadpool(get_unfinished_ingestion_jobs, replace_file_id):
+                raise HTTPException(status_code=409, detail=f"Document {replace_file_id} is still being indexed")
+
         print(f"Writing to temp file: {temp_file_path}")
-        file_size = 0
-        chunk_size = 1024 * 1024  # 1MB chunks
+        with open(temp_file_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {MAX_FILE_SIZE/(1024*1024)}MB"
+                    )
+                await run_in_threadpool(buffer.write, chunk)
+                content_hash.update(chunk)
+                print(f"Progress: {file_size/(1024*1024):.2f}MB written")
+                
+        print(f"File successfully written. Total size: {file_size/(1024*1024):.2f}MB")
+        UPLOAD_BYTES.inc(file_size)
+        UPLOAD_SIZE.observe(file_size)
+
+        # Byte-identical re-uploads (e.g. the default book after a redeploy) reuse the existing index
+        content_hash = content_hash.hexdigest()
+        if replace_file_id is not None:
+            if content_hash == document['content_hash']:
+                print(f"Replacement for file_id {replace_file_id} is unchanged, skipping indexing")
+                return {
+                    "message": f"File {file.filename} is identical to the indexed version.",
+                    "filename": file.filename,
+                    "file_id": replace_file_id,
+                    "status": "unchanged",
+                    "duplicate": True
+                }, None
+            print(f"Queueing replace job {job_id} for file_id {replace_file_id}...")
+            future = await run_in_threadpool(submit_ingestion_job, job_id, replace_file_id, file.filename,
+                                             temp_file_path, 'replace', content_hash)
+            if future is None:
+                # Another worker queued a replace of this document while the body was read
+                raise HTTPException(status_code=409, detail=f"Document {replace_file_id} is still being indexed")
+            queued = True
+            return {
+                "message": f"File {file.filename} uploaded and queued to replace document {replace_file_id}.",
+                "filename": file.filename,
+                "file_id": replace_file_id,
+                "job_id": job_id,
+                "status": "queued",
+                "duplicate": False,
+                "profile_url": f"/ingestion-profiles/{replace_file_id}"
+            }, future
+
+        existing = await run_in_threadpool(get_document_by_hash, content_hash)
+        if existing:
+            print(f"Duplicate upload of file_id {existing['id']}, skipping indexing")
+            return {
+                "message": f"File {file.filename} is identical to already indexed {existing['filename']}.",
+                "filename": file.filename,
+                "file_id": existing['id'],
+                "status": "duplicate",
+                "duplicate": True,
+                "profile": await run_in_threadpool(get_ingestion_profile, existing['id'])
+            }, None
         
-        try:
-            with open(temp_file_path, "wb") as buffer:
-                while True:
-                    chunk = await file.read(chunk_size)
-                    if not chunk:
-                        break
-                    file_size += len(chunk)
-                    if file_size > MAX_FILE_SIZE:
-                        raise HTTPException(
-                            status_code=413,
-                            detail=f"File too large. Maximum size is {MAX_FILE_SIZE/(1024*1024)}MB"
-                        )
-                    buffer.write(chunk)
-                    print(f"Progress: {file_size/(1024*1024):.2f}MB written")
-                    
-            print(f"File successfully written. Total size: {file_size/(1024*1024):.2f}MB")
-            
-            print("Inserting document record...")
-            file_id = insert_document_record(file.filename)
-            
-            print("Starting Chroma indexing...")
-            success = index_document_to_chroma(temp_file_path, file_id)
+        print("Inserting document record...")
+        file_id = await run_in_threadpool(insert_document_record, file.filename, content_hash)
+        
+        # Parsing, embedding and persisting happen in the ingestion worker pool
+        print(f"Queueing ingestion job {job_id}...")
+        future = await run_in_threadpool(submit_ingestion_job, job_id, file_id, file.filename, temp_file_path)
+        queued = True
+        return {
+            "message": f"File {file.filename} uploaded and queued for indexing.",
+            "filename": file.filename,
+            "file_id": file_id,
+            "job_id": job_id,
+            "status": "queued",
+            "duplicate": False,
+            "profile_url": f"/ingestion-profiles/{file_id}"
+        }, future
             
-            if success:
-                return {
-                    "message": f"File {file.filename} uploaded and indexed.",
-                    "file_id": file_id
-                }
-            else:
-                print("Failed to index document")
-                delete_document_record(file_id)
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to index document in Chroma"
-                )
-                
-        finally:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                print("Cleaned up temp file")
-                
+    finally:
+        if claimed:
+            release_replace(replace_file_id)
+        if not queued and os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+            print("Cleaned up temp file")
+
+async def finish_upload(result, future):
+    """Wait for a queued ingestion job and fold its outcome into ``result``."""
+    if future is None:
+        return result
+    await asyncio.wrap_future(future)
+    job = await run_in_threadpool(get_ingestion_job, result['job_id'])
+    result = dict(result, status=job['state'], error=job['error'],
+                  message=f"File {result['filename']} uploaded and indexing {job['state']}.")
+    result.pop("profile_url", None)
+    if job['kind'] == 'replace' and job['result']:
+        for key in ('chunks_reused', 'chunks_added', 'chunks_removed'):
+            result[key] = job['result'][key]
+    result["profile"] = await run_in_threadpool(get_ingestion_profile, result['file_id'])
+    return result
+
+@app.post("/upload-doc")
+async def upload_and_index_document(file: UploadFile = File(...), wait: bool = Query(False)):
+    """Store the upload and queue it for indexing. With ``wait=true`` the response
+    is sent once indexing has finished and includes the ingestion profile."""
+    try:
+        async with admit_upload(pending_ingestion_jobs()):
+            result, future = await store_upload(file)
+        if wait:
+            return await finish_upload(result, future)
+        return result
+    except (HTTPException, AdmissionRejected):
+        raise
     except Exception as e:
         print(f"Error: {str(e)}")
         import traceback
@@ -114,9 +492,94 @@ async def upload_and_index_document(file: UploadFile = File(...)):
             detail=str(e)
         )
 
+@app.post("/replace-doc")
+async def replace_document(file: UploadFile = File(...), file_id: int = Query(...), wait: bool = Query(False)):
+    """Re-index ``file_id`` from a new version of the document, keeping its id.
+    Only chunks that changed are embedded and written; with ``wait=true`` the
+    response reports how many chunks were reused, added and removed."""
+    try:
+        async with admit_upload(pending_ingestion_jobs()):
+            result, future = await store_upload(file, replace_file_id=file_id)
+        if wait:
+            return await finish_upload(result, future)
+        return result
+    except (HTTPException, AdmissionRejected):
+        raise
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upload-docs")
+async def upload_and_index_documents(files: list[UploadFile] = File(...), wait: bool = Query(False)):
+    """Store several uploads and queue each for indexing. Jobs run in the shared
+    ingestion pool, so at most INDEX_WORKERS documents are indexed at once. A
+    file that is rejected does not fail the others; each gets its own entry in
+    ``results`` in upload order. Admission is decided for the request as a whole."""
+    if len(files) > MAX_BULK_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files. Maximum per request is {MAX_BULK_FILES}")
+
+    # Request bodies are read one file at a time; indexing overlaps in the worker pool
+    pending = []
+    async with admit_upload(pending_ingestion_jobs(), new_jobs=len(files)):
+        for file in files:
+            try:
+                pending.append(await store_upload(file))
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                status_code = e.status_code if isinstance(e, HTTPException) else 500
+                print(f"Rejected {file.filename}: {detail}")
+                pending.append(({"filename": file.filename, "status": "rejected",
+                                 "status_code": status_code, "error": detail}, None))
+
+    if wait:
+        results = await asyncio.gather(*(finish_upload(result, future) for result, future in pending))
+    else:
+        results = [result for result, _ in pending]
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"results": results, "counts": counts}
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job_id: str):
+    job = get_ingestion_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No ingestion job with id {job_id}")
+    return JobStatus(job_id=job['id'], **job)
+
+@app.get("/ingestion-profiles", response_model=list[IngestionProfile])
+def list_profiles(limit: int = Query(50, ge=1, le=1000), order: str = Query("recent")):
+    """Ingestion profiles, newest first by default; ``order`` can also be
+    slowest, lowest_throughput or largest to find pathological documents."""
+    if order not in PROFILE_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of: {', '.join(PROFILE_ORDERS)}")
+    return list_ingestion_profiles(limit, order)
+
+@app.get("/ingestion-profiles/{file_id}", response_model=IngestionProfile)
+def get_profile(file_id: int):
+    profile = get_ingestion_profile(file_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"No ingestion profile for file_id {file_id}")
+    return profile
+
 @app.get("/list-docs", response_model=list[DocumentInfo])
-def list_documents():
-    return get_all_documents()
+def list_documents(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Documents, newest first. The ETag changes whenever a document is added,
+    replaced or deleted, so a client holding the current one gets an empty 304.
+    X-Total-Count carries the total for paging with ``limit``/``offset``."""
+    # Read the version before the rows: a change in between makes the ETag stale, never the list
+    etag = f'W/"documents-{get_documents_version()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    response.headers["X-Total-Count"] = str(count_documents())
+    return get_all_documents(limit, offset)
 
 @app.post("/delete-doc")
 def delete_document(request: DeleteFileRequest):
@@ -162,3 +625,72 @@ async def admin_delete_document(
             return {"error": f"Deleted from Chroma but failed to delete document with file_id {file_id} from the database."}
     else:
         return {"error": f"Failed to delete document with file_id {file_id} from Chroma."}
+
+@app.post("/admin/delete-docs")
+async def admin_delete_documents(
+    request: DeleteFilesRequest,
+    admin_token: str = Header(None, description="Admin authorization token")
+):
+    """Delete many documents with one Chroma pass, one persist and one SQLite transaction."""
+    if admin_token != os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    file_ids = list(dict.fromkeys(request.file_ids))
+    existing = await run_in_threadpool(get_existing_document_ids, file_ids)
+    found = [file_id for file_id in file_ids if file_id in existing]
+    missing = [file_id for file_id in file_ids if file_id not in existing]
+    if not found:
+        return {"message": "No matching documents to delete.", "deleted": [], "not_found": missing, "chunks_deleted": 0}
+
+    chunks_deleted = await run_in_threadpool(delete_docs_from_chroma, found)
+    if chunks_deleted is None:
+        return {"error": f"Failed to delete documents with file_ids {found} from Chroma."}
+    await run_in_threadpool(delete_document_records, found)
+    return {
+        "message": f"Successfully deleted {len(found)} documents from the system.",
+        "deleted": found,
+        "not_found": missing,
+        "chunks_deleted": chunks_deleted
+    }
+
+DAY_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
+def check_admin_token(admin_token):
+    if admin_token != os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/archive-logs")
+async def admin_archive_logs(
+    older_than_days: float = Query(LOG_RETENTION_DAYS, gt=0),
+    admin_token: str = Header(None, description="Admin authorization token")
+):
+    """Move chat logs older than ``older_than_days`` into the daily gzip archive now,
+    instead of waiting for the scheduled retention run."""
+    check_admin_token(admin_token)
+    return await run_in_threadpool(archive_application_logs, older_than_days)
+
+@app.get("/admin/log-archives")
+def admin_list_log_archives(admin_token: str = Header(None, description="Admin authorization token")):
+    check_admin_token(admin_token)
+    return {"archives": list_log_archives(), "writer": application_log_writer.stats()}
+
+@app.get("/admin/archived-logs")
+def admin_query_archived_logs(
+    start: str = Query(None, pattern=DAY_PATTERN, description="First day, YYYY-MM-DD"),
+    end: str = Query(None, pattern=DAY_PATTERN, description="Last day, YYYY-MM-DD"),
+    session_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=10000),
+    admin_token: str = Header(None, description="Admin authorization token")
+):
+    check_admin_token(admin_token)
+    return query_archived_logs(start, end, session_id, limit)
+
+@app.post("/admin/restore-logs")
+async def admin_restore_logs(
+    start: str = Query(..., pattern=DAY_PATTERN, description="First day, YYYY-MM-DD"),
+    end: str = Query(..., pattern=DAY_PATTERN, description="Last day, YYYY-MM-DD"),
+    admin_token: str = Header(None, description="Admin authorization token")
+):
+    """Move archived days back into application_logs."""
+    check_admin_token(admin_token)
+    return await run_in_threadpool(restore_archived_logs, start, end)
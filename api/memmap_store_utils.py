@@ -0,0 +1,364 @@
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from .db_utils import ConnectionPool
+
+MEMMAP_STORE_DIR = os.getenv("MEMMAP_STORE_DIR") or (
+    "/data/memmap_store" if os.access("/data", os.W_OK) else "./memmap_store"
+)
+# int8 keeps one byte per dimension plus a float32 scale per vector; float16 keeps two
+MEMMAP_VECTOR_DTYPE = os.getenv("MEMMAP_VECTOR_DTYPE", "int8").lower()
+# Rows scored per step of a search. The float32 copy of a block should stay small
+# enough to be reused by the allocator; 8192 rows of 1536 dimensions ran 2x slower
+MEMMAP_SEARCH_BLOCK_ROWS = int(os.getenv("MEMMAP_SEARCH_BLOCK_ROWS", "1024"))
+MEMMAP_POOL_SIZE = int(os.getenv("MEMMAP_POOL_SIZE", "4"))
+
+VECTOR_DTYPES = {"int8": np.int8, "float16": np.float16}
+# The vector files grow by at least this many slots at a time
+GROW_SLOTS = 4096
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalize rows to unit length and return (stored rows, per-row scale).
+
+    A stored row times its scale approximates the unit vector, so a dot product
+    with the query is the cosine similarity. int8 rows use symmetric per-row
+    scaling to [-127, 127]; float16 rows are stored as is with scale 1.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    peaks = np.abs(vectors).max(axis=1)
+    # An all-zero vector still gets a non-zero scale; scale 0 marks a free slot
+    scales = np.where(peaks == 0, 1, peaks / 127).astype(np.float32)
+    return np.rint(vectors / scales[:, None]).astype(np.int8), scales
+
+class MemmapVectorStore(VectorStore):
+    """Vector store keeping embeddings in a memory-mapped matrix on disk.
+
+    Vectors live in ``vectors.<dtype>`` as fixed-size rows ("slots") with a
+    float32 scale per slot in ``scales.f32``; chunk ids, text and metadata live
+    in ``store.db`` next to them. Every process maps the same files, so the
+    matrix sits once in the page cache instead of once per worker.
+
+    Search is exact: the query is scored against every slot in blocks of
+    ``MEMMAP_SEARCH_BLOCK_ROWS`` and the top k are picked with argpartition.
+    Deleting a chunk sets its scale to 0 and frees its slot for the next write,
+    so the files do not grow with churn. Writers serialize on the SQLite write
+    lock, which also covers writers in other processes.
+    """
+
+    def __init__(self, directory: str = MEMMAP_STORE_DIR, embedding_function: Optional[Embeddings] = None,
+                 dtype: str = MEMMAP_VECTOR_DTYPE, pool_size: int = MEMMAP_POOL_SIZE):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown MEMMAP_VECTOR_DTYPE {dtype!r}; expected 'int8' or 'float16'")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._embedding_function = embedding_function
+        self._pool = ConnectionPool(os.path.join(directory, "store.db"), pool_size)
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._scales = None
+        self._capacity = 0
+        with self._write() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS chunks
+                            (slot INTEGER PRIMARY KEY,
+                             id TEXT UNIQUE,
+                             file_id INTEGER,
+                             document TEXT,
+                             metadata TEXT)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_file_id ON chunks(file_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_free ON chunks(slot) WHERE id IS NULL')
+            conn.execute('CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute("INSERT OR IGNORE INTO store_meta (key, value) VALUES ('dtype', ?)", (dtype,))
+            conn.execute("INSERT OR IGNORE INTO store_meta (key, value) VALUES ('slots', '0')")
+        meta = self.metadata()
+        if meta["dtype"] != dtype:
+            raise RuntimeError(
+                f"Vector store in {directory} holds {meta['dtype']} vectors but MEMMAP_VECTOR_DTYPE={dtype}. "
+                f"Use a separate MEMMAP_STORE_DIR or re-index."
+            )
+        self.dtype = dtype
+        self.dimension = int(meta["dimension"]) if "dimension" in meta else None
+        self._refresh()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.acquire()
+        try:
+            yield conn
+        finally:
+            self._pool.release(conn)
+
+    @contextmanager
+    def _write(self):
+        """A write transaction holding SQLite's write lock for its whole duration."""
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def metadata(self) -> dict:
+        with self._connection() as conn:
+            return {row['key']: row['value'] for row in conn.execute('SELECT key, value FROM store_meta')}
+
+    def _set_meta(self, conn, key, value):
+        conn.execute('INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def tag_embedding(self, model_name: str, dimension: Optional[int]):
+        """Record the embedding model and refuse to mix models in one store."""
+        meta = self.metadata()
+        tagged_model = meta.get("embedding_model")
+        tagged_dimension = int(meta["dimension"]) if "dimension" in meta else None
+        if tagged_model is None:
+            with self._write() as conn:
+                self._set_meta(conn, "embedding_model", model_name)
+                if dimension is not None and tagged_dimension is None:
+                    self._set_meta(conn, "dimension", dimension)
+                    self.dimension = dimension
+            print(f"Tagged vector store in {self.directory} with embedding model {model_name}")
+            return
+        if tagged_model != model_name or (None not in (tagged_dimension, dimension) and tagged_dimension != dimension):
+            raise RuntimeError(
+                f"Vector store in {self.directory} was built with {tagged_model} ({tagged_dimension} dimensions) "
+                f"but the embedding backend uses {model_name} ({dimension} dimensions). "
+                f"Use a separate MEMMAP_STORE_DIR or re-index the documents."
+            )
+
+    def _paths(self):
+        return (os.path.join(self.directory, f"vectors.{self.dtype}"),
+                os.path.join(self.directory, "scales.f32"))
+
+    def _map(self, capacity: int):
+        vectors_path, scales_path = self._paths()
+        if capacity:
+            self._vectors = np.memmap(vectors_path, dtype=VECTOR_DTYPES[self.dtype], mode="r+",
+                                      shape=(capacity, self.dimension))
+            self._scales = np.memmap(scales_path, dtype=np.float32, mode="r+", shape=(capacity,))
+        self._capacity = capacity
+
+    def _refresh(self, conn=None) -> int:
+        """Return the slot high-water mark, remapping if another process grew the files.
+
+        Pass the connection a caller already holds: borrowing a second one while
+        holding the first can exhaust the pool."""
+        if conn is None:
+            with self._connection() as conn:
+                return self._refresh(conn)
+        row = conn.execute("SELECT value FROM store_meta WHERE key = 'slots'").fetchone()
+        slots = int(row['value'])
+        if slots > self._capacity:
+            with self._lock:
+                if slots > self._capacity:
+                    if self.dimension is None:
+                        self.dimension = int(conn.execute(
+                            "SELECT value FROM store_meta WHERE key = 'dimension'").fetchone()['value'])
+                    row_bytes = self.dimension * np.dtype(VECTOR_DTYPES[self.dtype]).itemsize
+                    self._map(os.path.getsize(self._paths()[0]) // row_bytes)
+        return slots
+
+    def _grow(self, slots: int):
+        """Make both files hold at least ``slots`` rows; call with the write lock held.
+
+        Sizes come from the files, not this process's mapping, since another
+        process may have grown them already."""
+        vectors_path, scales_path = self._paths()
+        row_bytes = self.dimension * np.dtype(VECTOR_DTYPES[self.dtype]).itemsize
+        capacity = os.path.getsize(vectors_path) // row_bytes if os.path.exists(vectors_path) else 0
+        if slots > capacity:
+            capacity = max(slots, capacity * 2, GROW_SLOTS)
+            for path, size in ((vectors_path, capacity * row_bytes), (scales_path, capacity * 4)):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+        if capacity != self._capacity:
+            self._map(capacity)
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[dict], documents: List[str]):
+        """Write chunks with precomputed vectors; an existing id keeps its slot."""
+        if not ids:
+            return
+        rows, scales = quantize(embeddings, self.dtype)
+        with self._lock:
+            index = None
+            try:
+                with self._write() as conn:
+                    if self.dimension is None:
+                        self.dimension = rows.shape[1]
+                        self._set_meta(conn, "dimension", self.dimension)
+                    elif rows.shape[1] != self.dimension:
+                        raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {rows.shape[1]}")
+                    placeholders = ",".join("?" * len(ids))
+                    taken = dict(conn.execute(f'SELECT id, slot FROM chunks WHERE id IN ({placeholders})', ids).fetchall())
+                    new_count = sum(1 for chunk_id in ids if chunk_id not in taken)
+                    free = [row['slot'] for row in conn.execute(
+                        'SELECT slot FROM chunks WHERE id IS NULL ORDER BY slot LIMIT ?', (new_count,))]
+                    high_water = int(conn.execute("SELECT value FROM store_meta WHERE key = 'slots'").fetchone()['value'])
+                    fresh = iter(free + list(range(high_water, high_water + new_count - len(free))))
+                    slots = [taken[chunk_id] if chunk_id in taken else next(fresh) for chunk_id in ids]
+                    high_water = max(high_water, max(slots) + 1)
+                    self._grow(high_water)
+
+                    order = np.argsort(slots)
+                    index = np.asarray(slots)[order]
+                    previous = self._vectors[index]
+                    self._vectors[index] = rows[order]
+                    self._vectors.flush()
+
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO chunks (slot, id, file_id, document, metadata) VALUES (?, ?, ?, ?, ?)',
+                        [(slot, chunk_id, (metadata or {}).get("file_id"), document, json.dumps(metadata or {}))
+                         for slot, chunk_id, metadata, document in zip(slots, ids, metadatas, documents)]
+                    )
+                    self._set_meta(conn, "slots", high_water)
+            except BaseException:
+                if index is not None:
+                    # The rows were rolled back, so the slots keep the vectors they had
+                    self._vectors[index] = previous
+                    self._vectors.flush()
+                raise
+            # The scale goes in last, after the commit: a concurrent search only scores a slot once it is set
+            self._scales[index] = scales[order]
+            self._scales.flush()
+
+    def _free_slots(self, conn, where: str, params) -> int:
+        slots = [row['slot'] for row in conn.execute(f'SELECT slot FROM chunks WHERE id IS NOT NULL AND {where}', params)]
+        if not slots:
+            return 0
+        self._refresh(conn)
+        index = np.asarray(sorted(slots))
+        self._scales[index] = 0
+        self._scales.flush()
+        conn.executemany('UPDATE chunks SET id = NULL, file_id = NULL, document = NULL, metadata = NULL '
+                         'WHERE slot = ?', [(slot,) for slot in slots])
+        return len(slots)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock, self._write() as conn:
+            deleted = self._free_slots(conn, f'id IN ({",".join("?" * len(ids))})', list(ids))
+        return deleted > 0
+
+    def delete_file_ids(self, file_ids: List[int]) -> int:
+        """Delete every chunk of these documents and return how many there were."""
+        with self._lock, self._write() as conn:
+            return self._free_slots(conn, f'file_id IN ({",".join("?" * len(file_ids))})', list(file_ids))
+
+    def get_file_chunks(self, file_id: int):
+        """Return (ids, metadatas, documents) of the chunks stored for file_id."""
+        with self._connection() as conn:
+            rows = conn.execute('SELECT id, document, metadata FROM chunks WHERE file_id = ? ORDER BY slot',
+                                (file_id,)).fetchall()
+        return ([row['id'] for row in rows], [json.loads(row['metadata']) for row in rows],
+                [row['document'] for row in rows])
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        with self._write() as conn:
+            conn.executemany('UPDATE chunks SET metadata = ?, file_id = ? WHERE id = ?',
+                             [(json.dumps(metadata), metadata.get("file_id"), chunk_id)
+                              for chunk_id, metadata in zip(ids, metadatas)])
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM chunks WHERE id IS NOT NULL').fetchone()[0]
+
+    def persist(self):
+        # Writes are flushed as they happen; this only exists for the Chroma-style call sites
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._scales.flush()
+
+    def load(self) -> int:
+        """Read the whole matrix once so the first query does not fault it in."""
+        if self.dimension is not None and self._refresh():
+            self._top_slots(np.zeros(self.dimension, dtype=np.float32), 1)
+        return self.count()
+
+    def _top_slots(self, query: np.ndarray, k: int):
+        """Exact top-k over all live slots; returns (slots, cosine scores), best first."""
+        slots = self._refresh()
+        vectors, scales = self._vectors, self._scales
+        if not slots or vectors is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        candidate_slots, candidate_scores = [], []
+        for start in range(0, slots, MEMMAP_SEARCH_BLOCK_ROWS):
+            stop = min(slots, start + MEMMAP_SEARCH_BLOCK_ROWS)
+            block_scales = np.asarray(scales[start:stop])
+            scores = (vectors[start:stop].astype(np.float32) @ query) * block_scales
+            scores[block_scales == 0] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.isfinite(scores[top])]
+            candidate_slots.append(top + start)
+            candidate_scores.append(scores[top])
+        candidate_slots = np.concatenate(candidate_slots)
+        candidate_scores = np.concatenate(candidate_scores)
+        best = np.argsort(-candidate_scores)[:k]
+        return candidate_slots[best], candidate_scores[best]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        slots, scores = self._top_slots(embedding, k)
+        if not len(slots):
+            return []
+        slots = [int(slot) for slot in slots]
+        with self._connection() as conn:
+            rows = {row['slot']: row for row in conn.execute(
+                f'SELECT slot, id, document, metadata FROM chunks WHERE slot IN ({",".join("?" * len(slots))})',
+                slots)}
+        results = []
+        for slot, score in zip(slots, scores):
+            row = rows.get(slot)
+            # A slot freed between scoring and this lookup is skipped
+            if row is not None and row['id'] is not None:
+                results.append((Document(page_content=row['document'], metadata=json.loads(row['metadata'])),
+                                float(score)))
+        return results
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding_function.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert(ids, self._embedding_function.embed_documents(texts), metadatas, texts)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   directory: str = MEMMAP_STORE_DIR, **kwargs: Any) -> "MemmapVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+import logging
+import functools
+from contextvars import ContextVar
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+)
+
+# Set by the request middleware; carried into threadpool calls and chain callbacks
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+REQUEST_SECONDS = Histogram(
+    "edurag_http_request_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+CHAT_SECONDS = Histogram(
+    "edurag_chat_seconds", "End-to-end chat latency by endpoint and model",
+    ["endpoint", "model", "cached"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "edurag_chain_stage_seconds",
+    "Time spent in each RAG stage (contextualize, retrieve, generate, summarize)",
+    ["stage", "model"], buckets=LATENCY_BUCKETS
+)
+RETRIEVAL_SECONDS = Histogram(
+    "edurag_retrieval_seconds", "Retriever latency split into query embedding and vector search",
+    ["step"], buckets=FAST_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "edurag_llm_tokens_total", "Tokens sent to and received from the chat model",
+    ["model", "direction"]
+)
+CONTEXT_TOKENS = Counter(
+    "edurag_context_tokens_total",
+    "Retrieved-chunk tokens sent to the answer model (sent) and removed by context packing (saved)",
+    ["model", "kind"]
+)
+COALESCED_REQUESTS = Counter(
+    "edurag_coalesced_requests_total",
+    "Requests that started a shared execution (leader) or joined one already in flight (follower)",
+    ["operation", "role"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "edurag_admission_active", "Requests holding an admission slot, by gate",
+    ["gate"], multiprocess_mode="livesum"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "edurag_admission_queue_depth", "Requests waiting for an admission slot, by gate",
+    ["gate"], multiprocess_mode="livesum"
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "edurag_admission_wait_seconds", "Time admitted requests waited for a slot",
+    ["gate"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "edurag_admission_rejected_total",
+    "Requests turned away with 429/503 (queue_full, timeout, chat_priority, backlog)",
+    ["gate", "reason"]
+)
+INGESTION_PAUSE_SECONDS = Counter(
+    "edurag_ingestion_pause_seconds_total", "Time ingestion jobs spent paused so waiting chats go first"
+)
+APPLICATION_LOG_WRITES = Counter(
+    "edurag_application_log_writes_total",
+    "Chat turns handed to the background log writer (queued), written on the request path "
+    "because its queue was full (sync), or lost after repeated write errors (failed)",
+    ["path"]
+)
+APPLICATION_LOGS_ARCHIVED = Counter(
+    "edurag_application_logs_archived_total", "application_logs rows moved to the compressed archive"
+)
+DB_SECONDS = Histogram(
+    "edurag_sqlite_seconds", "SQLite helper latency, including the wait for a pooled connection",
+    ["operation"], buckets=FAST_BUCKETS
+)
+CHROMA_SECONDS = Histogram(
+    "edurag_chroma_seconds", "Chroma indexing and deletion latency",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+STARTUP_SECONDS = Gauge(
+    "edurag_startup_seconds", "Duration of each startup warm-up step in the latest start",
+    ["step"], multiprocess_mode="max"
+)
+UPLOAD_BYTES = Counter("edurag_upload_bytes_total", "Bytes received through document uploads")
+UPLOAD_SIZE = Histogram(
+    "edurag_upload_size_bytes", "Size of uploaded documents",
+    buckets=(1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8)
+)
+
+def timed(histogram, *labels):
+    """Decorator observing the wrapped function's wall time, whether it returns or raises."""
+    def decorator(func):
+        child = histogram.labels(*labels) if labels else histogram
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def db_timed(func):
+    return timed(DB_SECONDS, func.__name__)(func)
+
+def new_request_id(incoming=None):
+    # Accept a caller-supplied id (e.g. from a proxy) if it looks sane
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+def metrics_payload():
+    """Return (body, content type) for /metrics, merging worker processes when
+    PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
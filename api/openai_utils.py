@@ -0,0 +1,50 @@
+import os
+import threading
+import httpx
+
+# Shared keep-alive connection pools for every chat model and the embeddings client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    keepalive_expiry=60
+)
+
+# OPENAI_API_BASE lets the service run against a local OpenAI-compatible stand-in
+client_params = {
+    "base_url": os.getenv("OPENAI_API_BASE") or None,
+    "timeout": OPENAI_TIMEOUT,
+}
+
+# The openai package is slow to import, so the clients are created on first use
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_client(kind):
+    client = _clients.get(kind)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(kind)
+            if client is None:
+                import openai
+                if kind == "sync":
+                    client = openai.OpenAI(http_client=httpx.Client(limits=HTTP_LIMITS), **client_params)
+                else:
+                    client = openai.AsyncOpenAI(http_client=httpx.AsyncClient(limits=HTTP_LIMITS), **client_params)
+                _clients[kind] = client
+    return client
+
+def get_sync_client():
+    return _get_client("sync")
+
+def get_async_client():
+    return _get_client("async")
+
+async def close_clients():
+    if "sync" in _clients:
+        _clients.pop("sync").close()
+    if "async" in _clients:
+        await _clients.pop("async").close()
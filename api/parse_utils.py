@@ -0,0 +1,175 @@
+import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Iterator, List
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+# This module is imported by the parser worker processes, so it must stay free of
+# anything heavy (Chroma, OpenAI clients, SQLite setup).
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "16"))
+# Stop reading ahead while the ingesting process is above this resident size
+INGEST_MAX_RSS_MB = int(os.getenv("INGEST_MAX_RSS_MB", "768"))
+
+# Revert to original chunk sizes
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    length_function=len
+)
+
+_pool = None
+_pool_lock = Lock()
+
+def get_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process runs threads and holds open clients
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def shutdown_parse_pool(wait=False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # No procfs (e.g. macOS): fall back to the peak, which only errs on the safe side
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def peak_rss_mb() -> float:
+    import resource
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def pdf_page_count(file_path: str) -> int:
+    import fitz
+    with fitz.open(file_path) as pdf:
+        return len(pdf)
+
+def read_pdf_pages(file_path: str, start: int, end: int) -> List[Document]:
+    """Extract pages [start, end) of a PDF; metadata matches what PyMuPDFLoader produces."""
+    import fitz
+    with fitz.open(file_path) as pdf:
+        pdf_metadata = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+        pages = []
+        for page_number in range(start, min(end, len(pdf))):
+            page = pdf[page_number]
+            pages.append(Document(
+                page_content=page.get_text(),
+                metadata=dict(
+                    {
+                        "source": file_path,
+                        "file_path": file_path,
+                        "page": page_number,
+                        "total_pages": len(pdf),
+                    },
+                    **pdf_metadata
+                )
+            ))
+    return pages
+
+def split_pdf_pages(file_path: str, start: int, end: int) -> List[Document]:
+    """Extract pages [start, end) of a PDF and split them into chunks."""
+    return text_splitter.split_documents(read_pdf_pages(file_path, start, end))
+
+def split_pdf_pages_profiled(file_path: str, start: int, end: int):
+    """split_pdf_pages for the worker pool, also returning (parse seconds, split
+    seconds, worker peak RSS in MB)."""
+    started = time.perf_counter()
+    pages = read_pdf_pages(file_path, start, end)
+    parsed = time.perf_counter()
+    chunks = text_splitter.split_documents(pages)
+    return chunks, parsed - started, time.perf_counter() - parsed, peak_rss_mb()
+
+def _new_profile():
+    return {"pages": None, "parse_seconds": 0.0, "split_seconds": 0.0, "peak_worker_rss_mb": 0.0}
+
+def iter_pdf_chunks(file_path: str, profile=None) -> Iterator[List[Document]]:
+    """Yield the chunks of each page window in page order.
+
+    Windows are split in the process pool with a bounded number in flight, and
+    read-ahead pauses while the process is over INGEST_MAX_RSS_MB, so memory
+    stays flat however long the PDF is. Worker timings are added to ``profile``.
+    """
+    total_pages = pdf_page_count(file_path)
+    if profile is not None:
+        profile["pages"] = total_pages
+    windows = deque((start, min(start + PAGES_PER_TASK, total_pages))
+                    for start in range(0, total_pages, PAGES_PER_TASK))
+    pool = get_parse_pool()
+    max_in_flight = max(1, PARSE_WORKERS * 2)
+    in_flight = deque()
+
+    try:
+        while windows or in_flight:
+            while windows and len(in_flight) < max_in_flight:
+                if in_flight and current_rss_mb() > INGEST_MAX_RSS_MB:
+                    break
+                start, end = windows.popleft()
+                in_flight.append(pool.submit(split_pdf_pages_profiled, file_path, start, end))
+            chunks, parse_seconds, split_seconds, worker_rss_mb = in_flight.popleft().result()
+            if profile is not None:
+                profile["parse_seconds"] += parse_seconds
+                profile["split_seconds"] += split_seconds
+                profile["peak_worker_rss_mb"] = max(profile["peak_worker_rss_mb"], worker_rss_mb)
+            yield chunks
+    finally:
+        # An aborted upload (a failed window, or the consumer closing us) frees the workers
+        for future in in_flight:
+            future.cancel()
+
+def iter_document_batches(file_path: str, batch_size: int = 100, profile=None) -> Iterator[List[Document]]:
+    """Stream a document as batches of at most ``batch_size`` chunks.
+
+    If ``profile`` is a dict it is filled with the page count (PDF only) and the
+    parse and split seconds (summed across workers for PDFs).
+    """
+    if profile is not None:
+        profile.update(_new_profile())
+    if file_path.endswith('.pdf'):
+        chunk_source = iter_pdf_chunks(file_path, profile)
+    elif file_path.endswith('.docx') or file_path.endswith('.html'):
+        from langchain_community.document_loaders import Docx2txtLoader, UnstructuredHTMLLoader
+        loader = Docx2txtLoader(file_path) if file_path.endswith('.docx') else UnstructuredHTMLLoader(file_path)
+        # These formats are small, so they are loaded whole and only the output is batched
+        started = time.perf_counter()
+        documents = loader.load()
+        parsed = time.perf_counter()
+        chunk_source = iter([text_splitter.split_documents(documents)])
+        if profile is not None:
+            profile["parse_seconds"] = parsed - started
+            profile["split_seconds"] = time.perf_counter() - parsed
+    else:
+        raise ValueError(f"Unsupported file type: {file_path}")
+
+    batch = []
+    try:
+        for chunks in chunk_source:
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+    finally:
+        if hasattr(chunk_source, "close"):
+            chunk_source.close()
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
+from typing import Optional
 
 class ModelName(str, Enum):
     GPT4_O = "gpt-4o"
@@ -10,11 +11,22 @@ class QueryInput(BaseModel):
     question: str
     session_id: str = Field(default=None)
     model: ModelName = Field(default=ModelName.GPT4_O_MINI)
+    # Set to False to skip the semantic answer cache for this request
+    use_cache: bool = Field(default=True)
 
 class QueryResponse(BaseModel):
     answer: str
     session_id: str
     model: ModelName
+    # Prompt tokens sent upstream for this answer, and how many of them were chat history
+    prompt_tokens: Optional[int] = None
+    history_tokens: Optional[int] = None
+    # Tokens of retrieved text in the prompt, and how many context packing removed
+    context_tokens: Optional[int] = None
+    context_tokens_saved: Optional[int] = None
+    cached: bool = False
+    # The answer came from an identical question's chain run that was already in flight
+    coalesced: bool = False
 
 class DocumentInfo(BaseModel):
     id: int
@@ -22,4 +34,43 @@ class DocumentInfo(BaseModel):
     upload_timestamp: datetime
 
 class DeleteFileRequest(BaseModel):
-    file_id: int
\ No newline at end of file
+    file_id: int
+
+class DeleteFilesRequest(BaseModel):
+    file_ids: list[int]
+
+class JobStatus(BaseModel):
+    job_id: str
+    file_id: int
+    filename: str
+    kind: str = "index"
+    state: str
+    chunks_processed: int = 0
+    chunks_total: Optional[int] = None
+    stage_seconds: Optional[dict[str, float]] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class IngestionProfile(BaseModel):
+    file_id: int
+    job_id: Optional[str] = None
+    filename: str
+    file_type: str
+    bytes: int
+    pages: Optional[int] = None
+    chunks: int
+    embed_batches: int
+    embed_retries: int
+    cache_hits: int
+    cache_misses: int
+    # Wall-clock seconds per pipeline stage (load_split, embed, write, persist)
+    stage_seconds: dict[str, float]
+    # Parse and split seconds summed over the parser workers
+    worker_seconds: dict[str, float]
+    total_seconds: float
+    chunks_per_second: Optional[float] = None
+    peak_rss_mb: float
+    peak_worker_rss_mb: float
+    created_at: datetime
@@ -0,0 +1,62 @@
+import os
+import time
+import threading
+from .chroma_utils import get_embedding_function, get_chunk_store
+from .langchain_utils import get_rag_chain, get_retriever
+from .job_utils import resume_ingestion_jobs
+from .pydantic_models import ModelName
+from .metrics_utils import STARTUP_SECONDS
+
+# Optional question sent through the retriever after startup. It primes the query
+# embedding cache and the keep-alive connection to the embeddings API.
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "")
+
+_started = time.perf_counter()
+_state = {"ready": False, "warmed": False, "error": None, "steps": {}, "ready_after_seconds": None}
+_warm_up_thread = None
+
+def _step(name, func):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    _state["steps"][name] = round(seconds, 3)
+    STARTUP_SECONDS.labels(name).set(seconds)
+    print(f"Startup step {name} took {seconds:.2f}s")
+    return result
+
+def load_collection():
+    """Open the vector store and load its vectors, which it otherwise does on the first query."""
+    return get_chunk_store().load()
+
+def warm_up():
+    """Create the heavy components in order. The API is ready once the vector store
+    is open, its vectors loaded and the chains built; the warm-up query runs after that."""
+    try:
+        _step("embeddings", get_embedding_function)
+        chunks = _step("vectorstore", load_collection)
+        _step("chains", lambda: [get_rag_chain(model) for model in ModelName])
+        _state["ready"] = True
+        _state["ready_after_seconds"] = round(time.perf_counter() - _started, 3)
+        print(f"API ready after {_state['ready_after_seconds']}s ({chunks} chunks in the vector store)")
+        _step("resume_jobs", resume_ingestion_jobs)
+    except Exception as e:
+        _state["error"] = f"{type(e).__name__}: {e}"
+        print(f"Startup warm-up failed: {_state['error']}")
+        return
+    if WARMUP_QUERY:
+        try:
+            _step("warmup_query", lambda: get_retriever().invoke(WARMUP_QUERY))
+        except Exception as e:
+            # The service still works; the first real query just pays the cold costs
+            print(f"Warm-up query failed: {e}")
+    _state["warmed"] = True
+
+def start_warm_up():
+    """Run warm_up in the background so the server answers /healthz immediately."""
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        _warm_up_thread.start()
+
+def readiness():
+    return dict(_state, steps=dict(_state["steps"]), uptime_seconds=round(time.perf_counter() - _started, 3))
@@ -1,10 +1,83 @@
 import requests
 import streamlit as st
+import json
 import os
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Get the base URL from an environment variable, with a default for local development
 API_HOST = os.getenv('FAST_API_URL', 'http://localhost:8000')
 
+# (connect, read) timeouts in seconds; the read timeout is per chunk for streamed answers
+REQUEST_TIMEOUT = (5, 30)
+CHAT_TIMEOUT = (5, 120)
+UPLOAD_TIMEOUT = (5, 300)
+
+# How long a document listing is reused before it is revalidated with the API
+DOCUMENT_LIST_TTL = float(os.getenv('DOCUMENT_LIST_TTL', '30'))
+DOCUMENT_PAGE_SIZE = 100
+
+# Total time a request waits out 429/503 responses from API admission control before giving up
+BUSY_RETRY_BUDGET = float(os.getenv('BUSY_RETRY_BUDGET', '20'))
+
+@st.cache_resource
+def get_session():
+    """One keep-alive session per Streamlit process, shared by every rerun and user."""
+    session = requests.Session()
+    # Failed connections are retried for every method; 5xx responses only for idempotent ones
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=20)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def retry_after_seconds(response):
+    """Seconds from a 429/503 response's Retry-After header, or None."""
+    if response.status_code not in (429, 503):
+        return None
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+def post_with_retry_after(url, **kwargs):
+    """POST, waiting out 429/503 responses that carry Retry-After for up to
+    BUSY_RETRY_BUDGET seconds in total. The API sends those before doing any
+    work, so resending is safe even for uploads; file objects are rewound first."""
+    waited = 0.0
+    while True:
+        response = get_session().post(url, **kwargs)
+        delay = retry_after_seconds(response)
+        if delay is None or waited + delay > BUSY_RETRY_BUDGET:
+            return response
+        response.close()
+        print(f"API busy ({response.status_code}), retrying {url} in {delay:g}s")
+        time.sleep(delay)
+        waited += delay
+        files = kwargs.get("files") or {}
+        for _, spec in (files.items() if isinstance(files, dict) else files):
+            spec[1].seek(0)
+
+def busy_message(response):
+    delay = retry_after_seconds(response)
+    if delay is None:
+        return None
+    return f"The server is busy right now. Please try again in {delay:g} seconds."
+
+# Shared by every session: the document list is the same for all users
+_documents_cache = {"etag": None, "documents": None, "checked_at": 0.0}
+
+def invalidate_document_list():
+    # The next list_documents() revalidates; the changed ETag makes it a full fetch
+    _documents_cache["checked_at"] = 0.0
+
 def get_api_response(question, session_id, model):
     headers = {
         'accept': 'application/json',
@@ -18,35 +91,117 @@ def get_api_response(question, session_id, model):
         data["session_id"] = session_id
 
     try:
-        response = requests.post(f"{API_HOST}/chat", headers=headers, json=data)
+        response = post_with_retry_after(f"{API_HOST}/chat", headers=headers, json=data, timeout=CHAT_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
-            st.error(f"API request failed with status code {response.status_code}: {response.text}")
+            st.error(busy_message(response) or
+                     f"API request failed with status code {response.status_code}: {response.text}")
             return None
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
         return None
 
+def stream_api_response(question, session_id, model):
+    """Yield (event, payload) pairs from the /chat/stream Server-Sent Events endpoint."""
+    headers = {
+        'accept': 'text/event-stream',
+        'Content-Type': 'application/json'
+    }
+    data = {
+        "question": question,
+        "model": model
+    }
+    if session_id:
+        data["session_id"] = session_id
+
+    try:
+        with post_with_retry_after(f"{API_HOST}/chat/stream", headers=headers, json=data, stream=True,
+                                   timeout=CHAT_TIMEOUT) as response:
+            if response.status_code != 200:
+                st.error(busy_message(response) or
+                         f"API request failed with status code {response.status_code}: {response.text}")
+                return
+            event = "message"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = "message"
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
 def upload_document(file):
     print("Uploading file...")
     try:
         files = {"file": (file.name, file, file.type)}
-        response = requests.post(f"{API_HOST}/upload-doc", files=files)
+        response = post_with_retry_after(f"{API_HOST}/upload-doc", files=files, timeout=UPLOAD_TIMEOUT)
         if response.status_code == 200:
+            invalidate_document_list()
             return response.json()
         else:
-            st.error(f"Failed to upload file. Error: {response.status_code} - {response.text}")
+            st.error(busy_message(response) or f"Failed to upload file. Error: {response.status_code} - {response.text}")
             return None
     except Exception as e:
         st.error(f"An error occurred while uploading the file: {str(e)}")
         return None
 
-def list_documents():
+def upload_documents(files):
+    """Upload several files in one /upload-docs request; returns the per-file results."""
+    print(f"Uploading {len(files)} files...")
+    try:
+        payload = [("files", (file.name, file, file.type)) for file in files]
+        response = post_with_retry_after(f"{API_HOST}/upload-docs", files=payload, timeout=UPLOAD_TIMEOUT)
+        if response.status_code == 200:
+            invalidate_document_list()
+            return response.json()['results']
+        else:
+            st.error(busy_message(response) or f"Failed to upload files. Error: {response.status_code} - {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"An error occurred while uploading the files: {str(e)}")
+        return None
+
+def get_job_status(job_id):
     try:
-        response = requests.get(f"{API_HOST}/list-docs")
+        response = get_session().get(f"{API_HOST}/jobs/{job_id}", timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
+        else:
+            st.error(f"Failed to fetch indexing status. Error: {response.status_code} - {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"An error occurred while fetching the indexing status: {str(e)}")
+        return None
+
+def list_documents(force=False):
+    """Return the document list, reusing the last one for DOCUMENT_LIST_TTL seconds.
+    After that, or with ``force``, it is revalidated with If-None-Match, which
+    costs an empty 304 when nothing changed."""
+    cache = _documents_cache
+    if not force and cache["documents"] is not None and time.monotonic() - cache["checked_at"] < DOCUMENT_LIST_TTL:
+        return cache["documents"]
+    headers = {"If-None-Match": cache["etag"]} if cache["etag"] and cache["documents"] is not None else {}
+    try:
+        response = get_session().get(f"{API_HOST}/list-docs", params={"limit": DOCUMENT_PAGE_SIZE},
+                                     headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            cache["checked_at"] = time.monotonic()
+            return cache["documents"]
+        if response.status_code == 200:
+            documents = response.json()
+            total = int(response.headers.get("X-Total-Count", len(documents)))
+            while len(documents) < total:
+                page = get_session().get(f"{API_HOST}/list-docs",
+                                         params={"limit": DOCUMENT_PAGE_SIZE, "offset": len(documents)},
+                                         timeout=REQUEST_TIMEOUT)
+                if page.status_code != 200 or not page.json():
+                    break
+                documents.extend(page.json())
+            cache.update(etag=response.headers.get("ETag"), documents=documents, checked_at=time.monotonic())
+            return documents
         else:
             st.error(f"Failed to fetch document list. Error: {response.status_code} - {response.text}")
             return []
@@ -62,8 +217,9 @@ def delete_document(file_id):
     data = {"file_id": file_id}
 
     try:
-        response = requests.post(f"{API_HOST}/delete-doc", headers=headers, json=data)
+        response = get_session().post(f"{API_HOST}/delete-doc", headers=headers, json=data, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
+            invalidate_document_list()
             return response.json()
         else:
             st.error(f"Failed to delete document. Error: {response.status_code} - {response.text}")
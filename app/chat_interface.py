@@ -1,5 +1,6 @@
+import time
 import streamlit as st
-from api_utils import get_api_response
+from api_utils import stream_api_response
 
 def display_chat_interface():
     # Chat interface
@@ -12,21 +13,36 @@ def display_chat_interface():
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        with st.spinner("Generating response..."):
-            response = get_api_response(prompt, st.session_state.session_id, st.session_state.model)
-            
-            if response:
-                st.session_state.session_id = response.get('session_id')
-                
+        with st.chat_message("assistant"):
+            events = {}
+            start = time.perf_counter()
+
+            def token_stream():
+                for event, payload in stream_api_response(prompt, st.session_state.session_id, st.session_state.model):
+                    if event == "token":
+                        if "first_token" not in events:
+                            events["first_token"] = time.perf_counter() - start
+                        yield payload["token"]
+                    elif event == "error":
+                        st.error(f"The answer was interrupted: {payload.get('detail')}")
+                    else:
+                        events[event] = payload
+
+            # Tokens are rendered as they arrive instead of behind a spinner
+            response_content = st.write_stream(token_stream())
+
+            if response_content and "done" in events:
+                st.session_state.session_id = events["done"].get('session_id')
+                st.caption(f"First token after {events.get('first_token', 0) * 1000:.0f} ms "
+                           f"(server: {events['done'].get('time_to_first_token_ms')} ms)")
+
                 # Add attribution if the response used the default document
-                response_content = response['answer']
-                if 'OpenStaxHSPhysics.pdf' in str(response.get('sources', [])):
-                    response_content += "\n\n---\n*Response includes content from OpenStax High School Physics (CC BY 4.0)*"
-                
+                if 'OpenStaxHSPhysics.pdf' in str(events.get('sources', {}).get('sources', [])):
+                    attribution = "\n\n---\n*Response includes content from OpenStax High School Physics (CC BY 4.0)*"
+                    st.markdown(attribution)
+                    response_content += attribution
+
                 st.session_state.messages.append({"role": "assistant", "content": response_content})
-                
-                with st.chat_message("assistant"):
-                    st.markdown(response_content)
             else:
                 st.error("Failed to get a response from the API. Please try again.")
 
@@ -1,6 +1,26 @@
 import streamlit as st
-from api_utils import upload_document, list_documents, delete_document
+from api_utils import upload_document, upload_documents, list_documents, delete_document, get_job_status
 import os
+import time
+from contextlib import ExitStack
+
+def wait_for_indexing(job_id, poll_interval=1.0):
+    """Poll an ingestion job, showing progress, until it completes or fails."""
+    progress_bar = st.sidebar.progress(0.0, text="Queued for indexing...")
+    while True:
+        job = get_job_status(job_id)
+        if job is None:
+            return None
+        if job['state'] in ('completed', 'failed'):
+            progress_bar.empty()
+            return job
+        if job['chunks_total']:
+            fraction = job['chunks_processed'] / job['chunks_total']
+            progress_bar.progress(fraction, text=f"Indexed {job['chunks_processed']}/{job['chunks_total']} chunks")
+        elif job['state'] == 'running':
+            # The total is only known once the whole document has been split
+            progress_bar.progress(0.0, text=f"Indexed {job['chunks_processed']} chunks so far...")
+        time.sleep(poll_interval)
 
 def auto_upload_default_document():
     """
@@ -42,43 +62,38 @@ def auto_upload_default_document():
         print(f"Error listing directory contents: {e}")
         return
 
-    # Attempt to upload files
-    for filename in default_files:
-        file_path = os.path.join(default_docs_dir, filename)
-        if os.path.isfile(file_path):
-            print(f"Attempting to upload {filename}")
-            try:
-                # Open the file and create a file-like object
-                with open(file_path, 'rb') as f:
-                    # Create a custom file-like object that mimics Streamlit's UploadedFile
-                    class MockUploadedFile:
-                        def __init__(self, file, filename):
-                            self._file = file
-                            self.name = filename
-                            self.type = filename.split('.')[-1]
-                        
-                        def read(self, size=-1):
-                            return self._file.read(size)
-                        
-                        def close(self):
-                            self._file.close()
+    # Create a custom file-like object that mimics Streamlit's UploadedFile
+    class MockUploadedFile:
+        def __init__(self, file, filename):
+            self._file = file
+            self.name = filename
+            self.type = filename.split('.')[-1]
+        
+        def read(self, size=-1):
+            return self._file.read(size)
+        
+        def close(self):
+            self._file.close()
 
-                    # Create the mock uploaded file
-                    uploaded_file = MockUploadedFile(f, filename)
-                    
-                    # Attempt to upload
-                    upload_response = upload_document(uploaded_file)
-                    print(f"Upload response for {filename}: {upload_response}")
-                    
-                    if upload_response:
-                        st.toast(f"Auto-uploaded {filename} successfully!")
-                        break
-                    else:
-                        print(f"Failed to upload {filename}, response was None")
-                
-            except Exception as e:
-                print(f"Error uploading {filename}: {str(e)}")
-                st.error(f"Failed to auto-upload {filename}: {str(e)}")
+    # Upload every default document in one request; the API indexes them in parallel
+    with ExitStack() as stack:
+        uploaded_files = []
+        for filename in default_files:
+            file_path = os.path.join(default_docs_dir, filename)
+            if os.path.isfile(file_path):
+                print(f"Attempting to upload {filename}")
+                uploaded_files.append(MockUploadedFile(stack.enter_context(open(file_path, 'rb')), filename))
+        if not uploaded_files:
+            return
+        results = upload_documents(uploaded_files)
+
+    print(f"Upload results: {results}")
+    for result in results or []:
+        if result['status'] == 'rejected':
+            st.error(f"Failed to auto-upload {result['filename']}: {result['error']}")
+        else:
+            # Indexing continues in the background on the API
+            st.toast(f"Auto-uploaded {result['filename']}, indexing in the background.")
 
 def display_sidebar():
     # Define protected documents that cannot be deleted
@@ -95,18 +110,24 @@ def display_sidebar():
         if st.sidebar.button("Upload"):
             with st.spinner("Uploading..."):
                 upload_response = upload_document(uploaded_file)
-                if upload_response:
-                    st.sidebar.success(f"File '{uploaded_file.name}' uploaded successfully with ID {upload_response['file_id']}.")
+                if upload_response and upload_response.get('job_id'):
+                    job = wait_for_indexing(upload_response['job_id'])
+                    if job and job['state'] == 'completed':
+                        st.sidebar.success(f"File '{uploaded_file.name}' uploaded successfully with ID {upload_response['file_id']}.")
+                    else:
+                        st.sidebar.error(f"Indexing '{uploaded_file.name}' failed: {job['error'] if job else 'unknown status'}")
+                    st.session_state.documents = list_documents()
+                elif upload_response:
+                    st.sidebar.success(f"File '{uploaded_file.name}' is already indexed with ID {upload_response['file_id']}.")
                     st.session_state.documents = list_documents()
 
     # Sidebar: List Documents
     st.sidebar.header("Current Context")
     if st.sidebar.button("Refresh Document List"):
         with st.spinner("Refreshing..."):
-            st.session_state.documents = list_documents()
-
-    # Initialize document list if not present
-    if "documents" not in st.session_state:
+            st.session_state.documents = list_documents(force=True)
+    else:
+        # Cheap on every rerun: served from the local cache or revalidated with a 304
         st.session_state.documents = list_documents()
 
     documents = st.session_state.documents
@@ -0,0 +1,115 @@
+#Bulk deletion benchmark: deletes --docs documents one at a time, the way
+#cleanup_old_documents used to (delete_document_record + a per-document Chroma
+#get/delete/persist), and then all at once through delete_docs_from_chroma and
+#delete_document_records. Both runs start from the same freshly built store in a
+#temporary directory; vectors are random so no embedding calls are made.
+#
+#Run: python tests/bench_bulk_delete.py --docs 50 --chunks-per-doc 200
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def populate(args):
+    from api import chroma_utils
+    from api.db_utils import insert_document_record
+    rng = random.Random(11)
+    file_ids = []
+    for doc in range(args.docs):
+        file_id = insert_document_record(f"bench_{doc}.pdf", f"hash-{doc}")
+        file_ids.append(file_id)
+        ids = [f"{file_id}-{i}" for i in range(args.chunks_per_doc)]
+        chroma_utils.get_vectorstore()._collection.add(
+            ids=ids,
+            embeddings=[[rng.random() for _ in range(args.dim)] for _ in ids],
+            metadatas=[{"file_id": file_id, "page": i // 5} for i in range(args.chunks_per_doc)],
+            documents=[f"chunk {i} of document {file_id}" for i in range(args.chunks_per_doc)],
+        )
+    # Keep some unrelated documents so the deletes have to filter
+    for doc in range(args.keep):
+        file_id = insert_document_record(f"keep_{doc}.pdf", f"keep-{doc}")
+        chroma_utils.get_vectorstore()._collection.add(
+            ids=[f"keep-{file_id}-{i}" for i in range(args.chunks_per_doc)],
+            embeddings=[[rng.random() for _ in range(args.dim)] for _ in range(args.chunks_per_doc)],
+            metadatas=[{"file_id": file_id} for _ in range(args.chunks_per_doc)],
+            documents=[f"kept chunk {i}" for i in range(args.chunks_per_doc)],
+        )
+    chroma_utils.get_vectorstore().persist()
+    return file_ids
+
+
+def run_mode(args):
+    """Runs in a fresh process and working directory; prints the elapsed seconds."""
+    from api import chroma_utils
+    from api.db_utils import init_db, delete_document_record, delete_document_records
+    init_db()
+    file_ids = populate(args)
+    remaining = chroma_utils.get_vectorstore()._collection.count()
+
+    start = time.perf_counter()
+    if args.mode == "sequential":
+        for file_id in file_ids:
+            delete_document_record(file_id)
+            # What delete_doc_from_chroma did per document before the bulk path
+            docs = chroma_utils.get_vectorstore().get(where={"file_id": file_id})
+            print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
+            chroma_utils.get_vectorstore()._collection.delete(where={"file_id": file_id})
+            chroma_utils.get_vectorstore().persist()
+    else:
+        if chroma_utils.delete_docs_from_chroma(file_ids) is None:
+            raise SystemExit("bulk delete failed")
+        delete_document_records(file_ids)
+    elapsed = time.perf_counter() - start
+
+    left = chroma_utils.get_vectorstore()._collection.count()
+    expected = remaining - args.docs * args.chunks_per_doc
+    if left != expected:
+        raise SystemExit(f"{left} chunks left, expected {expected}")
+    print(f"RESULT {elapsed:.6f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-document vs bulk deletion latency")
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--chunks-per-doc", type=int, default=200)
+    parser.add_argument("--keep", type=int, default=10, help="documents left in the store")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--mode", choices=["sequential", "bulk"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    results = {}
+    for mode in ("sequential", "bulk"):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-offline",
+                "CHROMA_DIR": os.path.join(workdir, "chroma_db"),
+                "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+            })
+            command = [sys.executable, __file__, "--mode", mode, "--docs", str(args.docs),
+                       "--chunks-per-doc", str(args.chunks_per_doc), "--keep", str(args.keep),
+                       "--dim", str(args.dim)]
+            output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+            lines = [line for line in output.stdout.splitlines() if line.startswith("RESULT ")]
+            if output.returncode != 0 or not lines:
+                print(output.stdout[-2000:], output.stderr[-2000:])
+                raise SystemExit(f"{mode} run failed")
+            results[mode] = float(lines[-1].split()[1])
+        print(f"{mode:<10} delete {args.docs} docs x {args.chunks_per_doc} chunks: {results[mode] * 1000:9.1f}ms "
+              f"({results[mode] * 1000 / args.docs:.1f}ms per document)")
+    print(f"bulk is {results['sequential'] / results['bulk']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#Concurrency check for /chat against the local OpenAI stand-in (tests/fake_openai.py).
+#Starts the stand-in and one uvicorn worker running api.main:app, then fires bursts of
+#concurrent /chat requests. A sync handler can never have more upstream calls in flight
+#than the 40 threads of the default threadpool; the async chain should go well past that.
+#
+#Run: python tests/bench_chat_concurrency.py --latency 5 --levels 1 50 200
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THREADPOOL_SIZE = 40  # anyio's default, which bounds sync FastAPI endpoints
+
+
+def start_services(latency, fake_port, api_port, workdir, extra_env=None):
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "tests", "fake_openai.py"),
+         "--port", str(fake_port), "--latency", str(latency)],
+        cwd=workdir,
+    )
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-fake",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{fake_port}/v1",
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    env.update(extra_env or {})
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(api_port),
+         "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    return fake, api
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def burst(client, api_url, n):
+    async def one(i):
+        start = time.perf_counter()
+        response = await client.post(f"{api_url}/chat", json={"question": f"What is Newton's second law? #{i}"})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+async def run(api_url, fake_url, levels):
+    limits = httpx.Limits(max_connections=max(levels) + 10)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        await burst(client, api_url, 1)  # warm up the chain registry and connection pools
+        results = []
+        for n in levels:
+            await client.post(f"{fake_url}/reset")
+            wall, latencies = await burst(client, api_url, n)
+            peak = (await client.get(f"{fake_url}/stats")).json()["peak_in_flight"]
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            results.append((n, wall, peak))
+            print(f"concurrency={n:4d}  wall={wall:6.2f}s  throughput={n / wall:7.1f} req/s  "
+                  f"p50={p50:5.2f}s  p99={p99:5.2f}s  peak upstream in flight={peak}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency check for /chat")
+    parser.add_argument("--latency", type=float, default=5.0)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 50, 200])
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fake, api = start_services(args.latency, args.fake_port, args.api_port, workdir)
+        try:
+            api_url = f"http://127.0.0.1:{args.api_port}"
+            fake_url = f"http://127.0.0.1:{args.fake_port}"
+            wait_until_up(f"{fake_url}/stats")
+            wait_until_up(f"{api_url}/docs")
+            results = asyncio.run(run(api_url, fake_url, args.levels))
+        finally:
+            api.terminate()
+            fake.terminate()
+            api.wait()
+            fake.wait()
+
+    n, wall, peak = results[-1]
+    print(f"\n{n} concurrent requests kept up to {peak} upstream calls in flight")
+    if n > THREADPOOL_SIZE and peak <= THREADPOOL_SIZE:
+        print(f"FAIL: /chat is capped at the {THREADPOOL_SIZE}-thread pool")
+        sys.exit(1)
+    print("PASS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#Embedding backend benchmark: the remote OpenAIEmbeddings path (against the local
+#stand-in tests/fake_openai.py with configurable latency) versus LocalEmbeddings on CPU.
+#Reports chunk throughput (batches of 100, EMBED_CONCURRENCY at a time, as indexing does),
+#sequential query-embed latency and a burst of concurrent queries, which the local
+#backend's dynamic batcher folds into shared forward passes.
+#The local rows need sentence-transformers + torch and are skipped without them.
+#
+#Run: python tests/bench_embedding_backends.py --latency 0.15 --chunks 2000 --quantize
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bench_suite import sentence
+
+
+def chunk_texts(count, rng):
+    texts = []
+    for _ in range(count):
+        text = ""
+        while len(text) < 900:
+            text += sentence(rng)
+        texts.append(text)
+    return texts
+
+
+def bench(name, embeddings, chunks, queries, concurrency, burst):
+    start = time.perf_counter()
+    batches = [chunks[i:i + 100] for i in range(0, len(chunks), 100)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embeddings.embed_documents, batches))
+    chunk_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    async def concurrent_queries():
+        async def one(query):
+            start = time.perf_counter()
+            await embeddings.aembed_query(query)
+            return (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        burst_latencies = await asyncio.gather(*(one(q) for q in queries[:burst]))
+        return (time.perf_counter() - start) * 1000, sorted(burst_latencies)
+
+    burst_wall, burst_latencies = asyncio.run(concurrent_queries())
+    print(f"{name:<22} {len(chunks) / chunk_seconds:9.1f} chunks/s   "
+          f"query p50 {statistics.median(latencies):7.2f}ms p99 "
+          f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:7.2f}ms   "
+          f"{len(burst_latencies)} concurrent: wall {burst_wall:7.1f}ms p50 {statistics.median(burst_latencies):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remote vs local embedding backend benchmark")
+    parser.add_argument("--latency", type=float, default=0.15, help="fake OpenAI latency per call (s)")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4, help="EMBED_CONCURRENCY for chunk batches")
+    parser.add_argument("--quantize", action="store_true", help="also run the int8 local model")
+    parser.add_argument("--fake-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    chunks = chunk_texts(args.chunks, rng)
+    queries = [sentence(rng) for _ in range(args.queries)]
+
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(REPO_ROOT, "tests", "fake_openai.py"),
+        "--port", str(args.fake_port), "--latency", str(args.latency),
+    ])
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{args.fake_port}/stats", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-fake"
+        os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.fake_port}/v1"
+        from langchain_openai import OpenAIEmbeddings
+        from api.openai_utils import get_sync_client, get_async_client
+        remote = OpenAIEmbeddings(client=get_sync_client().embeddings, async_client=get_async_client().embeddings)
+        bench(f"remote ({args.latency * 1000:.0f}ms stand-in)", remote, chunks, queries, args.concurrency, args.burst)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    try:
+        from api.local_embedding_utils import LocalEmbeddings
+        bench("local", LocalEmbeddings(), chunks, queries, args.concurrency, args.burst)
+        if args.quantize:
+            bench("local int8", LocalEmbeddings(quantize=True), chunks, queries, args.concurrency, args.burst)
+    except ImportError as e:
+        print(f"local backend skipped: {e}")
+
+
+if __name__ == "__main__":
+    main()
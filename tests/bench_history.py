@@ -0,0 +1,89 @@
+#Chat history lookup latency at 1M application_logs rows.
+#"before" is the old schema (no index, rollback journal, a fresh connection per call),
+#"after" is the same data once init_db() has applied the migrations (WAL + the
+#(session_id, created_at) index) and lookups go through the connection pool.
+#
+#Run: python tests/bench_history.py --rows 1000000 --lookups 200
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def create_old_schema(path, rows, sessions):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE application_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     session_id TEXT,
+                     user_query TEXT,
+                     gpt_response TEXT,
+                     model TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    batch = []
+    for i in range(rows):
+        batch.append((f"session-{random.randrange(sessions)}", f"Question {i}",
+                      "An answer about forces and motion. " * 5, "gpt-4o-mini"))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+
+def old_get_chat_history(path, session_id):
+    # The pre-pool implementation: new connection per call, unindexed scan
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
+                        (session_id,)).fetchall()
+    conn.close()
+    return rows
+
+
+def time_lookups(lookup, session_ids):
+    latencies = []
+    for session_id in session_ids:
+        start = time.perf_counter()
+        lookup(session_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history lookup benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        start = time.perf_counter()
+        create_old_schema("rag_app.db", args.rows, args.sessions)
+        print(f"Inserted {args.rows} rows across {args.sessions} sessions in {time.perf_counter() - start:.1f}s")
+
+        session_ids = [f"session-{random.randrange(args.sessions)}" for _ in range(args.lookups)]
+        p50, p99 = time_lookups(lambda sid: old_get_chat_history("rag_app.db", sid), session_ids)
+        print(f"before: p50={p50:8.2f}ms  p99={p99:8.2f}ms")
+
+        from api.db_utils import init_db, get_chat_history, close_db_pool
+        start = time.perf_counter()
+        init_db()
+        print(f"Migrations (incl. index build) took {time.perf_counter() - start:.1f}s")
+        p50, p99 = time_lookups(get_chat_history, session_ids)
+        print(f" after: p50={p50:8.2f}ms  p99={p99:8.2f}ms")
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    main()
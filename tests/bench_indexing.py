@@ -0,0 +1,93 @@
+#Indexing throughput against the local OpenAI stand-in (tests/fake_openai.py).
+#Indexes a synthetic PDF once per EMBED_CONCURRENCY setting, each run in a fresh
+#working directory (empty embedding cache and Chroma), and reports chunks/s.
+#With --error-rate some embedding calls get a 429 to exercise retry/backoff.
+#
+#Run: python tests/bench_indexing.py --latency 0.3 --pages 200 --concurrency 1 4 8
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bench_parsing import make_pdf
+
+
+def index_once(pdf_path):
+    from api.chroma_utils import index_document_to_chroma
+    from api.db_utils import init_db
+    from api.parse_utils import shutdown_parse_pool
+    init_db()
+    start = time.perf_counter()
+    stats = index_document_to_chroma(pdf_path, file_id=1)
+    elapsed = time.perf_counter() - start
+    shutdown_parse_pool(wait=True)
+    if stats is None:
+        raise SystemExit("indexing failed")
+    print(json.dumps({"chunks": stats["chunks"], "seconds": elapsed,
+                      "retries": stats["embed_retries"], "stage_seconds": stats["stage_seconds"]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexing throughput benchmark")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.index:
+        index_once(args.index)
+        return
+
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(REPO_ROOT, "tests", "fake_openai.py"),
+        "--port", str(args.fake_port), "--latency", str(args.latency),
+        "--error-rate", str(args.error_rate),
+    ])
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{args.fake_port}/stats", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+
+        with tempfile.TemporaryDirectory() as pdf_dir:
+            pdf_path = os.path.join(pdf_dir, "synthetic.pdf")
+            make_pdf(pdf_path, args.pages)
+            for concurrency in args.concurrency:
+                with tempfile.TemporaryDirectory() as workdir:
+                    env = dict(os.environ)
+                    env.update({
+                        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-fake",
+                        "OPENAI_API_BASE": f"http://127.0.0.1:{args.fake_port}/v1",
+                        "EMBED_CONCURRENCY": str(concurrency),
+                        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+                    })
+                    output = subprocess.run(
+                        [sys.executable, __file__, "--index", pdf_path],
+                        cwd=workdir, env=env, capture_output=True, text=True
+                    )
+                    if output.returncode != 0:
+                        print(output.stdout[-2000:], output.stderr[-2000:])
+                        raise SystemExit(f"indexing run with concurrency {concurrency} failed")
+                    result = json.loads(output.stdout.strip().splitlines()[-1])
+                    print(f"EMBED_CONCURRENCY={concurrency:2d}: {result['chunks'] / result['seconds']:7.1f} chunks/s "
+                          f"({result['chunks']} chunks in {result['seconds']:.2f}s, {result['retries']} retries)")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#Parsing benchmark: peak memory and pages/s for a synthetic 1000-page PDF.
+#"before" is the old path (PyMuPDFLoader.load() + split_documents on the whole book),
+#"after" streams chunk batches from api.parse_utils.iter_document_batches.
+#Each variant runs in its own process so peak RSS is measured independently.
+#
+#Run: python tests/bench_parsing.py --pages 1000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+PARAGRAPH = (
+    "A force is a push or pull on an object. Newton's second law relates the net "
+    "external force on a system to its mass and acceleration. Momentum is conserved "
+    "in an isolated system, and energy changes form without being created or destroyed. "
+)
+
+
+def make_pdf(path, pages):
+    import fitz
+    pdf = fitz.open()
+    for i in range(pages):
+        page = pdf.new_page()
+        text = f"Chapter {i // 20 + 1}, page {i + 1}\n" + PARAGRAPH * 18
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=9)
+    pdf.save(path)
+    pdf.close()
+
+
+def run_before(path):
+    from langchain_community.document_loaders import PyMuPDFLoader
+    from api.parse_utils import text_splitter
+    documents = PyMuPDFLoader(path).load()
+    splits = text_splitter.split_documents(documents)
+    return len(documents), len(splits)
+
+
+def run_after(path):
+    from api.parse_utils import iter_document_batches, pdf_page_count, shutdown_parse_pool
+    chunks = 0
+    for batch in iter_document_batches(path):
+        chunks += len(batch)  # the indexer drops each batch once it is written
+    shutdown_parse_pool(wait=True)
+    return pdf_page_count(path), chunks
+
+
+def measure(variant, path):
+    start = time.perf_counter()
+    pages, chunks = (run_before if variant == "before" else run_after)(path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux; parser workers are counted separately as children
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({
+        "variant": variant,
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(elapsed, 2),
+        "pages_per_second": round(pages / elapsed, 1),
+        "peak_rss_mb": round(self_peak, 1),
+        "peak_worker_rss_mb": round(child_peak, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parsing memory/throughput benchmark")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--variant", choices=["before", "after"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        measure(args.variant, args.pdf)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "synthetic.pdf")
+        make_pdf(path, args.pages)
+        print(f"Synthetic PDF: {args.pages} pages, {os.path.getsize(path) / (1024 * 1024):.1f}MB")
+        for variant in ("before", "after"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--pdf", path],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{variant:>6}: {result['pages_per_second']:7.1f} pages/s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f}MB (+ workers {result['peak_worker_rss_mb']:.0f}MB), "
+                  f"{result['chunks']} chunks in {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
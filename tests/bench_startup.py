@@ -0,0 +1,115 @@
+#Startup measurement: how long `import api.main` takes in a fresh interpreter, and for
+#a uvicorn process how long until /healthz answers (the server is accepting requests)
+#and until /readyz returns 200 (Chroma open, collection loaded, chains built). The
+#store can be seeded with --seed-chunks random vectors so loading the collection has
+#real work to do. OpenAI calls (only the optional WARMUP_QUERY) go to tests/fake_openai.py.
+#
+#Run: python tests/bench_startup.py --runs 5 --seed-chunks 20000
+#     python tests/bench_startup.py --warmup-query "What is momentum?"
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+
+from bench_chat_concurrency import wait_until_up
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import api.main; print(time.perf_counter() - t)"
+SEED_SNIPPET = """
+import random, sys
+from api.chroma_utils import get_vectorstore
+collection = get_vectorstore()._collection
+rng = random.Random(5)
+count, dim = int(sys.argv[1]), int(sys.argv[2])
+for start in range(0, count, 1000):
+    ids = [str(i) for i in range(start, min(count, start + 1000))]
+    collection.add(ids=ids, embeddings=[[rng.random() for _ in range(dim)] for _ in ids],
+                   metadatas=[{"file_id": 1} for _ in ids], documents=["seed chunk"] * len(ids))
+"""
+
+
+def wait_for_status(url, status, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = httpx.get(url, timeout=1)
+            if response.status_code == status:
+                return response
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"{url} did not return {status} within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time-to-ready of the API")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed-chunks", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--warmup-query", default="")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8002)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fake = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "tests", "fake_openai.py"),
+                                 "--port", str(args.fake_port), "--latency", "0.05"], cwd=workdir)
+        env = dict(os.environ)
+        env.update({
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-fake",
+            "OPENAI_API_BASE": f"http://127.0.0.1:{args.fake_port}/v1",
+            "CHROMA_DIR": os.path.join(workdir, "chroma_db"),
+            "WARMUP_QUERY": args.warmup_query,
+            "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        })
+        try:
+            wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats")
+            if args.seed_chunks:
+                subprocess.run([sys.executable, "-c", SEED_SNIPPET, str(args.seed_chunks), str(args.dim)],
+                               cwd=workdir, env=env, check=True, capture_output=True)
+                print(f"Seeded Chroma with {args.seed_chunks} chunks")
+
+            import_seconds = []
+            for _ in range(args.runs):
+                output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=workdir, env=env,
+                                        check=True, capture_output=True, text=True)
+                import_seconds.append(float(output.stdout.strip().splitlines()[-1]))
+            print(f"import api.main: median {statistics.median(import_seconds):.2f}s "
+                  f"(runs: {', '.join(f'{s:.2f}' for s in import_seconds)})")
+
+            api_url = f"http://127.0.0.1:{args.api_port}"
+            for run in range(args.runs):
+                started = time.perf_counter()
+                api = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.main:app",
+                                        "--port", str(args.api_port), "--log-level", "warning"],
+                                       cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+                try:
+                    wait_for_status(f"{api_url}/healthz", 200, args.timeout)
+                    live = time.perf_counter() - started
+                    ready_state = wait_for_status(f"{api_url}/readyz", 200, args.timeout).json()
+                    ready = time.perf_counter() - started
+                    steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in ready_state["steps"].items())
+                    print(f"run {run + 1}: live after {live:.2f}s, ready after {ready:.2f}s ({steps})")
+                    if args.warmup_query:
+                        deadline = time.perf_counter() + args.timeout
+                        while not httpx.get(f"{api_url}/readyz").json()["warmed"] and time.perf_counter() < deadline:
+                            time.sleep(0.05)
+                        print(f"       warmed after {time.perf_counter() - started:.2f}s")
+                finally:
+                    api.terminate()
+                    api.wait()
+        finally:
+            fake.terminate()
+            fake.wait()
+
+
+if __name__ == "__main__":
+    main()
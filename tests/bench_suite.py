@@ -0,0 +1,206 @@
+#Offline ingestion/retrieval micro-benchmarks. No network: the OpenAI embeddings are
+#swapped for deterministic hash-based vectors and the chat model for a canned-response
+#fake, so runs are repeatable and comparable.
+#For each corpus size it builds a synthetic PDF and, in a fresh process and working
+#directory, measures load_and_split_document, index_document_to_chroma (chunks/s),
+#retriever and full-chain latency (p50/p99) at several k, delete_doc_from_chroma
+#latency and peak RSS. Results go to a JSON file (default bench_results/) for comparison.
+#
+#Run: python tests/bench_suite.py --sizes 1000 10000 100000
+#     python tests/bench_suite.py --sizes 1000 --queries 50 --output /tmp/quick.json
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+WORDS = (
+    "force mass acceleration velocity momentum energy work power friction gravity "
+    "field charge current voltage resistance wave frequency amplitude period torque "
+    "inertia equilibrium pressure density temperature heat entropy lens refraction "
+    "photon electron nucleus isotope decay orbit satellite projectile vector scalar "
+    "displacement impulse collision spring oscillation pendulum circuit magnet flux"
+).split()
+CHARS_PER_PAGE = 4000
+CHUNK_STEP = 800  # chunk_size - chunk_overlap of the repo's text_splitter
+CANNED_ANSWER = "Newton's second law states that the net force on an object equals its mass times its acceleration."
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + ". "
+
+
+def make_corpus_pdf(path, pages, seed):
+    """A PDF of random physics-vocabulary sentences; distinct text keeps the embedding cache cold."""
+    import fitz
+    rng = random.Random(seed)
+    pdf = fitz.open()
+    for i in range(pages):
+        text = f"Section {i // 20 + 1}.{i % 20 + 1}\n"
+        while len(text) < CHARS_PER_PAGE:
+            text += sentence(rng)
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    pdf.save(path)
+    pdf.close()
+
+
+def percentiles(latencies_ms):
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "p50_ms": round(statistics.median(latencies_ms), 3),
+        "p99_ms": round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.99))], 3),
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_size(args):
+    """Runs inside the per-size child process; prints one JSON result line."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from api.db_utils import init_db
+    from api.parse_utils import shutdown_parse_pool
+    from api.pydantic_models import ModelName
+    from api import chroma_utils
+    from api.langchain_utils import AsyncEmbeddingRetriever, build_rag_chain
+
+    # Offline providers: hash-seeded vectors in place of the OpenAI embeddings
+    embeddings = chroma_utils.get_embedding_function()
+    embeddings.underlying = DeterministicFakeEmbedding(size=args.dim)
+    embeddings.model_name = f"deterministic-fake-{args.dim}"
+    embeddings.query_model_key = f"{embeddings.model_name}:query"
+    init_db()
+
+    result = {"target_chunks": args.run_size}
+    splits, seconds = timed(chroma_utils.load_and_split_document, args.pdf)
+    result["split"] = {"chunks": len(splits), "seconds": round(seconds, 3),
+                       "chunks_per_second": round(len(splits) / seconds, 1)}
+    del splits
+
+    stats, seconds = timed(chroma_utils.index_document_to_chroma, args.pdf, 1)
+    if stats is None:
+        raise SystemExit("indexing failed")
+    result["ingest"] = {"chunks": stats["chunks"], "seconds": round(seconds, 3),
+                        "chunks_per_second": round(stats["chunks"] / seconds, 1),
+                        "stage_seconds": stats["stage_seconds"]}
+
+    small_pdf = os.path.join(os.getcwd(), "small.pdf")
+    make_corpus_pdf(small_pdf, 20, seed=args.run_size + 1)
+    chroma_utils.index_document_to_chroma(small_pdf, 2)
+
+    rng = random.Random(7)
+    questions = [sentence(rng) for _ in range(args.queries)]
+    result["query"] = {}
+    for k in args.k:
+        retriever = AsyncEmbeddingRetriever(vectorstore=chroma_utils.get_vectorstore(), search_kwargs={"k": k})
+        retriever.invoke(questions[0])  # warm-up
+        latencies = [timed(retriever.invoke, q)[1] * 1000 for q in questions]
+        result["query"][f"k={k}"] = percentiles(latencies)
+
+    chain = build_rag_chain(ModelName.GPT4_O_MINI, llm=FakeListChatModel(responses=[CANNED_ANSWER]))
+    chain_questions = questions[:min(len(questions), 50)]
+    latencies = [timed(chain.invoke, {"input": q, "chat_history": []})[1] * 1000 for q in chain_questions]
+    result["chain_k=2"] = percentiles(latencies)
+
+    _, seconds = timed(chroma_utils.delete_doc_from_chroma, 2)
+    result["delete_small_doc_ms"] = round(seconds * 1000, 1)
+    _, seconds = timed(chroma_utils.delete_doc_from_chroma, 1)
+    result["delete_corpus_ms"] = round(seconds * 1000, 1)
+
+    shutdown_parse_pool(wait=True)
+    # ru_maxrss is in KiB on Linux; parser workers are counted as children
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result["peak_worker_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion/retrieval benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="approximate corpus sizes in chunks")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--output", help="JSON results path (default bench_results/suite-<timestamp>.json)")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        run_size(args)
+        return
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "suite": "offline",
+        "started_at": started.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {"k": args.k, "queries": args.queries, "dim": args.dim},
+        "results": [],
+    }
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            pdf_path = os.path.join(workdir, "corpus.pdf")
+            pages = max(1, size * CHUNK_STEP // CHARS_PER_PAGE)
+            _, seconds = timed(make_corpus_pdf, pdf_path, pages, size)
+            print(f"[{size} chunks] corpus: {pages} pages in {seconds:.1f}s")
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_API_KEY": "sk-offline",
+                "CHROMA_DIR": os.path.join(workdir, "chroma_db"),
+                "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+            })
+            command = [sys.executable, __file__, "--run-size", str(size), "--pdf", pdf_path,
+                       "--queries", str(args.queries), "--dim", str(args.dim), "--k", *map(str, args.k)]
+            output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(output.stdout[-2000:], output.stderr[-2000:])
+                raise SystemExit(f"benchmark for {size} chunks failed")
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            report["results"].append(result)
+
+            print(f"[{size} chunks] split {result['split']['chunks_per_second']:.0f} chunks/s, "
+                  f"ingest {result['ingest']['chunks_per_second']:.0f} chunks/s "
+                  f"({result['ingest']['chunks']} chunks), peak RSS {result['peak_rss_mb']:.0f}MB")
+            for k, latency in result["query"].items():
+                print(f"    retrieve {k:<5} p50 {latency['p50_ms']:8.2f}ms  p99 {latency['p99_ms']:8.2f}ms")
+            print(f"    chain k=2    p50 {result['chain_k=2']['p50_ms']:8.2f}ms  p99 {result['chain_k=2']['p99_ms']:8.2f}ms")
+            print(f"    delete small doc {result['delete_small_doc_ms']:.0f}ms, whole corpus {result['delete_corpus_ms']:.0f}ms")
+
+    output_path = args.output or os.path.join(
+        REPO_ROOT, "bench_results", f"suite-{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#Vector store benchmark: Chroma (HNSW, the default backend) versus MemmapVectorStore with
+#int8 and float16 vectors, on synthetic clustered unit vectors. For every size each store is
+#built in one subprocess and queried in a fresh one, so the reported RSS is what a worker
+#holds after opening the store and serving --queries searches. RssFile is the memory-mapped
+#part, which worker processes share through the page cache; RssAnon is private per worker.
+#Recall@k is measured against exact float32 search over the same vectors.
+#
+#Run: python tests/bench_vector_stores.py --sizes 10000 100000 1000000 --dim 1536 --chroma-max 100000
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+BATCH = 5000
+
+
+def sample(args, count, rng):
+    """Unit vectors around --clusters topics in a --latent-dim subspace, projected up to
+    --dim with a little full-rank noise, which is roughly how text embeddings are spread."""
+    generator = np.random.default_rng(args.seed)
+    centers = generator.normal(size=(args.clusters, args.latent_dim))
+    projection = generator.normal(size=(args.latent_dim, args.dim)) / np.sqrt(args.latent_dim)
+    latent = centers[rng.integers(args.clusters, size=count)] + rng.normal(scale=0.5, size=(count, args.latent_dim))
+    vectors = (latent @ projection + rng.normal(scale=0.1, size=(count, args.dim))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def dataset_batches(args, size):
+    """Yield (offset, unit vectors) for the whole dataset, the same on every call."""
+    for offset in range(0, size, BATCH):
+        yield offset, sample(args, min(BATCH, size - offset), np.random.default_rng((args.seed, 0, offset)))
+
+
+def query_vectors(args):
+    return sample(args, args.queries, np.random.default_rng((args.seed, 1, 0)))
+
+
+def rss_mb():
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def dir_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 1e6
+
+
+def open_store(backend, path, create):
+    if backend == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        # Default space (l2), as the API's langchain Chroma store uses
+        return client.get_or_create_collection("bench") if create else client.get_collection("bench")
+    from api.memmap_store_utils import MemmapVectorStore
+    return MemmapVectorStore(path, dtype=backend.split("-")[1])
+
+
+def build(args):
+    store = open_store(args.backend, args.path, create=True)
+    start = time.perf_counter()
+    for offset, vectors in dataset_batches(args, args.size):
+        ids = [str(offset + i) for i in range(len(vectors))]
+        metadatas = [{"file_id": (offset + i) // 100, "row": offset + i} for i in range(len(vectors))]
+        documents = [f"chunk {offset + i}" for i in range(len(vectors))]
+        if args.backend == "chroma":
+            store.add(ids=ids, embeddings=vectors.tolist(), metadatas=metadatas, documents=documents)
+        else:
+            store.upsert(ids, vectors, metadatas, documents)
+    return {"build_s": round(time.perf_counter() - start, 1), "disk_mb": round(dir_mb(args.path), 1)}
+
+
+def truth(args):
+    """Exact float32 top-k row numbers for every query, saved next to the stores."""
+    queries = query_vectors(args)
+    best_scores = np.full((len(queries), args.k), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), args.k), dtype=np.int64)
+    for offset, vectors in dataset_batches(args, args.size):
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(offset, offset + len(vectors)),
+                                                          (len(queries), len(vectors)))], axis=1)
+        top = np.argpartition(-scores, args.k - 1, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_rows = np.take_along_axis(rows, top, axis=1)
+    np.save(args.path, best_rows)
+    return {}
+
+
+def query(args):
+    # Import first so the baseline covers the library and the deltas only the store
+    if args.backend == "chroma":
+        import chromadb
+    else:
+        import api.memmap_store_utils
+    baseline = rss_mb()
+    start = time.perf_counter()
+    store = open_store(args.backend, args.path, create=False)
+    open_ms = (time.perf_counter() - start) * 1000
+    found, latencies = [], []
+    for i, vector in enumerate(query_vectors(args)):
+        start = time.perf_counter()
+        if args.backend == "chroma":
+            result = store.query(query_embeddings=[vector.tolist()], n_results=args.k,
+                                 include=["documents", "metadatas", "distances"])
+            rows = [metadata["row"] for metadata in result["metadatas"][0]]
+        else:
+            rows = [doc.metadata["row"] for doc in store.similarity_search_by_vector(vector.tolist(), args.k)]
+        elapsed = (time.perf_counter() - start) * 1000
+        if i == 0:
+            first_ms = elapsed
+        else:
+            latencies.append(elapsed)
+        found.append(rows)
+    rss = rss_mb()
+    expected = np.load(args.truth)
+    recall = statistics.mean(len(set(rows) & set(exact.tolist())) / args.k for rows, exact in zip(found, expected))
+    latencies.sort()
+    return {
+        "open_ms": round(open_ms, 1), "first_query_ms": round(first_ms, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+        "recall": round(recall, 4),
+        "rss_mb": round(rss["VmRSS"] - baseline["VmRSS"], 1),
+        "anon_mb": round(rss["RssAnon"] - baseline["RssAnon"], 1),
+        "file_mb": round(rss["RssFile"] - baseline["RssFile"], 1),
+    }
+
+
+def child(args, **overrides):
+    command = [sys.executable, os.path.abspath(__file__)]
+    for key, value in dict(vars(args), **overrides).items():
+        if value is not None and key not in ("sizes", "backends", "chroma_max", "workdir"):
+            command += [f"--{key.replace('_', '-')}", str(value)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs memory-mapped vector store benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--backends", nargs="+", default=["chroma", "memmap-int8", "memmap-float16"])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--latent-dim", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chroma-max", type=int, default=100000, help="skip Chroma above this many vectors")
+    parser.add_argument("--workdir", help="keep the stores here instead of a temporary directory")
+    parser.add_argument("--child", choices=["build", "truth", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--truth", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps({"build": build, "truth": truth, "query": query}[args.child](args)))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_vector_stores_")
+    try:
+        print(f"{'vectors':>8} {'backend':<15} {'build':>8} {'disk':>9} {'open':>8} {'first':>8} "
+              f"{'p50':>8} {'p99':>8} {'recall@' + str(args.k):>9} {'RSS':>8} {'anon':>8} {'file':>8}")
+        for size in args.sizes:
+            truth_path = os.path.join(workdir, f"truth_{size}.npy")
+            child(args, child="truth", size=size, path=truth_path)
+            for backend in args.backends:
+                if backend == "chroma" and size > args.chroma_max:
+                    print(f"{size:>8} {backend:<15} skipped (--chroma-max {args.chroma_max})")
+                    continue
+                path = os.path.join(workdir, f"{backend}_{size}")
+                built = child(args, child="build", backend=backend, size=size, path=path)
+                result = child(args, child="query", backend=backend, size=size, path=path, truth=truth_path)
+                print(f"{size:>8} {backend:<15} {built['build_s']:>7.1f}s {built['disk_mb']:>7.1f}MB "
+                      f"{result['open_ms']:>6.1f}ms {result['first_query_ms']:>6.1f}ms "
+                      f"{result['p50_ms']:>6.2f}ms {result['p99_ms']:>6.2f}ms {result['recall']:>9.3f} "
+                      f"{result['rss_mb']:>6.1f}MB {result['anon_mb']:>6.1f}MB {result['file_mb']:>6.1f}MB",
+                      flush=True)
+                if not args.workdir:
+                    shutil.rmtree(path)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#Admission control check. Starts the API against tests/fake_openai.py with a chat limit of 2,
+#a queue of 4 and a queue deadline of 3x the fake latency, then sends --requests distinct
+#questions at once. Two must run, the two queued behind them must be served once a slot
+#frees up, the two queued after those must get 503 at the deadline and the rest an immediate 429,
+#every rejection with Retry-After. Upstream concurrency must stay at the limit. An upload sent
+#while chats are queued must be turned away (chat goes first), and a streamed answer must give
+#its slot back when the stream ends.
+#
+#Run: python tests/check_admission.py --latency 0.5 --requests 20
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+
+from bench_chat_concurrency import start_services, wait_until_up
+
+LIMIT = 2
+QUEUE = 4
+
+
+async def burst(api_url, count, upload_after=None):
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one(i):
+            start = time.perf_counter()
+            response = await client.post(f"{api_url}/chat", json={
+                "question": f"What is Newton's law number {i}?", "use_cache": False, "model": "gpt-4o-mini"})
+            return response, time.perf_counter() - start
+
+        async def upload():
+            await asyncio.sleep(upload_after)
+            files = {"file": ("notes.pdf", b"%PDF-1.4 not really", "application/pdf")}
+            return await client.post(f"{api_url}/upload-doc", files=files)
+
+        tasks = [one(i) for i in range(count)]
+        if upload_after is not None:
+            *results, upload_response = await asyncio.gather(*tasks, upload())
+            return results, upload_response
+        return await asyncio.gather(*tasks), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admission control check")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency per call (s)")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+        failures += not ok
+
+    with tempfile.TemporaryDirectory() as workdir:
+        extra_env = {
+            "CHROMA_DIR": os.path.join(workdir, "chroma_db"),
+            "CHAT_COALESCING_ENABLED": "false",
+            "CHAT_MAX_CONCURRENT": str(LIMIT),
+            "CHAT_MAX_QUEUE": str(QUEUE),
+            # A chain run is two upstream calls (query embedding, answer): the 3rd and 4th
+            # requests wait one run, the 5th and 6th two runs
+            "CHAT_MAX_WAIT_SECONDS": str(3 * args.latency),
+        }
+        fake, api = start_services(args.latency, args.fake_port, args.api_port, workdir, extra_env)
+        fake_url = f"http://127.0.0.1:{args.fake_port}"
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        try:
+            wait_until_up(f"{fake_url}/stats")
+            wait_until_up(f"{api_url}/healthz")
+            while httpx.get(f"{api_url}/readyz").status_code != 200:
+                time.sleep(0.3)
+
+            httpx.post(f"{fake_url}/reset")
+            results, upload = asyncio.run(burst(api_url, args.requests, upload_after=args.latency / 2))
+            by_status = {}
+            for response, seconds in results:
+                by_status.setdefault(response.status_code, []).append((response, seconds))
+            print(f"{args.requests} requests: " + ", ".join(
+                f"{status}: {len(group)} (max {max(s for _, s in group):.2f}s)"
+                for status, group in sorted(by_status.items())))
+            calls = httpx.get(f"{fake_url}/stats").json()
+            check(f"{LIMIT + QUEUE - 2} requests answered", len(by_status.get(200, [])) == LIMIT + QUEUE - 2)
+            check("2 requests timed out in the queue with 503", len(by_status.get(503, [])) == 2)
+            check(f"{args.requests - LIMIT - QUEUE} requests rejected with 429",
+                  len(by_status.get(429, [])) == args.requests - LIMIT - QUEUE)
+            check("429s are immediate", all(seconds < args.latency for _, seconds in by_status.get(429, [])))
+            rejected = by_status.get(429, []) + by_status.get(503, [])
+            check("every rejection carries Retry-After",
+                  all(int(response.headers.get("Retry-After", 0)) >= 1 for response, _ in rejected))
+            check(f"upstream concurrency stayed at {LIMIT}", calls["peak_in_flight"] <= LIMIT)
+            check("rejected requests made no upstream calls", calls["chat"] == LIMIT + QUEUE - 2)
+            print(f"upload during the burst: {upload.status_code} {upload.json()['detail']!r} "
+                  f"Retry-After {upload.headers.get('Retry-After')}")
+            check("upload yields to queued chats with 503", upload.status_code == 503 and "Retry-After" in upload.headers)
+
+            with httpx.stream("POST", f"{api_url}/chat/stream", timeout=60,
+                              json={"question": "Stream me an answer", "use_cache": False}) as response:
+                events = [line for line in response.iter_lines() if line.startswith("event:")]
+            time.sleep(0.2)
+            stats = httpx.get(f"{api_url}/admission-stats").json()
+            gate = stats["gates"]["chat:gpt-4o-mini"]
+            check("stream finished", events[-1] == "event: done")
+            check("stream gave its slot back", gate["active"] == 0 and gate["queued"] == 0)
+            print("admission stats:", gate)
+        finally:
+            api.terminate()
+            fake.terminate()
+            api.wait()
+            fake.wait()
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#Application log pipeline check (api/log_utils.py), offline against a scratch SQLite database.
+#Submits --turns chat turns from several threads through the write-behind writer and compares the
+#time spent on the request path with a synchronous insert per turn. Then checks that history reads
+#see each queued turn exactly once and skip cut-short ones, that stopping the writer flushes the
+#queue, and that retention moves old rows into daily gzip files that can be queried and restored
+#with their ids, and does not archive restored rows again straight away.
+#
+#Run: python tests/check_application_logs.py --turns 2000
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_threads(count, threads, work):
+    timings = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, count, threads):
+            start = time.perf_counter()
+            work(i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Application log pipeline check")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        run_checks(args, workdir)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_checks(args, workdir):
+    os.chdir(workdir)
+    os.environ["LOG_ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    from api.db_utils import init_db, insert_application_logs, insert_application_logs_batch, db_connection
+    from api.db_utils import get_chat_turns
+    from api import log_utils
+    from api.log_utils import with_pending_turns
+    init_db()
+
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+        failures += not ok
+
+    def count_rows(where="1", params=()):
+        with db_connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM application_logs WHERE {where}", params).fetchone()[0]
+
+    answer = "Newton's second law states that F = ma. " * 20
+    sync = run_threads(args.turns, args.threads,
+                       lambda i: insert_application_logs(f"sync-{i % 50}", f"question {i}", answer, "gpt-4o-mini"))
+
+    writer = log_utils.application_log_writer
+    writer.start()
+    queued = run_threads(args.turns, args.threads,
+                         lambda i: writer.submit(f"queued-{i % 50}", f"question {i}", answer, "gpt-4o-mini"))
+    writer.flush()
+    stats = writer.stats()
+    print(f"{'':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, timings in (("sync", sync), ("queued", queued)):
+        print(f"{label:>10} {percentile(timings, 0.5) * 1000:8.3f} {percentile(timings, 0.99) * 1000:8.3f} "
+              f"{max(timings) * 1000:8.3f}")
+    print(f"writer: {stats['written']} rows in {stats['batches']} transactions ({stats['avg_batch_rows']} per batch)")
+    check("every queued turn was written", count_rows("session_id LIKE 'queued-%'") == args.turns)
+    check("turns were written in batches", stats['batches'] < args.turns)
+
+    # A turn is visible to the next history read whether or not it has been written yet
+    seen_once = True
+    for i in range(300):
+        writer.submit("follow-up", f"turn {i}", answer, "gpt-4o-mini")
+        turns = with_pending_turns("follow-up", lambda: get_chat_turns("follow-up"))
+        seen_once &= [turn['user_query'] for turn in turns] == [f"turn {j}" for j in range(i + 1)]
+    check("history reads see each queued turn exactly once", seen_once)
+    writer.submit("follow-up", "cut short", "Newton's [aborted]", "gpt-4o-mini", complete=False)
+    queued_turns = with_pending_turns("follow-up", lambda: get_chat_turns("follow-up"))
+    writer.flush()
+    written_turns = with_pending_turns("follow-up", lambda: get_chat_turns("follow-up"))
+    check("a cut-short turn is logged but kept out of history",
+          count_rows("user_query = 'cut short' AND complete = 0") == 1
+          and len(queued_turns) == len(written_turns) == 300)
+
+    for i in range(500):
+        writer.submit("shutdown", f"question {i}", answer, "gpt-4o-mini")
+    writer.stop()
+    check("stopping the writer flushes the queue", count_rows("session_id = 'shutdown'") == 500)
+    check("a stopped writer hands turns back to the caller", not writer.submit("late", "q", "a", "gpt-4o-mini"))
+
+    # Retention: rows of three days well past the cutoff, and today's rows that must stay
+    old = datetime.now(timezone.utc) - timedelta(days=100)
+    days = [(old + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(3)]
+    insert_application_logs_batch([(f"old-{d}", f"old question {i}", answer, "gpt-4o", f"{day} 12:00:{i % 60:02d}", 1)
+                                   for d, day in enumerate(days) for i in range(400)])
+    hot_before = count_rows()
+    with db_connection() as conn:
+        old_ids = [row[0] for row in conn.execute("SELECT id FROM application_logs WHERE session_id LIKE 'old-%' ORDER BY id")]
+    started = time.perf_counter()
+    result = log_utils.archive_application_logs(retention_days=90)
+    archive_seconds = time.perf_counter() - started
+    archived_bytes = sum(archive['bytes'] for archive in log_utils.list_log_archives())
+    print(f"archived {result['archived']} rows into {len(result['days'])} files, {archived_bytes / 1024:.1f} KB "
+          f"({archived_bytes / result['archived']:.0f} bytes/row) in {archive_seconds:.2f}s")
+    check("only rows past retention were archived", result['archived'] == 1200 and count_rows() == hot_before - 1200)
+    check("one archive file per day", result['days'] == days)
+    rows = log_utils.query_archived_logs(days[1], days[1], session_id="old-1", limit=1000)
+    check("archived rows can be queried by day and session", len(rows) == 400 and rows[0]['user_query'] == "old question 0")
+    check("a second run finds nothing to archive", log_utils.archive_application_logs(retention_days=90)['archived'] == 0)
+
+    restored = log_utils.restore_archived_logs(days[0], days[-1])
+    with db_connection() as conn:
+        restored_ids = [row[0] for row in conn.execute("SELECT id FROM application_logs WHERE session_id LIKE 'old-%' ORDER BY id")]
+    check("restore brings rows back with their ids", restored['restored'] == 1200 and restored_ids == old_ids)
+    check("restored days leave the archive", log_utils.list_log_archives() == [])
+    check("retention leaves restored rows alone", log_utils.archive_application_logs(retention_days=90)['archived'] == 0
+          and count_rows("session_id LIKE 'old-%'") == 1200)
+    check("restored rows are archived again once the hold is over",
+          log_utils.archive_application_logs(retention_days=90, restore_hold_days=-1)['archived'] == 1200)
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
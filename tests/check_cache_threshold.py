@@ -0,0 +1,76 @@
+#Semantic cache threshold check (api/cache_utils.py) against the configured EMBEDDING_BACKEND.
+#Embeds pairs of questions that must share an answer (rewordings) and pairs that must not
+#(questions on the same topic with a different answer), prints their cosine similarity and
+#checks that every pair with a different answer stays below SEMANTIC_CACHE_THRESHOLD. The
+#rewordings that clear it are the hits the cache can give. Needs the real embedding model
+#(OPENAI_API_KEY, or EMBEDDING_BACKEND=local); tests/fake_openai.py has no notion of meaning.
+#
+#Run: python tests/check_cache_threshold.py [--threshold 0.98]
+import argparse
+import os
+import sys
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SAME_ANSWER = [
+    ("What is Newton's second law?", "What does Newton's second law state?"),
+    ("What is Newton's first law?", "Can you explain Newton's first law?"),
+    ("Define kinetic energy.", "What is kinetic energy?"),
+    ("How is momentum conserved in a collision?", "How is momentum conserved during a collision?"),
+    ("What is the difference between speed and velocity?", "How do speed and velocity differ?"),
+    ("What is the unit of force?", "What's the unit of force?"),
+]
+DIFFERENT_ANSWER = [
+    ("What is Newton's first law?", "What is Newton's second law?"),
+    ("What is Newton's second law?", "What is Newton's third law?"),
+    ("Define kinetic energy.", "Define potential energy."),
+    ("What is the unit of force?", "What is the unit of energy?"),
+    ("How is momentum conserved in an elastic collision?", "How is momentum conserved in an inelastic collision?"),
+    ("What is the speed of light?", "What is the speed of sound?"),
+    ("What is the acceleration due to gravity on Earth?", "What is the acceleration due to gravity on the Moon?"),
+]
+
+
+def cosine(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def main():
+    from api.cache_utils import SEMANTIC_CACHE_THRESHOLD
+    from api.chroma_utils import EMBEDDING_BACKEND, get_embedding_function
+    from api.db_utils import init_db
+
+    parser = argparse.ArgumentParser(description="Semantic cache threshold check")
+    parser.add_argument("--threshold", type=float, default=SEMANTIC_CACHE_THRESHOLD)
+    args = parser.parse_args()
+
+    init_db()  # the embedding cache tables
+    embeddings = get_embedding_function()
+    questions = sorted({question for pair in SAME_ANSWER + DIFFERENT_ANSWER for question in pair})
+    vectors = dict(zip(questions, embeddings.embed_documents(questions)))
+
+    print(f"EMBEDDING_BACKEND={EMBEDDING_BACKEND}, threshold {args.threshold}")
+    failures = 0
+    for label, pairs in (("same answer", SAME_ANSWER), ("different answer", DIFFERENT_ANSWER)):
+        print(f"\n{label}:")
+        for first, second in pairs:
+            score = cosine(vectors[first], vectors[second])
+            hit = score >= args.threshold
+            if label == "different answer" and hit:
+                failures += 1
+            print(f"  {score:.4f} {'HIT ' if hit else 'miss'} {first!r} / {second!r}")
+
+    same = [cosine(vectors[a], vectors[b]) for a, b in SAME_ANSWER]
+    different = [cosine(vectors[a], vectors[b]) for a, b in DIFFERENT_ANSWER]
+    print(f"\nhighest different-answer score {max(different):.4f}, "
+          f"{sum(score >= args.threshold for score in same)}/{len(same)} rewordings would hit")
+    print("PASS" if failures == 0 else f"FAIL ({failures} different-answer pairs would share a cached answer)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
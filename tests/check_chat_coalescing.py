@@ -0,0 +1,101 @@
+#In-flight /chat coalescing check. Starts the API against tests/fake_openai.py with a slow
+#LLM, then sends --requests concurrent /chat calls with the same first question (differing
+#only in case and whitespace, no session). They must produce one upstream chat completion,
+#identical answers, and one application_logs row per new session. A burst of distinct
+#questions is the control: one upstream call each.
+#
+#Run: python tests/check_chat_coalescing.py --latency 2 --requests 30
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+
+from bench_chat_concurrency import start_services, wait_until_up
+
+QUESTION = "What is Newton's second law?"
+
+
+async def burst(api_url, questions):
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one(question):
+            response = await client.post(f"{api_url}/chat", json={"question": question, "use_cache": False})
+            response.raise_for_status()
+            return response.json()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(question) for question in questions))
+        return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-flight /chat coalescing check")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake OpenAI latency per call (s)")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+        failures += not ok
+
+    with tempfile.TemporaryDirectory() as workdir:
+        extra_env = {"CHROMA_DIR": os.path.join(workdir, "chroma_db")}
+        fake, api = start_services(args.latency, args.fake_port, args.api_port, workdir, extra_env)
+        fake_url = f"http://127.0.0.1:{args.fake_port}"
+        api_url = f"http://127.0.0.1:{args.api_port}"
+        try:
+            wait_until_up(f"{fake_url}/stats")
+            wait_until_up(f"{api_url}/healthz")
+            while httpx.get(f"{api_url}/readyz").status_code != 200:
+                time.sleep(0.3)
+
+            httpx.post(f"{fake_url}/reset")
+            questions = [QUESTION.upper() if i % 3 == 1 else f"  {QUESTION} " if i % 3 == 2 else QUESTION
+                         for i in range(args.requests)]
+            results, wall = asyncio.run(burst(api_url, questions))
+            calls = httpx.get(f"{fake_url}/stats").json()
+            print(f"{args.requests} identical questions: {calls['chat']} chat completions, "
+                  f"{calls['embeddings']} embedding calls, wall {wall:.2f}s")
+            check("one upstream chat completion", calls["chat"] == 1)
+            check("every request got the same answer", len({r["answer"] for r in results}) == 1)
+            check(f"{args.requests - 1} requests were coalesced", sum(r["coalesced"] for r in results) == args.requests - 1)
+            sessions = {r["session_id"] for r in results}
+            check("each request got its own session", len(sessions) == args.requests)
+            with sqlite3.connect(os.path.join(workdir, "rag_app.db")) as conn:
+                logged = conn.execute(
+                    f"SELECT COUNT(DISTINCT session_id), COUNT(*) FROM application_logs "
+                    f"WHERE session_id IN ({','.join('?' * len(sessions))})", list(sessions)).fetchone()
+            check("each session was logged once", logged == (args.requests, args.requests))
+
+            httpx.post(f"{fake_url}/reset")
+            distinct = [f"{QUESTION} (variant {i})" for i in range(args.requests)]
+            results, wall = asyncio.run(burst(api_url, distinct))
+            calls = httpx.get(f"{fake_url}/stats").json()
+            print(f"{args.requests} distinct questions: {calls['chat']} chat completions, wall {wall:.2f}s")
+            check("distinct questions are not coalesced",
+                  calls["chat"] == args.requests and not any(r["coalesced"] for r in results))
+
+            print("coalescing stats:", httpx.get(f"{api_url}/cache-stats").json()["chat_coalescing"])
+        finally:
+            api.terminate()
+            fake.terminate()
+            api.wait()
+            fake.wait()
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
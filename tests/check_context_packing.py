@@ -0,0 +1,82 @@
+#Context packing check (api/context_utils.py), offline. Splits synthetic pages with the
+#ingestion text_splitter and feeds pack_context retrieval results shaped like the real ones:
+#consecutive chunks of one page (which share up to chunk_overlap characters), the same chunk
+#indexed under two file_ids, and more chunks than the token budget holds. Checks that merged
+#text equals the original page span, duplicates are dropped and the budget holds, then
+#prints the tokens retrieved vs sent for a few retrieval depths.
+#
+#Run: python tests/check_context_packing.py --budget 1000
+import argparse
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+
+from langchain_core.documents import Document
+from api.parse_utils import text_splitter
+from api.context_utils import pack_context
+from bench_suite import sentence
+
+
+def page_chunks(rng, file_id, page, sentences=60):
+    text = " ".join(sentence(rng) for _ in range(sentences))
+    page_doc = Document(page_content=text, metadata={"source": f"doc{file_id}.pdf", "page": page, "file_id": file_id})
+    return text, text_splitter.split_documents([page_doc])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context packing check")
+    parser.add_argument("--budget", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'ok  ' if ok else 'FAIL'} {label}")
+        failures += not ok
+
+    text, chunks = page_chunks(rng, 1, 0)
+    packed = pack_context(chunks[:3], budget=0)
+    merged = packed["documents"][0].page_content if len(packed["documents"]) == 1 else ""
+    check("three consecutive chunks merge into one", len(packed["documents"]) == 1)
+    check("merged text is the original span of the page", merged and merged in text and merged.startswith(chunks[0].page_content))
+    check("merge saves the overlap tokens", packed["stats"]["tokens_saved"] > 0)
+
+    reordered = pack_context([chunks[2], chunks[0], chunks[1]], budget=0)
+    check("merging does not depend on retrieval order", [d.page_content for d in reordered["documents"]] == [merged])
+
+    copy = Document(page_content=chunks[0].page_content, metadata=dict(chunks[0].metadata, file_id=2, source="copy.pdf"))
+    _, other = page_chunks(rng, 3, 4)
+    packed = pack_context([chunks[0], other[0], copy], budget=0)
+    check("a chunk indexed under another file_id is dropped", packed["stats"]["duplicates"] == 1
+          and [d.metadata["file_id"] for d in packed["documents"]] == [1, 3])
+
+    many = [page_chunks(rng, 10 + i, i)[1][0] for i in range(8)]
+    packed = pack_context(many, budget=args.budget)
+    check(f"context stays within {args.budget} tokens", packed["stats"]["context_tokens"] <= args.budget)
+    check("chunks are kept in retrieval order", packed["documents"] == many[:len(packed["documents"])])
+
+    one = pack_context(many[:1], budget=50)
+    check("a single chunk over budget is cut down, not dropped",
+          len(one["documents"]) == 1 and one["stats"]["context_tokens"] <= 50)
+
+    print(f"\n{'k':>3} {'retrieved tokens':>17} {'sent':>6} {'saved':>6} {'merged':>7} {'over budget':>12} {'chunks sent':>12}")
+    for k in (2, 4, 6, 8):
+        # Retrieval results tend to cluster: half from neighbouring chunks of one page
+        _, page = page_chunks(rng, 20 + k, 0, sentences=120)
+        docs = page[:k // 2] + [page_chunks(rng, 40 + k + i, i)[1][0] for i in range(k - k // 2)]
+        stats = pack_context(docs, budget=args.budget)["stats"]
+        print(f"{k:>3} {stats['retrieved_tokens']:>17} {stats['context_tokens']:>6} {stats['tokens_saved']:>6} "
+              f"{stats['merged']:>7} {stats['over_budget']:>12} {stats['packed_chunks']:>12}")
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
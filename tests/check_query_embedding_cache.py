@@ -0,0 +1,96 @@
+#Query embedding cache check against the local OpenAI stand-in (tests/fake_openai.py).
+#Embeds a set of questions, then repeats them (with case/whitespace changes), then asks
+#again through a fresh CachedEmbeddings instance standing in for another worker, which
+#can only hit the shared SQLite store. The repeats must make zero /v1/embeddings calls.
+#
+#Run: python tests/check_query_embedding_cache.py --latency 0.2
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+QUESTIONS = [
+    "What is Newton's second law?",
+    "How is momentum conserved in a collision?",
+    "What is the difference between speed and velocity?",
+    "Define kinetic energy.",
+    "What does the work-energy theorem say?",
+]
+
+
+def embedding_calls(stats_url):
+    return httpx.get(stats_url).json()["embeddings"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query embedding cache check")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--fake-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(REPO_ROOT, "tests", "fake_openai.py"),
+        "--port", str(args.fake_port), "--latency", str(args.latency),
+    ])
+    stats_url = f"http://127.0.0.1:{args.fake_port}/stats"
+    failures = 0
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(stats_url, timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-fake"
+            os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.fake_port}/v1"
+            from api.db_utils import init_db
+            from api.chroma_utils import get_embedding_function
+            from api.embedding_utils import CachedEmbeddings
+            init_db()
+            embedding_function = get_embedding_function()
+
+            def run(label, embed, questions):
+                before = embedding_calls(stats_url)
+                start = time.perf_counter()
+                for question in questions:
+                    embed(question)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                calls = embedding_calls(stats_url) - before
+                print(f"{label:<38} {calls:3d} embedding calls, {elapsed_ms:8.1f}ms")
+                return calls
+
+            if run("first pass", embedding_function.embed_query, QUESTIONS) != len(QUESTIONS):
+                failures += 1
+            repeats = [f"  {q.upper()} " for q in QUESTIONS]
+            if run("repeat (in-process LRU)", embedding_function.embed_query, repeats) != 0:
+                failures += 1
+            aembed = lambda q: asyncio.run(embedding_function.aembed_query(q))
+            if run("repeat via aembed_query", aembed, QUESTIONS) != 0:
+                failures += 1
+            other_worker = CachedEmbeddings(embedding_function.underlying, model_name=embedding_function.model_name)
+            if run("other worker (shared SQLite store)", other_worker.embed_query, QUESTIONS) != 0:
+                failures += 1
+
+            print("this worker:", embedding_function.query_cache.stats())
+            print("other worker:", other_worker.query_cache.stats())
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
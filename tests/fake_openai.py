@@ -0,0 +1,169 @@
+#Local stand-in for the OpenAI API used by the benchmark and load-test scripts.
+#Serves /v1/chat/completions (plain and streaming) and /v1/embeddings with
+#configurable latency, and counts upstream calls on /stats.
+#
+#Run: python tests/fake_openai.py --port 8100 --latency 0.5
+#Then point the API at it with OPENAI_API_BASE=http://127.0.0.1:8100/v1
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_ANSWER = (
+    "Newton's second law states that the net force on an object equals "
+    "its mass times its acceleration, F = ma."
+)
+
+app = FastAPI()
+app.state.latency = float(os.getenv("FAKE_OPENAI_LATENCY", "0.2"))
+app.state.token_delay = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY", "0.01"))
+app.state.embedding_dim = int(os.getenv("FAKE_OPENAI_EMBEDDING_DIM", "1536"))
+# Fraction of embedding calls answered with 429 to exercise client retries
+app.state.error_rate = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+app.state.calls = {"chat": 0, "embeddings": 0, "embedded_inputs": 0, "in_flight": 0, "peak_in_flight": 0}
+
+
+class track_in_flight:
+    # Counts concurrent upstream requests so callers can see how many were really in parallel
+    def __enter__(self):
+        calls = app.state.calls
+        calls["in_flight"] += 1
+        calls["peak_in_flight"] = max(calls["peak_in_flight"], calls["in_flight"])
+
+    def __exit__(self, *exc):
+        app.state.calls["in_flight"] -= 1
+
+
+def hash_embedding(text, dim):
+    # Deterministic unit vector derived from the text so identical inputs embed identically
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode()).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+def _prompt_tokens(messages):
+    return sum(len(str(m.get("content", ""))) // 4 for m in messages)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.calls["chat"] += 1
+    with track_in_flight():
+        await asyncio.sleep(app.state.latency)
+    created = int(time.time())
+    model = body.get("model", "gpt-4o-mini")
+    prompt_tokens = _prompt_tokens(body.get("messages", []))
+    words = CANNED_ANSWER.split(" ")
+
+    if body.get("stream"):
+        async def event_stream():
+            for i, word in enumerate(words):
+                delta = {"content": word if i == 0 else " " + word}
+                if i == 0:
+                    delta["role"] = "assistant"
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(app.state.token_delay)
+            final = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": CANNED_ANSWER},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        },
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    app.state.calls["embeddings"] += 1
+    if random.random() < app.state.error_rate:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "0.1"},
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+        )
+    app.state.calls["embedded_inputs"] += len(inputs)
+    with track_in_flight():
+        await asyncio.sleep(app.state.latency)
+    data = [
+        {"object": "embedding", "index": i, "embedding": hash_embedding(str(item), app.state.embedding_dim)}
+        for i, item in enumerate(inputs)
+    ]
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
+
+
+@app.get("/stats")
+def stats():
+    return app.state.calls
+
+
+@app.post("/reset")
+def reset():
+    app.state.calls = {key: 0 for key in app.state.calls}
+    return app.state.calls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=app.state.latency,
+                        help="Seconds to wait before answering each request")
+    parser.add_argument("--token-delay", type=float, default=app.state.token_delay,
+                        help="Seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=app.state.error_rate,
+                        help="Fraction of embedding calls rejected with 429")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.token_delay = args.token_delay
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
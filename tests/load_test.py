@@ -0,0 +1,250 @@
+#HTTP load test for api.main:app with the OpenAI calls going to tests/fake_openai.py.
+#Virtual users run a weighted mix of /chat (with and without a session_id), /list-docs,
+#/upload-doc (+ /jobs polling) and /delete-doc. Concurrency ramps through --levels; each
+#level runs for --duration seconds and reports throughput and latency percentiles per
+#endpoint. The saturation point is the last level before throughput stops growing by
+#--min-gain or /chat p99 exceeds --max-chat-p99 seconds. Upstream calls per level are read
+#from the fake server's /stats (--fake-url when targeting running services).
+#
+#Run: python tests/load_test.py --latency 0.5 --levels 1 5 10 25 50 100 --duration 20
+#     python tests/load_test.py --api-url http://127.0.0.1:8000 --fake-url http://127.0.0.1:8100
+#     (the second form targets services that are already running)
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+
+from bench_chat_concurrency import start_services, wait_until_up
+from bench_parsing import make_pdf
+
+DEFAULT_MIX = {"chat_session": 35, "chat_new": 35, "list_docs": 20, "upload": 5, "delete": 5}
+TOPICS = ["Newton's second law", "momentum", "kinetic energy", "friction", "projectile motion",
+          "circular motion", "work and power", "Ohm's law", "wave speed", "lenses"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, endpoint, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[endpoint])
+            entry = {"requests": len(latencies), "errors": self.errors[endpoint],
+                     "throughput_rps": round(len(latencies) / elapsed, 2)}
+            if latencies:
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                    entry[f"{name}_s"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 4)
+            endpoints[endpoint] = entry
+        total = sum(len(v) for v in self.latencies.values())
+        return {"throughput_rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+
+class Workload:
+    """Shared state across virtual users: the PDF template and docs this run uploaded."""
+
+    def __init__(self, client, api_url, pdf_bytes, use_cache, mix):
+        self.client = client
+        self.api_url = api_url
+        self.pdf_bytes = pdf_bytes
+        self.use_cache = use_cache
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.uploads = []  # (file_id, job_id)
+        self.upload_counter = 0
+
+    def question(self, rng):
+        return f"Explain {rng.choice(TOPICS)} with an example (variant {rng.randrange(10_000)})."
+
+    async def chat(self, recorder, rng, session_id):
+        payload = {"question": self.question(rng), "use_cache": self.use_cache}
+        if session_id:
+            payload["session_id"] = session_id
+        endpoint = "chat (session)" if session_id else "chat (new)"
+        await recorder.call(endpoint, self.client.post(f"{self.api_url}/chat", json=payload))
+
+    async def upload(self, recorder):
+        self.upload_counter += 1
+        # Unique trailing bytes so the content-hash dedupe does not short-circuit the upload
+        content = self.pdf_bytes + f"\n%load-test {time.time_ns()} {self.upload_counter}\n".encode()
+        files = {"file": (f"load_test_{self.upload_counter}.pdf", content, "application/pdf")}
+        response = await recorder.call("upload-doc", self.client.post(f"{self.api_url}/upload-doc", files=files))
+        if response is not None and response.json().get("job_id"):
+            self.uploads.append((response.json()["file_id"], response.json()["job_id"]))
+
+    async def delete(self, recorder):
+        # Only delete a document whose indexing job has finished
+        for upload in list(self.uploads):
+            file_id, job_id = upload
+            response = await recorder.call("jobs", self.client.get(f"{self.api_url}/jobs/{job_id}"))
+            if response is not None and response.json()["state"] in ("completed", "failed"):
+                if upload not in self.uploads:
+                    continue  # another user took it while we waited
+                self.uploads.remove(upload)
+                await recorder.call("delete-doc", self.client.post(f"{self.api_url}/delete-doc",
+                                                                   json={"file_id": file_id}))
+                return
+        await recorder.call("list-docs", self.client.get(f"{self.api_url}/list-docs"))
+
+    async def user(self, user_id, recorder, deadline):
+        rng = random.Random(user_id)
+        session_id = f"load-test-{user_id}-{time.time_ns()}"
+        while time.perf_counter() < deadline:
+            operation = rng.choices(self.operations, self.weights)[0]
+            if operation == "chat_session":
+                await self.chat(recorder, rng, session_id)
+            elif operation == "chat_new":
+                await self.chat(recorder, rng, None)
+            elif operation == "list_docs":
+                await recorder.call("list-docs", self.client.get(f"{self.api_url}/list-docs"))
+            elif operation == "upload":
+                await self.upload(recorder)
+            elif operation == "delete":
+                await self.delete(recorder)
+
+
+async def run_levels(args, api_url, fake_url=None):
+    with tempfile.TemporaryDirectory() as pdf_dir:
+        pdf_path = os.path.join(pdf_dir, "load_test.pdf")
+        make_pdf(pdf_path, args.upload_pages)
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+
+    limits = httpx.Limits(max_connections=max(args.levels) + 10)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        mix = dict(DEFAULT_MIX)
+        if args.mix:
+            mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix)}
+        workload = Workload(client, api_url, pdf_bytes, args.use_cache, mix)
+
+        # Seed one document so retrieval has something to search
+        warmup = Recorder()
+        await workload.upload(warmup)
+        await workload.chat(warmup, random.Random(0), None)
+
+        levels = []
+        for concurrency in args.levels:
+            recorder = Recorder()
+            if fake_url:
+                await client.post(f"{fake_url}/reset")
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(workload.user(i, recorder, deadline) for i in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            summary = recorder.summary(elapsed)
+            summary["concurrency"] = concurrency
+            if fake_url:
+                calls = (await client.get(f"{fake_url}/stats")).json()
+                summary["upstream"] = {key: calls[key] for key in ("chat", "embeddings", "peak_in_flight")}
+            levels.append(summary)
+
+            print(f"\nconcurrency={concurrency:4d}  total throughput={summary['throughput_rps']:7.2f} req/s")
+            for endpoint, entry in summary["endpoints"].items():
+                timing = (f"p50={entry['p50_s']:.3f}s p90={entry['p90_s']:.3f}s p99={entry['p99_s']:.3f}s"
+                          if "p50_s" in entry else "")
+                print(f"  {endpoint:<15} {entry['requests']:6d} ok {entry['errors']:4d} err  "
+                      f"{entry['throughput_rps']:7.2f} req/s  {timing}")
+            if fake_url:
+                upstream = summary["upstream"]
+                print(f"  upstream: {upstream['chat']} chat completions, {upstream['embeddings']} embedding calls, "
+                      f"peak {upstream['peak_in_flight']} in flight")
+        return levels
+
+
+def chat_p99(level):
+    values = [entry["p99_s"] for name, entry in level["endpoints"].items() if name.startswith("chat") and "p99_s" in entry]
+    return max(values) if values else None
+
+
+def find_saturation(levels, min_gain, max_chat_p99):
+    """Return (index of the saturation level, reason), or (None, None) if the ramp never saturated."""
+    for i in range(1, len(levels)):
+        previous, current = levels[i - 1], levels[i]
+        p99 = chat_p99(current)
+        if p99 is not None and p99 > max_chat_p99:
+            return i - 1, f"/chat p99 {p99:.2f}s > {max_chat_p99}s at concurrency {current['concurrency']}"
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 + min_gain):
+            return i - 1, (f"throughput grew less than {min_gain:.0%} from concurrency "
+                           f"{previous['concurrency']} to {current['concurrency']}")
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the FastAPI service")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency per call (s)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--mix", nargs="+", help="operation weights, e.g. chat_session=50 chat_new=30 list_docs=20")
+    parser.add_argument("--use-cache", action="store_true", help="let /chat use the semantic answer cache")
+    parser.add_argument("--upload-pages", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--min-gain", type=float, default=0.1)
+    parser.add_argument("--max-chat-p99", type=float, default=10.0)
+    parser.add_argument("--api-url", help="target a running API instead of starting one")
+    parser.add_argument("--fake-url", help="fake OpenAI server used by --api-url, for upstream call counts")
+    parser.add_argument("--fake-port", type=int, default=8100)
+    parser.add_argument("--api-port", type=int, default=8001)
+    parser.add_argument("--output", help="write the per-level results as JSON")
+    args = parser.parse_args()
+
+    if args.api_url:
+        wait_until_up(f"{args.api_url}/docs")
+        levels = asyncio.run(run_levels(args, args.api_url, args.fake_url))
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            extra_env = {"CHROMA_DIR": os.path.join(workdir, "chroma_db")}
+            fake, api = start_services(args.latency, args.fake_port, args.api_port, workdir, extra_env)
+            try:
+                api_url = f"http://127.0.0.1:{args.api_port}"
+                wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats")
+                wait_until_up(f"{api_url}/docs")
+                levels = asyncio.run(run_levels(args, api_url, f"http://127.0.0.1:{args.fake_port}"))
+            finally:
+                api.terminate()
+                fake.terminate()
+                api.wait()
+                fake.wait()
+
+    index, reason = find_saturation(levels, args.min_gain, args.max_chat_p99)
+    if index is None:
+        print(f"\nNo saturation up to concurrency {levels[-1]['concurrency']} "
+              f"({levels[-1]['throughput_rps']:.2f} req/s)")
+    else:
+        print(f"\nSaturation point: concurrency {levels[index]['concurrency']} "
+              f"({levels[index]['throughput_rps']:.2f} req/s); {reason}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "config": {key: value for key, value in vars(args).items() if key != "output"},
+                "levels": levels,
+                "saturation_concurrency": levels[index]["concurrency"] if index is not None else None,
+                "saturation_reason": reason,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()